@@ -0,0 +1,95 @@
+"""
+Benchmark de l'index IVF : rappel@k face à la recherche exacte et latence
+p50/p99 par requête, sur des vecteurs synthétiques en mémoire mappée
+
+    python benchmarks/bench_ann.py --tailles 100000,1000000,5000000 --dimension 128
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.rag.ann import IVFIndex, recherche_exacte
+
+
+def make_matrice(chemin, nombre, dimension, groupes=1000, taille_bloc=100000, graine=0):
+    """Écrit `nombre` vecteurs normalisés, regroupés autour de `groupes` centres"""
+    aleatoire = np.random.default_rng(graine)
+    centres = aleatoire.normal(size=(groupes, dimension)).astype(np.float32)
+    matrice = np.lib.format.open_memmap(chemin, mode='w+', dtype=np.float32, shape=(nombre, dimension))
+    for debut in range(0, nombre, taille_bloc):
+        taille = min(taille_bloc, nombre - debut)
+        bloc = centres[aleatoire.integers(groupes, size=taille)]
+        bloc += 0.5 * aleatoire.normal(size=(taille, dimension)).astype(np.float32)
+        matrice[debut:debut + taille] = bloc / np.linalg.norm(bloc, axis=1, keepdims=True)
+    matrice.flush()
+    return np.load(chemin, mmap_mode='r')
+
+
+def mesurer(recherche, requetes):
+    """Résultats et latences (ms) de chaque requête"""
+    resultats, latences = [], []
+    for requete in requetes:
+        debut = time.perf_counter()
+        resultats.append(recherche(requete)[0])
+        latences.append((time.perf_counter() - debut) * 1000)
+    return resultats, np.array(latences)
+
+
+def afficher(nom, latences, rappel=None):
+    rappel = f"{rappel:>9.3f}" if rappel is not None else f"{'-':>9}"
+    print(f"{nom:<28} {rappel} {np.percentile(latences, 50):>10.2f} {np.percentile(latences, 99):>10.2f}")
+
+
+def run(tailles=(100000, 1000000, 5000000), dimension=128, k=10, nprobes=(1, 4, 16, 64), requetes=200):
+    resultats = {}
+    for taille in tailles:
+        with tempfile.TemporaryDirectory() as dossier:
+            matrice = make_matrice(Path(dossier) / 'vecteurs.npy', taille, dimension)
+            questions = np.asarray(matrice[np.random.default_rng(1).choice(taille, requetes)])
+            questions += 0.1 * np.random.default_rng(2).normal(size=questions.shape).astype(np.float32)
+            questions /= np.linalg.norm(questions, axis=1, keepdims=True)
+
+            debut = time.perf_counter()
+            index = IVFIndex(dossier)
+            index.entrainer(matrice)
+            construction = time.perf_counter() - debut
+
+            print(f"\n{taille:,} vecteurs de dimension {dimension} "
+                  f"({len(index.centroides)} listes, construction {construction:.1f}s)")
+            print(f"{'Méthode':<28} {'rappel@' + str(k):>9} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+            exacts, latences = mesurer(lambda q: recherche_exacte(matrice, q, k), questions)
+            afficher("Exacte", latences)
+            resultats[taille] = {'exacte': {'p50_ms': np.percentile(latences, 50), 'p99_ms': np.percentile(latences, 99)}}
+
+            for nprobe in nprobes:
+                approches, latences = mesurer(lambda q: index.rechercher(matrice, q, k, nprobe=nprobe), questions)
+                rappel = np.mean([len(set(a) & set(e)) / k for a, e in zip(approches, exacts)])
+                afficher(f"IVF nprobe={nprobe}", latences, rappel)
+                resultats[taille][f"ivf_nprobe_{nprobe}"] = {
+                    'rappel': rappel,
+                    'p50_ms': np.percentile(latences, 50),
+                    'p99_ms': np.percentile(latences, 99)
+                }
+            del matrice
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tailles', default='100000,1000000,5000000')
+    parser.add_argument('--dimension', type=int, default=128)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', default='1,4,16,64')
+    parser.add_argument('--requetes', type=int, default=200)
+    args = parser.parse_args()
+    run(
+        [int(t) for t in args.tailles.split(',')], args.dimension, args.k,
+        [int(n) for n in args.nprobe.split(',')], args.requetes
+    )
@@ -0,0 +1,53 @@
+"""
+Débit du nettoyage des métadonnées HAL : chemin d'origine (regex et
+strptime à chaque appel), clean_metadata actuel et clean_many par lot
+
+    python benchmarks/bench_cleaner.py --nombre 100000
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'tests'))
+
+from src.utils.data_cleaner import DataCleaner
+from test_data_cleaner import make_records, nettoyage_reference
+
+
+def mesurer(nom, nettoyer, records):
+    debut = time.perf_counter()
+    resultats = nettoyer(records)
+    debit = len(records) / (time.perf_counter() - debut)
+    print(f"{nom:<28} {debit:>12,.0f} docs/s")
+    return resultats, debit
+
+
+def run(nombre=50000):
+    cleaner = DataCleaner()
+    # Les dates non reconnues du jeu de test ne doivent pas noyer la mesure sous les avertissements
+    logging.getLogger('src.utils.data_cleaner').setLevel(logging.ERROR)
+    records = make_records(nombre)
+    print(f"{nombre:,} enregistrements")
+    attendus, reference = mesurer("Nettoyage d'origine", lambda lot: [nettoyage_reference(r) for r in lot], records)
+    unitaires, unitaire = mesurer("clean_metadata", lambda lot: [cleaner.clean_metadata(r) for r in lot], records)
+    lot, par_lot = mesurer("clean_many", lambda lot: list(cleaner.clean_many(lot)), records)
+    if not attendus == unitaires == lot:
+        raise AssertionError("Résultats différents du nettoyage d'origine")
+    print(f"Accélération clean_many : x{par_lot / reference:.1f}")
+    return {
+        'reference_docs_par_seconde': reference,
+        'clean_metadata_docs_par_seconde': unitaire,
+        'clean_many_docs_par_seconde': par_lot,
+        'acceleration': par_lot / reference
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nombre', type=int, default=50000)
+    args = parser.parse_args()
+    run(args.nombre)
@@ -0,0 +1,61 @@
+"""
+Benchmark de la préparation du contexte : tokens économisés par requête et
+coût de la fusion/dédoublonnage, sur des recherches simulées de 5 chunks
+de 1000 caractères recouverts de 100
+
+    python benchmarks/bench_context.py --requetes 1000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.rag.context import ContextPacker
+from bench_database import VOCABULAIRE
+
+
+def make_pages(nombre, aleatoire):
+    return [' '.join(aleatoire.choice(VOCABULAIRE, 600)) for _ in range(nombre)]
+
+
+def chunks_page(page, source, numero, taille=1000, chevauchement=100):
+    return [
+        (page[debut:debut + taille], {'source': source, 'page': numero, 'start_index': debut})
+        for debut in range(0, len(page) - chevauchement, taille - chevauchement)
+    ]
+
+
+def run(requetes=1000, k=5, budget=2000):
+    aleatoire = np.random.default_rng(0)
+    pages = make_pages(200, aleatoire)
+    index = [chunk for numero, page in enumerate(pages) for chunk in chunks_page(page, f"{numero}.pdf", 0)]
+    packer = ContextPacker(budget=budget)
+    latences = []
+    for _ in range(requetes):
+        # Les chunks voisins d'un passage pertinent ressortent souvent ensemble
+        centre = int(aleatoire.integers(len(index) - 2))
+        trouves = index[centre:centre + 2] + [index[i] for i in aleatoire.choice(len(index), k - 2)]
+        aleatoire.shuffle(trouves)
+        debut = time.perf_counter()
+        packer.emballer(trouves)
+        latences.append((time.perf_counter() - debut) * 1000)
+    statistiques = packer.statistiques()
+    print(f"{requetes} requêtes de {k} chunks, budget {budget} tokens")
+    print(f"Tokens par prompt : {statistiques['tokens_avant'] / requetes:.0f} -> "
+          f"{statistiques['tokens_apres'] / requetes:.0f} ({statistiques['taux_economie']:.1%} économisés)")
+    print(f"Préparation : p50 {np.percentile(latences, 50):.2f} ms, p99 {np.percentile(latences, 99):.2f} ms")
+    return {**statistiques, 'p50_ms': float(np.percentile(latences, 50))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requetes', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--budget', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.requetes, args.k, args.budget)
@@ -0,0 +1,134 @@
+"""
+Benchmark de DatabaseManager : lignes/s en écriture (connexion par document
+contre connexion persistante et lots) et latence de recherche (LIKE contre FTS5)
+
+    python benchmarks/bench_database.py --documents 20000
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.database.manager import DatabaseManager
+
+
+VOCABULAIRE = [
+    'apprentissage', 'réseaux', 'neurones', 'données', 'graphes', 'compilation',
+    'optimisation', 'robotique', 'vision', 'langage', 'sécurité', 'systèmes',
+    'distribués', 'calcul', 'quantique', 'logique', 'images', 'signal'
+]
+
+
+def make_documents(nombre):
+    aleatoire = random.Random(0)
+    return [
+        {
+            'doc_id': str(i),
+            'titre': ' '.join(aleatoire.sample(VOCABULAIRE, 4)) + f" {i}",
+            'auteurs': f"Auteur {i}",
+            'resume': "Résumé " * 50,
+            'date_publication': '2024-01-15',
+            'uri': f"https://hal.science/hal-{i}",
+            'chemin_local': f"/downloads/{i}.pdf",
+        }
+        for i in range(nombre)
+    ]
+
+
+def ajout_historique(db_path, document):
+    """Ancien comportement : une connexion et un commit par document"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO documents
+            (doc_id, titre, auteurs, resume, date_publication, uri, chemin_local, statut)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            document['doc_id'], document['titre'], document['auteurs'], document['resume'],
+            document['date_publication'], document['uri'], document['chemin_local'], 'nouveau'
+        ))
+        conn.commit()
+    conn.close()
+
+
+def recherche_historique(db_path, titre):
+    """Ancienne recherche : LIKE sur toute la table"""
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT * FROM documents WHERE titre LIKE ?", (f"%{titre}%",)
+        ).fetchall()
+
+
+def mesurer_recherche(nom, fonction, repetitions=50):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        fonction()
+    duree = (time.perf_counter() - debut) / repetitions * 1000
+    print(f"{nom:<40} {duree:>12.2f} ms/requête")
+    return duree
+
+
+def mesurer(nom, fonction, nombre):
+    debut = time.perf_counter()
+    fonction()
+    duree = time.perf_counter() - debut
+    print(f"{nom:<40} {nombre / duree:>12,.0f} lignes/s  ({duree:.2f}s)")
+    return nombre / duree
+
+
+def run(nombre_documents=20000, taille_lot=500):
+    documents = make_documents(nombre_documents)
+    resultats = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        # Base créée puis repassée en mode journal classique pour l'ancien chemin
+        historique = Path(dossier) / 'historique.db'
+        DatabaseManager(historique).close()
+        with sqlite3.connect(historique) as conn:
+            conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+        resultats['connexion_par_document'] = mesurer(
+            "Connexion + commit par document",
+            lambda: [ajout_historique(historique, d) for d in documents], nombre_documents
+        )
+
+        db = DatabaseManager(Path(dossier) / 'unitaire.db')
+        resultats['connexion_persistante'] = mesurer(
+            "Connexion persistante WAL, par document",
+            lambda: [db.ajouter_documents([d]) for d in documents], nombre_documents
+        )
+        db.close()
+
+        db = DatabaseManager(Path(dossier) / 'lots.db')
+        resultats['lots'] = mesurer(
+            f"Connexion persistante WAL, lots de {taille_lot}",
+            lambda: [db.ajouter_documents(documents[i:i + taille_lot])
+                     for i in range(0, nombre_documents, taille_lot)],
+            nombre_documents
+        )
+        # Recherche sélective (un titre précis) dans tout le catalogue
+        titre = str(nombre_documents - 1)
+        resultats['recherche_like_ms'] = mesurer_recherche(
+            f"Recherche LIKE '%{titre}%'",
+            lambda: recherche_historique(db.db_path, titre)
+        )
+        resultats['recherche_fts_ms'] = mesurer_recherche(
+            f"Recherche FTS5 BM25 '{titre}'",
+            lambda: db.rechercher_documents({'titre': titre, 'limite': 20})
+        )
+        db.close()
+
+    print(f"Accélération : x{resultats['lots'] / resultats['connexion_par_document']:.0f}")
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--lot', type=int, default=500)
+    args = parser.parse_args()
+    run(args.documents, args.lot)
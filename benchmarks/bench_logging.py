@@ -0,0 +1,88 @@
+"""
+Coût du logging sur une ingestion simulée : trois messages INFO par
+document, écrits directement (console + fichier, comme avant) ou via la
+file et le thread d'écriture avec limite de débit
+
+    python benchmarks/bench_logging.py --documents 10000 --workers 1,8,32
+"""
+
+import argparse
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueListener
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.utils.logger import JsonFormatter, NonBlockingQueueHandler, RateLimitFilter
+
+
+def ingestion(logger, documents, workers):
+    """Messages d'un téléchargement : traitement, succès, lot écrit"""
+    def traiter(i):
+        logger.info(f"Traitement du document {i}")
+        logger.info(f"Document {i} téléchargé avec succès")
+        if i % 500 == 0:
+            logger.info(f"{500} documents ajoutés/mis à jour")
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(traiter, range(documents)))
+    return time.perf_counter() - debut
+
+
+def make_logger(nom, handlers):
+    logger = logging.getLogger(nom)
+    logger.handlers = handlers
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def run(documents=10000, workers=(1, 8, 32)):
+    resultats = {}
+    format_texte = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    with tempfile.TemporaryDirectory() as dossier, open(os.devnull, 'w') as console:
+        print(f"{documents:,} documents, 3 messages INFO par document (console vers /dev/null)")
+        print(f"{'Workers':>8} {'direct (s)':>12} {'file (s)':>10} {'aucun log (s)':>14} {'surcoût file':>13}")
+        for nombre in workers:
+            sorties = [logging.StreamHandler(console), logging.FileHandler(Path(dossier) / f"direct_{nombre}.log")]
+            for handler in sorties:
+                handler.setFormatter(format_texte)
+            direct = ingestion(make_logger(f"direct{nombre}", sorties), documents, nombre)
+            for handler in sorties:
+                handler.close()
+
+            file = queue.Queue(maxsize=10000)
+            handler = NonBlockingQueueHandler(file)
+            handler.addFilter(RateLimitFilter())
+            sorties = [logging.StreamHandler(console), logging.FileHandler(Path(dossier) / f"file_{nombre}.log")]
+            sorties[0].setFormatter(format_texte)
+            sorties[1].setFormatter(JsonFormatter())
+            listener = QueueListener(file, *sorties, respect_handler_level=True)
+            listener.start()
+            en_file = ingestion(make_logger(f"file{nombre}", [handler]), documents, nombre)
+            listener.stop()
+            for sortie in sorties:
+                sortie.close()
+
+            temoin = ingestion(make_logger(f"temoin{nombre}", [logging.NullHandler()]), documents, nombre)
+            surcout = max(0.0, en_file - temoin)
+            print(f"{nombre:>8} {direct:>12.3f} {en_file:>10.3f} {temoin:>14.3f} {surcout:>12.3f}s")
+            resultats[f"workers_{nombre}"] = {
+                'direct_s': direct, 'file_s': en_file, 'temoin_s': temoin, 'abandonnes': handler.abandonnes
+            }
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--workers', default='1,8,32')
+    args = parser.parse_args()
+    run(args.documents, [int(n) for n in args.workers.split(',')])
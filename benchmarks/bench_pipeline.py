@@ -0,0 +1,262 @@
+"""
+Benchmark de bout en bout, entièrement hors ligne : moissonnage HAL contre
+un serveur local, nettoyage, base de données, extraction, découpage,
+indexation puis latence des questions avec embeddings et LLM bouchons
+
+    python benchmarks/bench_pipeline.py --documents 200 --pages 5 --sortie pipeline.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'tests'))
+
+from fake_hal import FakeHALServer, make_hal_doc, make_pdf
+from src.database.blob_store import BlobStore
+from src.database.manager import DatabaseManager
+from src.hal.downloader import HALDownloader
+from src.rag.answer_cache import AnswerCache
+from src.rag.context import ContextPacker
+from src.rag.embeddings import HashingEmbeddings
+from src.config import PAGE_TEXT_DIRNAME
+from src.rag.extraction import PageTextStore, iter_pages
+from src.rag.indexer import IncrementalIndexer
+from src.rag.vector_store import NumpyVectorStore
+from src.utils.data_cleaner import DataCleaner
+from bench_database import VOCABULAIRE, make_documents
+
+
+class Morceau:
+    def __init__(self, content):
+        self.content = content
+
+
+class LLMBouchon:
+    """Remplace ChatOpenAI : répond quelques tokens sans appel réseau"""
+
+    def __init__(self, tokens=20):
+        self.tokens = tokens
+
+    def stream(self, prompt):
+        for i in range(self.tokens):
+            yield Morceau(f"mot{i} ")
+
+    def invoke(self, prompt):
+        return Morceau(''.join(morceau.content for morceau in self.stream(prompt)))
+
+
+def make_corpus(serveur, documents, pages, mots, graine=0):
+    """Ajoute au serveur HAL local `documents` PDFs synthétiques de `pages` pages de `mots` mots"""
+    aleatoire = random.Random(graine)
+    octets = 0
+    for i in range(1, documents + 1):
+        pdf = make_pdf([
+            ' '.join(aleatoire.choices(VOCABULAIRE, k=mots)) + f" document {i} page {p}."
+            for p in range(pages)
+        ])
+        serveur.add_document(make_hal_doc(i, serveur.base_url), pdf)
+        octets += len(pdf)
+    return octets
+
+
+def decouper_fenetres(pages, taille=1000, chevauchement=100):
+    """Découpage de secours sans LangChain : fenêtres de caractères qui se recouvrent"""
+    return [
+        (texte[debut:debut + taille], {**metadata, 'start_index': debut})
+        for texte, metadata in pages
+        for debut in range(0, max(1, len(texte) - chevauchement), taille - chevauchement)
+    ]
+
+
+def decoupeur():
+    """Découpage de RAGSystem (LangChain) s'il est installé, sinon None"""
+    try:
+        from langchain.docstore.document import Document
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        return None
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=100, length_function=len, add_start_index=True,
+        separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+    )
+
+    def decouper(pages):
+        documents = [Document(page_content=texte, metadata=metadata) for texte, metadata in pages]
+        return [(doc.page_content, doc.metadata) for doc in splitter.split_documents(documents)]
+    return decouper
+
+
+def percentiles(latences):
+    return {'p50_ms': float(np.percentile(latences, 50)), 'p99_ms': float(np.percentile(latences, 99))}
+
+
+def afficher(nom, valeur, unite):
+    print(f"{nom:<34} {valeur:>12,.1f} {unite}")
+
+
+def mesurer_telechargement(serveur, dossier, documents):
+    db = DatabaseManager(Path(dossier) / 'hal.db')
+    downloader = HALDownloader(db, api_url=serveur.search_url, downloads_dir=Path(dossier) / 'downloads',
+                               cursor_file=Path(dossier) / 'cursor.json')
+    stats = downloader.download_documents(limit=documents, resume=False)
+    db.close()
+    afficher("Téléchargement HAL", stats['docs_par_seconde'], "docs/s")
+    return {'docs_par_seconde': stats['docs_par_seconde'], 'mo_par_seconde': stats['mo_par_seconde'],
+            'documents': stats['documents'], 'echecs': stats['echecs']}
+
+
+def mesurer_nettoyage(nombre):
+    cleaner = DataCleaner()
+    metadonnees = [
+        {**document, 'mots_cles': "apprentissage,\tvision ", 'date_soumission': '2024/01/16', 'langue': 'French'}
+        for document in make_documents(nombre)
+    ]
+    debut = time.perf_counter()
+    for metadata in metadonnees:
+        cleaner.clean_metadata(metadata)
+    debit = nombre / (time.perf_counter() - debut)
+    afficher("DataCleaner.clean_metadata", debit, "docs/s")
+    return {'docs_par_seconde': debit}
+
+
+def mesurer_base(dossier, nombre, requetes=200):
+    db = DatabaseManager(Path(dossier) / 'bench.db')
+    documents = make_documents(nombre)
+    debut = time.perf_counter()
+    for i in range(0, nombre, 500):
+        db.ajouter_documents(documents[i:i + 500])
+    debit = nombre / (time.perf_counter() - debut)
+    latences = []
+    for i in range(requetes):
+        debut = time.perf_counter()
+        db.rechercher_documents({'texte': VOCABULAIRE[i % len(VOCABULAIRE)], 'limite': 20})
+        latences.append((time.perf_counter() - debut) * 1000)
+    db.close()
+    afficher("DatabaseManager.ajouter_documents", debit, "docs/s")
+    afficher("DatabaseManager.rechercher p50", np.percentile(latences, 50), "ms")
+    return {'docs_par_seconde': debit, **percentiles(latences)}
+
+
+def mesurer_extraction(chemins):
+    debut = time.perf_counter()
+    pages = list(iter_pages(chemins))
+    duree = time.perf_counter() - debut
+    afficher("Extraction du texte", len(pages) / duree, "pages/s")
+    return pages, {'pages_par_seconde': len(pages) / duree, 'pages': len(pages)}
+
+
+def mesurer_decoupage(pages, decouper):
+    debut = time.perf_counter()
+    chunks = decouper(pages)
+    duree = time.perf_counter() - debut
+    afficher("Découpage en chunks", len(pages) / duree, "pages/s")
+    return {'pages_par_seconde': len(pages) / duree, 'chunks': len(chunks)}
+
+
+def mesurer_indexation(dossier, chemins, embeddings, decouper, page_store=None, nom='index'):
+    """Indexation complète, PDFs réanalysés ou textes lus dans `page_store`"""
+    indexer = IncrementalIndexer(Path(dossier) / nom / 'manifest.json', page_store)
+    store = NumpyVectorStore(Path(dossier) / nom, embeddings)
+    debut = time.perf_counter()
+    resultat = indexer.appliquer(indexer.planifier(chemins), store, decouper)
+    store.persist()
+    duree = time.perf_counter() - debut
+    source = "textes du téléchargement" if page_store else "extraction comprise"
+    afficher(f"Indexation ({source})", resultat['chunks_ajoutes'] / duree, "chunks/s")
+    return store, {'chunks_par_seconde': resultat['chunks_ajoutes'] / duree, 'chunks': resultat['chunks_ajoutes'],
+                   'duree_s': duree}
+
+
+def mesurer_recherche(store, embeddings, questions):
+    """Recherche MMR puis préparation du contexte, sans LangChain"""
+    packer = ContextPacker()
+    latences = []
+    for question in questions:
+        debut = time.perf_counter()
+        chunks = store.rechercher_lot([embeddings.embed_query(question)], k=5, fetch_k=20, lambda_mult=0.7)[0]
+        packer.emballer(chunks)
+        latences.append((time.perf_counter() - debut) * 1000)
+    afficher("Recherche + contexte p50", np.percentile(latences, 50), "ms")
+    return percentiles(latences)
+
+
+def mesurer_questions(dossier, pdfs, questions):
+    """RAGSystem.query de bout en bout avec le LLM bouchon ; None sans LangChain"""
+    from src.rag.system import RAGSystem
+
+    rag = RAGSystem(pdf_directory=pdfs, persist_directory=Path(dossier) / 'rag', embedding_backend='hashing')
+    rag._llm = LLMBouchon()
+    rag.answer_cache = AnswerCache(taille=0, taille_semantique=0)  # Chaque question va jusqu'au LLM
+    try:
+        rag.process_documents()
+        rag.setup_qa_chain()
+    except ImportError as e:
+        print(f"RAGSystem.query ignoré : {e}")
+        return None
+    latences = []
+    for question in questions:
+        debut = time.perf_counter()
+        rag.query(question)
+        latences.append((time.perf_counter() - debut) * 1000)
+    afficher("RAGSystem.query p50", np.percentile(latences, 50), "ms")
+    afficher("RAGSystem.query p99", np.percentile(latences, 99), "ms")
+    return percentiles(latences)
+
+
+def run(documents=200, pages=5, mots=300, requetes=200, lignes=20000):
+    aleatoire = random.Random(1)
+    questions = [' '.join(aleatoire.choices(VOCABULAIRE, k=6)) + f" {i}" for i in range(requetes)]
+    embeddings = HashingEmbeddings()
+    decouper = decoupeur()
+    resultats = {'parametres': {'documents': documents, 'pages': pages, 'mots': mots, 'requetes': requetes}}
+    with tempfile.TemporaryDirectory() as dossier, FakeHALServer(nombre_documents=0) as serveur:
+        octets = make_corpus(serveur, documents, pages, mots)
+        print(f"Corpus : {documents} PDFs de {pages} pages, {octets / 2**20:.1f} Mo")
+
+        resultats['telechargement'] = mesurer_telechargement(serveur, dossier, documents)
+        resultats['nettoyage'] = mesurer_nettoyage(lignes)
+        resultats['base'] = mesurer_base(dossier, lignes)
+
+        pdfs = Path(dossier) / 'downloads'
+        blobs = BlobStore(pdfs)
+        chemins = sorted(blobs.fichiers())
+        blobs.close()
+        pages_extraites, resultats['extraction'] = mesurer_extraction(chemins)
+        if decouper is None:
+            print("LangChain absent : découpage par fenêtres de caractères")
+            decouper = decouper_fenetres
+            resultats['decoupage'] = dict(mesurer_decoupage(pages_extraites, decouper), langchain=False)
+        else:
+            resultats['decoupage'] = dict(mesurer_decoupage(pages_extraites, decouper), langchain=True)
+        store, resultats['indexation'] = mesurer_indexation(dossier, chemins, embeddings, decouper)
+        textes = PageTextStore(pdfs / PAGE_TEXT_DIRNAME)
+        store_textes, resultats['indexation_textes'] = mesurer_indexation(
+            dossier, chemins, embeddings, decouper, textes, nom='index_textes')
+        store_textes.close()
+        resultats['recherche'] = mesurer_recherche(store, embeddings, questions)
+        store.close()
+        resultats['query'] = mesurer_questions(dossier, pdfs, questions)
+    embeddings.close()
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--mots', type=int, default=300, help="Mots par page")
+    parser.add_argument('--requetes', type=int, default=200)
+    parser.add_argument('--lignes', type=int, default=20000, help="Documents pour le nettoyage et la base")
+    parser.add_argument('--sortie', help="Fichier JSON des résultats")
+    args = parser.parse_args()
+    resultats = run(args.documents, args.pages, args.mots, args.requetes, args.lignes)
+    if args.sortie:
+        Path(args.sortie).write_text(json.dumps(resultats, indent=2, ensure_ascii=False))
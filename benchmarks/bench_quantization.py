@@ -0,0 +1,79 @@
+"""
+Benchmark de la quantification : mémoire par vecteur, rappel@k après
+re-classement en pleine précision et latence, face à la recherche exacte
+
+    python benchmarks/bench_quantization.py --vecteurs 200000 --dimension 768
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.rag.ann import recherche_exacte, recherche_candidats, top_k
+from src.rag.quantization import ScalarQuantizer, ProductQuantizer
+from bench_ann import make_matrice
+
+
+def run(nombre=200000, dimension=768, k=10, reranks=(1, 4, 16), requetes=100):
+    resultats = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        matrice = make_matrice(Path(dossier) / 'vecteurs.npy', nombre, dimension)
+        questions = np.asarray(matrice[np.random.default_rng(1).choice(nombre, requetes)])
+        questions += 0.1 * np.random.default_rng(2).normal(size=questions.shape).astype(np.float32)
+        questions /= np.linalg.norm(questions, axis=1, keepdims=True)
+        exacts, latences = [], []
+        for question in questions:
+            debut = time.perf_counter()
+            exacts.append(recherche_exacte(matrice, question, k)[0])
+            latences.append((time.perf_counter() - debut) * 1000)
+
+        print(f"{nombre:,} vecteurs de dimension {dimension} "
+              f"(float32 : {dimension * 4} octets par vecteur, {nombre * dimension * 4 / 2**20:.0f} Mo)")
+        print(f"{'Méthode':<24} {'octets':>7} {'gain':>6} {'rappel@' + str(k):>9} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        print(f"{'Exacte (float32)':<24} {dimension * 4:>7} {1:>5}x {1:>9.3f} "
+              f"{np.percentile(latences, 50):>10.2f} {np.percentile(latences, 99):>10.2f}")
+        resultats['exacte'] = {'octets_par_vecteur': dimension * 4, 'p50_ms': float(np.percentile(latences, 50))}
+        for quantizer in (ScalarQuantizer(dossier), ProductQuantizer(dossier)):
+            debut = time.perf_counter()
+            quantizer.entrainer(matrice)
+            construction = time.perf_counter() - debut
+            codes = quantizer.codes()
+            gain = dimension * 4 / quantizer.taille_code
+            for rerank in reranks:
+                latences, trouves = [], 0
+                for question, exact in zip(questions, exacts):
+                    debut = time.perf_counter()
+                    candidats = np.sort(top_k(quantizer.scores(codes, question), k * rerank)[0])
+                    rangs, _ = recherche_candidats(matrice, question, k, candidats)
+                    latences.append((time.perf_counter() - debut) * 1000)
+                    trouves += len(set(rangs) & set(exact))
+                rappel = trouves / (k * len(questions))
+                nom = f"{quantizer.nom} re-classement x{rerank}"
+                print(f"{nom:<24} {quantizer.taille_code:>7} {gain:>5.0f}x {rappel:>9.3f} "
+                      f"{np.percentile(latences, 50):>10.2f} {np.percentile(latences, 99):>10.2f}")
+                resultats[f"{quantizer.nom}_rerank_{rerank}"] = {
+                    'octets_par_vecteur': quantizer.taille_code,
+                    'compression': gain,
+                    'rappel': rappel,
+                    'p50_ms': float(np.percentile(latences, 50)),
+                    'construction_s': construction
+                }
+        del matrice
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vecteurs', type=int, default=200000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--rerank', default='1,4,16')
+    parser.add_argument('--requetes', type=int, default=100)
+    args = parser.parse_args()
+    run(args.vecteurs, args.dimension, args.k, [int(r) for r in args.rerank.split(',')], args.requetes)
@@ -0,0 +1,100 @@
+"""
+Test de charge du service HTTP : débit et latence p50/p99 avec de nombreux
+clients simultanés, avec et sans micro-batching, LLM remplacé par un bouchon
+
+    python benchmarks/bench_service.py --chunks 50000 --clients 32 --requetes 2000
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import requests
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.rag.embeddings import HashingEmbeddings
+from src.rag.service import QueryService
+from src.rag.vector_store import NumpyVectorStore
+from bench_database import VOCABULAIRE
+
+
+def make_store(dossier, nombre, dimension):
+    aleatoire = np.random.default_rng(0)
+    store = NumpyVectorStore(dossier, HashingEmbeddings(dimension=dimension))
+    for debut in range(0, nombre, 10000):
+        textes = [
+            ' '.join(aleatoire.choice(VOCABULAIRE, 30)) + f" chunk {i}"
+            for i in range(debut, min(nombre, debut + 10000))
+        ]
+        store.add_texts(textes, metadatas=[{'source': f"{i}.pdf"} for i in range(debut, debut + len(textes))])
+    return store
+
+
+def charger(url, clients, nombre, prefixe):
+    """Envoie `nombre` questions distinctes depuis `clients` threads ; latences en ms"""
+    session = threading.local()
+
+    def poser(i):
+        if not hasattr(session, 'http'):
+            session.http = requests.Session()
+        debut = time.perf_counter()
+        reponse = session.http.post(url, json={'question': f"{prefixe} {VOCABULAIRE[i % len(VOCABULAIRE)]} {i}"})
+        return (time.perf_counter() - debut) * 1000, reponse.status_code
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        resultats = list(pool.map(poser, range(nombre)))
+    duree = time.perf_counter() - debut
+    latences = np.array([latence for latence, code in resultats if code == 200])
+    return duree, latences, sum(code != 200 for _, code in resultats)
+
+
+def run(chunks=50000, dimension=512, clients=32, nombre=2000, latence_llm=0.05, fenetres=(0, 5)):
+    resultats = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        store = make_store(dossier, chunks, dimension)
+        print(f"{chunks:,} chunks, {clients} clients, {nombre} questions, LLM bouchon de {latence_llm * 1000:.0f} ms")
+        print(f"{'Fenêtre de lot':<16} {'req/s':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'lot moyen':>10} {'erreurs':>8}")
+        for fenetre in fenetres:
+            service = QueryService(
+                store, store.embedding, lambda question, extraits: time.sleep(latence_llm) or "réponse",
+                fenetre_ms=fenetre, workers=clients
+            )
+            httpd = service.serveur(port=0)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            try:
+                url = f"http://127.0.0.1:{httpd.server_address[1]}/query"
+                duree, latences, erreurs = charger(url, clients, nombre, f"fenetre {fenetre}")
+            finally:
+                httpd.shutdown()
+                httpd.server_close()
+                service.close()
+            statistiques = service.statistiques()
+            print(f"{str(fenetre) + ' ms':<16} {nombre / duree:>8.0f} {np.percentile(latences, 50):>10.1f} "
+                  f"{np.percentile(latences, 99):>10.1f} {statistiques['taille_moyenne_lot']:>10.1f} {erreurs:>8}")
+            resultats[f"fenetre_{fenetre}ms"] = {
+                'requetes_par_seconde': nombre / duree,
+                'p50_ms': float(np.percentile(latences, 50)),
+                'p99_ms': float(np.percentile(latences, 99)),
+                'taille_moyenne_lot': statistiques['taille_moyenne_lot'],
+                'erreurs': erreurs
+            }
+        store.close()
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=50000)
+    parser.add_argument('--dimension', type=int, default=512)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requetes', type=int, default=2000)
+    parser.add_argument('--latence-llm', type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.chunks, args.dimension, args.clients, args.requetes, args.latence_llm)
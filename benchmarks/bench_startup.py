@@ -0,0 +1,60 @@
+"""
+Temps de démarrage à chaud : import, ouverture de l'index persisté et
+première recherche, mesurés dans un processus neuf
+
+    python benchmarks/bench_startup.py --chunks 50000 --max-secondes 2
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from bench_service import make_store
+
+RACINE = Path(__file__).parent.parent
+
+MESURE = """
+import json, sys, time
+debut = time.perf_counter()
+from src.rag.system import RAGSystem
+import_s = time.perf_counter() - debut
+rag = RAGSystem(pdf_directory=sys.argv[1], persist_directory=sys.argv[1], embedding_backend='hashing')
+rag.warm_start()
+ouverture_s = time.perf_counter() - debut - import_s
+rag.db.rechercher_lot([rag.embeddings.embed_query("réseaux de neurones")], k=5)
+total_s = time.perf_counter() - debut
+print(json.dumps({'import_s': import_s, 'ouverture_s': ouverture_s,
+                  'premiere_recherche_s': total_s - import_s - ouverture_s, 'total_s': total_s,
+                  'modules': len(sys.modules)}))
+"""
+
+
+def run(chunks=50000, dimension=1024):
+    with tempfile.TemporaryDirectory() as dossier:
+        store = make_store(Path(dossier) / 'numpy', chunks, dimension)
+        store.close()
+        (Path(dossier) / 'numpy' / 'manifest.json').write_text(json.dumps({'bench.pdf': {}}))
+        sortie = subprocess.run([sys.executable, '-c', MESURE, dossier], cwd=RACINE,
+                                capture_output=True, text=True, check=True)
+    resultats = json.loads(sortie.stdout.strip().splitlines()[-1])
+    print(f"{chunks:,} chunks de dimension {dimension}, {resultats['modules']} modules chargés")
+    for cle in ('import_s', 'ouverture_s', 'premiere_recherche_s', 'total_s'):
+        print(f"{cle:<22} {resultats[cle]:>8.3f} s")
+    return resultats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=50000)
+    parser.add_argument('--dimension', type=int, default=1024)
+    parser.add_argument('--max-secondes', type=float, help="Échoue si le démarrage dépasse ce budget")
+    args = parser.parse_args()
+    resultats = run(args.chunks, args.dimension)
+    if args.max_secondes is not None and resultats['total_s'] > args.max_secondes:
+        print(f"Budget de démarrage dépassé : {resultats['total_s']:.3f} s > {args.max_secondes} s")
+        sys.exit(1)
@@ -0,0 +1,119 @@
+"""
+Lance les benchmarks hors ligne et écrit leurs résultats en JSON, pour
+comparer deux exécutions et repérer les régressions
+
+    python benchmarks/run_benchmarks.py --sortie resultats.json
+    python benchmarks/run_benchmarks.py --rapide --comparer resultats.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+# Paramètres de run() par benchmark : complets, puis réduits avec --rapide
+SUITES = {
+    'pipeline': ({}, {'documents': 40, 'requetes': 50, 'lignes': 2000}),
+    'database': ({}, {'nombre_documents': 2000}),
+    'cleaner': ({}, {'nombre': 5000}),
+    'context': ({}, {'requetes': 200}),
+    'startup': ({}, {'chunks': 10000}),
+    'ann': ({}, {'tailles': (100000,), 'requetes': 50}),
+    'quantization': ({}, {'nombre': 20000, 'dimension': 128, 'requetes': 50}),
+    'service': ({}, {'chunks': 10000, 'clients': 8, 'nombre': 200}),
+    'logging': ({}, {'documents': 2000, 'workers': (1, 8)}),
+}
+
+SEUIL_REGRESSION = 0.2  # Écart relatif signalé par --comparer
+PLUS_BAS_MEILLEUR = ('_ms', '_s', 'erreurs', 'echecs', 'abandonnes', 'modules')  # Latences, durées, échecs
+
+
+def version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def aplatir(resultats, prefixe=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, en ne gardant que les nombres"""
+    valeurs = {}
+    for cle, valeur in (resultats or {}).items():
+        nom = f"{prefixe}{cle}"
+        if isinstance(valeur, dict):
+            valeurs.update(aplatir(valeur, f"{nom}."))
+        elif isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+            valeurs[nom] = valeur
+    return valeurs
+
+
+def comparer(precedent, actuel):
+    """Affiche les mesures qui ont varié de plus de SEUIL_REGRESSION
+
+    Le sens de la variation dépend de la mesure : une latence, une durée ou
+    un nombre d'échecs doit baisser (PLUS_BAS_MEILLEUR), un débit monter.
+    Retourne le nombre de régressions.
+    """
+    avant, apres = aplatir(precedent['resultats']), aplatir(actuel['resultats'])
+    ecarts = 0
+    for nom in sorted(avant.keys() & apres.keys()):
+        if not avant[nom]:
+            continue
+        rapport = apres[nom] / avant[nom]
+        if abs(rapport - 1) < SEUIL_REGRESSION:
+            continue
+        meilleur = rapport < 1 if nom.endswith(PLUS_BAS_MEILLEUR) else rapport > 1
+        print(f"{'amélioration' if meilleur else 'RÉGRESSION':<13} {nom:<50} "
+              f"{avant[nom]:>12.4g} -> {apres[nom]:<12.4g} (x{rapport:.2f})")
+        ecarts += not meilleur
+    return ecarts
+
+
+def run(suites=tuple(SUITES), rapide=False):
+    resultats = {}
+    for nom in suites:
+        print(f"\n=== {nom} ===")
+        module = importlib.import_module(f"bench_{nom}")
+        debut = time.perf_counter()
+        resultats[nom] = module.run(**SUITES[nom][rapide])
+        print(f"({time.perf_counter() - debut:.1f} s)")
+    return {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': version_git(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processeurs': os.cpu_count(),
+            'rapide': rapide
+        },
+        'resultats': resultats
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('suites', nargs='*', help=f"Parmi {', '.join(SUITES)} (toutes par défaut)")
+    parser.add_argument('--rapide', action='store_true', help="Tailles réduites")
+    parser.add_argument('--sortie', default='benchmarks.json')
+    parser.add_argument('--comparer', help="JSON d'une exécution précédente")
+    args = parser.parse_args()
+    inconnues = set(args.suites) - set(SUITES)
+    if inconnues:
+        parser.error(f"Benchmarks inconnus : {', '.join(sorted(inconnues))}")
+
+    precedent = json.loads(Path(args.comparer).read_text()) if args.comparer else None
+    actuel = run(args.suites or tuple(SUITES), args.rapide)
+    Path(args.sortie).write_text(json.dumps(actuel, indent=2, ensure_ascii=False, default=list))
+    print(f"\nRésultats écrits dans {args.sortie}")
+    if precedent:
+        print(f"\nComparaison avec {args.comparer} ({precedent['meta'].get('commit')}) :")
+        if comparer(precedent, actuel):
+            sys.exit(1)
@@ -8,6 +8,7 @@ setup(
         "requests>=2.31.0",
         "PyPDF2>=3.0.0",
         "python-dotenv>=1.0.0",
+        "numpy>=1.24.0",
     ],
     author="Votre Nom",
     author_email="votre.email@example.com",
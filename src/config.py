@@ -13,6 +13,7 @@ LOGS_DIR = BASE_DIR / 'logs'
 
 # Base de données
 DB_NAME = DATA_DIR / 'hal_documents.db'
+DB_BATCH_SIZE = 500  # Documents écrits par transaction
 
 # API HAL
 HAL_API_URL = "http://api.archives-ouvertes.fr/search/"
@@ -23,6 +24,71 @@ HAL_SEARCH_PARAMS = {
     "fl": "docid,label_s,fileMain_s,uri_s,authFullName_s,abstract_s,publicationDate_s"
 }
 
+# Téléchargement des PDFs
+HAL_MAX_WORKERS = 8  # Téléchargements simultanés
+HAL_TIMEOUT = (10, 60)  # (connexion, lecture) en secondes
+HAL_MAX_RETRIES = 3
+HAL_BACKOFF_FACTOR = 0.5  # Attente entre deux essais : 0.5s, 1s, 2s...
+HAL_CHUNK_SIZE = 64 * 1024  # Taille des blocs lus en streaming
+BLOB_DIRNAME = 'blobs'  # PDFs rangés par hash du contenu, dans le dossier des téléchargements
+BLOB_MANIFEST = 'manifest.db'  # Table doc_id -> hash_contenu, à côté des blobs
+
+# Moissonnage paginé (cursorMark)
+HAL_PAGE_SIZE = 500
+HAL_CURSOR_FILE = DATA_DIR / 'hal_cursor.json'  # Reprise après interruption
+HAL_MAX_ECHECS = 200  # Documents en échec redemandés par identifiant à chaque synchronisation
+
+# Système RAG
+EXTRACTION_WORKERS = os.cpu_count()  # Processus d'extraction du texte des PDFs
+EXTRACTION_TIMEOUT = 120  # Secondes avant d'abandonner un PDF
+PAGE_TEXT_DIRNAME = 'textes'  # Textes des pages par hash_contenu, dans le dossier des PDFs
+RAG_BATCH_PAGES = 256  # Pages découpées et indexées ensemble
+EMBEDDING_BACKEND = "openai"  # "openai" (API distante) ou "hashing" (local, hors ligne)
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_DIMENSION = 1024  # Taille des vecteurs du backend local
+EMBEDDING_WORKERS = os.cpu_count()  # Processus du backend local pour les gros lots
+EMBEDDING_CACHE_PATH = DATA_DIR / 'embeddings_cache.db'
+EMBEDDING_CACHE_MAX_MB = 2048  # Au-delà, les vecteurs les moins utilisés sont évincés
+VECTOR_STORE = "numpy"  # "numpy" (matrice en mémoire mappée) ou "chroma"
+VECTOR_INDEX = "exact"  # "exact" ou "ivf" (approché, pour les très gros corpus)
+IVF_MIN_VECTORS = 50000  # En dessous, la recherche reste exacte
+IVF_NLIST = None  # Nombre de listes ; par défaut 4 × √(nombre de chunks)
+IVF_NPROBE = 16  # Listes sondées par requête : plus de rappel, plus de latence
+IVF_RETRAIN_GROWTH = 4  # Réentraînement quand le corpus a quadruplé
+VECTOR_QUANTIZATION = "none"  # "none", "sq8" (4x moins de mémoire) ou "pq" (jusqu'à 32x)
+QUANTIZATION_MIN_VECTORS = 50000  # Quantification apprise à partir de cette taille
+QUANTIZATION_RERANK = 4  # k × 4 candidats re-classés en pleine précision
+PQ_SUBVECTOR_DIM = 8  # Composantes par octet de code PQ (8 -> 32x plus compact)
+
+# Cache des réponses
+ANSWER_CACHE_SIZE = 1024  # Questions exactes gardées
+ANSWER_CACHE_TTL = 3600  # Secondes
+SEMANTIC_CACHE_SIZE = 1024  # Questions proches gardées
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Similarité cosinus minimale pour réutiliser une réponse
+
+# Contexte envoyé au LLM
+CONTEXT_TOKEN_BUDGET = 2000  # Tokens d'extraits au plus dans le prompt
+CONTEXT_DUPLICATE_THRESHOLD = 0.8  # Similarité au-delà de laquelle un extrait est un doublon
+CONTEXT_MIN_OVERLAP = 20  # Caractères communs minimaux pour recoller deux chunks
+CONTEXT_TOKENIZER = "cl100k_base"  # Encodage tiktoken (estimation si absent)
+
+# Journalisation
+LOG_LEVEL = "INFO"
+LOG_QUEUE_SIZE = 10000  # Messages en attente d'écriture ; au-delà ils sont abandonnés
+LOG_RATE_LIMIT = 5  # Messages INFO par seconde et par ligne de code (0 : pas de limite)
+
+# Métriques (False : compteurs et chronomètres sans effet)
+METRICS_ENABLED = True
+
+# Service HTTP de questions-réponses
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8000
+SERVICE_BATCH_WINDOW_MS = 5  # Attente maximale pour regrouper les recherches
+SERVICE_MAX_BATCH = 64  # Questions vectorisées et cherchées ensemble
+SERVICE_MAX_PENDING = 256  # Au-delà, réponse 503 (le client réessaie plus tard)
+SERVICE_TIMEOUT = 60  # Secondes avant une réponse 504
+SERVICE_WORKERS = 32  # Générations de réponses simultanées
+
 # Création automatique des répertoires
 for directory in [DATA_DIR, DOWNLOADS_DIR, LOGS_DIR]:
     directory.mkdir(exist_ok=True) 
\ No newline at end of file
@@ -3,5 +3,6 @@ Module de gestion de la base de données pour CHATBOT_RAG
 """
 
 from .manager import DatabaseManager
+from .blob_store import BlobStore
 
-__all__ = ['DatabaseManager'] 
\ No newline at end of file
+__all__ = ['DatabaseManager', 'BlobStore'] 
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Magasin des PDFs adressé par contenu
+
+Chaque contenu n'est écrit qu'une fois, sous son hash SHA-256, dans des
+sous-dossiers répartis par préfixe ; une table de manifeste associe les
+identifiants HAL à ces fichiers. L'indexation et la vérification énumèrent
+le manifeste au lieu de parcourir les dossiers.
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from src.config import BLOB_DIRNAME, BLOB_MANIFEST
+from src.utils.fichiers import hash_fichier
+from .manager import PRAGMAS
+
+
+class BlobStore:
+    """PDFs rangés sous <dossier>/blobs/ab/cd/<hash>.pdf, dédoublonnés par hash_contenu
+
+    Le manifeste (SQLite, <dossier>/manifest.db) a deux tables : `blobs`
+    (hash_contenu, taille, nombre_pages) et `manifeste` (doc_id ->
+    hash_contenu). Un fichier est supprimé dès qu'aucun document ne le
+    référence plus. Les PDFs d'un ancien dossier plat ({doc_id}.pdf) sont
+    importés par importer_fichiers_plats(), étape de migration appelée par
+    le téléchargeur : ouvrir le magasin ne déplace aucun fichier.
+    """
+
+    def __init__(self, dossier):
+        self.dossier = str(dossier)
+        self.logger = logging.getLogger(__name__)
+        self.blobs_dir = os.path.join(self.dossier, BLOB_DIRNAME)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        # Une seule connexion, partagée par les threads de téléchargement
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.dossier, BLOB_MANIFEST), check_same_thread=False)
+        for pragma in PRAGMAS:
+            self._conn.execute(pragma)
+        self._init_db()
+
+    def _init_db(self):
+        """Crée les tables du manifeste"""
+        try:
+            with self._conn:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        hash_contenu TEXT PRIMARY KEY,
+                        taille INTEGER DEFAULT 0,
+                        nombre_pages INTEGER
+                    )
+                ''')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS manifeste (
+                        doc_id TEXT PRIMARY KEY,
+                        hash_contenu TEXT NOT NULL REFERENCES blobs(hash_contenu)
+                    )
+                ''')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS idx_manifeste_hash ON manifeste(hash_contenu)')
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'initialisation du manifeste : {e}")
+            raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def chemin(self, hash_contenu):
+        """Emplacement d'un contenu : deux niveaux de sous-dossiers de 256 entrées"""
+        return f"{self.blobs_dir}{os.sep}{hash_contenu[:2]}{os.sep}{hash_contenu[2:4]}{os.sep}{hash_contenu}.pdf"
+
+    def obtenir(self, hash_contenu):
+        """Taille et nombre de pages d'un contenu déjà rangé, ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT taille, nombre_pages FROM blobs WHERE hash_contenu = ?', (hash_contenu,)
+            ).fetchone()
+        return {'taille': row[0], 'nombre_pages': row[1]} if row else None
+
+    def ajouter(self, doc_id, fichier, hash_contenu, taille, nombre_pages=None):
+        """Range `fichier` sous son hash et l'associe à `doc_id`
+
+        Si ce contenu est déjà présent, `fichier` est simplement supprimé.
+        L'ancien contenu du document est libéré s'il n'est plus référencé.
+        Retourne le chemin du blob.
+        """
+        chemin = self.chemin(hash_contenu)
+        try:
+            with self._lock:
+                if os.path.exists(chemin):
+                    os.remove(fichier)
+                else:
+                    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+                    os.replace(fichier, chemin)
+                with self._conn:
+                    ancien = self._conn.execute(
+                        'SELECT hash_contenu FROM manifeste WHERE doc_id = ?', (str(doc_id),)
+                    ).fetchone()
+                    self._conn.execute(
+                        'INSERT OR IGNORE INTO blobs (hash_contenu, taille, nombre_pages) VALUES (?, ?, ?)',
+                        (hash_contenu, taille, nombre_pages)
+                    )
+                    self._conn.execute(
+                        'UPDATE blobs SET nombre_pages = ? WHERE hash_contenu = ? AND nombre_pages IS NULL',
+                        (nombre_pages, hash_contenu)
+                    )
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO manifeste (doc_id, hash_contenu) VALUES (?, ?)',
+                        (str(doc_id), hash_contenu)
+                    )
+                    if ancien and ancien[0] != hash_contenu:
+                        self._liberer(ancien[0])
+            return chemin
+        except Exception as e:
+            self.logger.error(f"Erreur lors du rangement du document {doc_id} : {e}")
+            raise
+
+    def _liberer(self, hash_contenu):
+        """Supprime un contenu qu'aucun document ne référence plus (verrou et transaction tenus)"""
+        if self._conn.execute('SELECT 1 FROM manifeste WHERE hash_contenu = ? LIMIT 1', (hash_contenu,)).fetchone():
+            return
+        self._conn.execute('DELETE FROM blobs WHERE hash_contenu = ?', (hash_contenu,))
+        try:
+            os.remove(self.chemin(hash_contenu))
+        except FileNotFoundError:
+            pass
+
+    def fichiers(self):
+        """Chemin -> hash de chaque contenu distinct, triés par hash"""
+        with self._lock:
+            rows = self._conn.execute('SELECT hash_contenu FROM blobs ORDER BY hash_contenu').fetchall()
+        return {self.chemin(hash_contenu): hash_contenu for hash_contenu, in rows}
+
+    def documents(self):
+        """doc_id -> hash_contenu"""
+        with self._lock:
+            return dict(self._conn.execute('SELECT doc_id, hash_contenu FROM manifeste'))
+
+    def documents_par_fichier(self):
+        """Chemin d'un blob -> identifiants des documents qui le partagent"""
+        par_fichier = {}
+        for doc_id, hash_contenu in sorted(self.documents().items()):
+            par_fichier.setdefault(self.chemin(hash_contenu), []).append(doc_id)
+        return par_fichier
+
+    def verifier(self, rehacher=False):
+        """Contrôle les fichiers du manifeste, sans parcourir les dossiers
+
+        Retourne les hash des contenus absents du disque et, avec
+        `rehacher`, ceux dont le fichier ne correspond plus à son hash.
+        """
+        fichiers = self.fichiers()
+        manquants, corrompus = [], []
+        for chemin, hash_contenu in fichiers.items():
+            if not os.path.exists(chemin):
+                manquants.append(hash_contenu)
+            elif rehacher and hash_fichier(chemin) != hash_contenu:
+                corrompus.append(hash_contenu)
+        if manquants or corrompus:
+            self.logger.warning(f"Magasin de PDFs : {len(manquants)} manquants, {len(corrompus)} corrompus")
+        return {'blobs': len(fichiers), 'documents': len(self.documents()),
+                'manquants': manquants, 'corrompus': corrompus}
+
+    def importer_fichiers_plats(self):
+        """Range les {doc_id}.pdf d'un dossier plat, une seule fois (manifeste vide)
+
+        Retourne le nombre de PDFs importés.
+        """
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM manifeste LIMIT 1').fetchone():
+                return 0
+
+        importes = 0
+        for entree in os.scandir(self.dossier):
+            if entree.is_file() and entree.name.endswith('.pdf'):
+                self.ajouter(entree.name[:-4], entree.path, hash_fichier(entree.path), entree.stat().st_size)
+                importes += 1
+        if importes:
+            self.logger.info(f"{importes} PDFs importés dans le magasin adressé par contenu")
+        return importes
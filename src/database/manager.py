@@ -2,22 +2,105 @@
 Gestionnaire de base de données simplifié pour CHATBOT_RAG
 """
 
+import re
 import sqlite3
 import logging
+import threading
 from pathlib import Path
 from src.config import DB_NAME
+from src.utils.metrics import metrics
+
+# Réglages appliqués à chaque connexion
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',  # Lecteurs et écrivain ne se bloquent plus
+    'PRAGMA synchronous = NORMAL',  # Un fsync par checkpoint plutôt que par commit
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -65536',  # 64 Mo de cache de pages
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA busy_timeout = 30000'
+)
+
+# Colonnes indexées en plein texte et poids BM25 associés
+COLONNES_FTS = ('titre', 'auteurs', 'resume', 'mots_cles')
+POIDS_BM25 = (10.0, 5.0, 1.0, 3.0)
+
+# Métadonnées produites par DataCleaner.clean_metadata
+COLONNES_METADONNEES = (
+    ('langue', "TEXT DEFAULT ''"),
+    ('domaine_scientifique', "TEXT DEFAULT ''"),
+    ('journal', "TEXT DEFAULT ''"),
+    ('type_document', "TEXT DEFAULT ''"),
+    ('date_soumission', "TEXT DEFAULT ''"),
+    ('nombre_pages', 'INTEGER DEFAULT 0'),
+    ('taille_fichier', 'INTEGER DEFAULT 0'),
+    ('hash_contenu', "TEXT DEFAULT ''"),
+    ('version', 'INTEGER DEFAULT 1')
+)
+
+INDEX_DOCUMENTS = (
+    ('idx_documents_statut', 'statut'),
+    ('idx_documents_hash', 'hash_contenu'),
+    ('idx_documents_date', 'date_publication'),
+    ('idx_documents_langue', 'langue'),
+    ('idx_documents_domaine', 'domaine_scientifique')
+)
+
+ECRITURE = metrics.histogramme('sqlite_ecriture_secondes', "Écriture SQLite d'un lot")
+RECHERCHE = metrics.histogramme('sqlite_recherche_secondes', "Recherche SQLite (FTS5)")
+DOCUMENTS_ECRITS = metrics.compteur('sqlite_documents_ecrits_total', "Documents écrits en base")
+
+# Migrations du schéma, dans l'ordre : la position donne le numéro de version
+MIGRATIONS = ('_migration_fts', '_migration_metadonnees')
+
+# Colonnes écrites par ajouter_documents, avec leur valeur par défaut
+COLONNES_DOCUMENTS = (
+    ('doc_id', ''), ('titre', ''), ('auteurs', ''), ('resume', ''),
+    ('date_publication', ''), ('uri', ''), ('chemin_local', ''), ('statut', 'nouveau'),
+    ('mots_cles', ''), ('langue', ''), ('domaine_scientifique', ''), ('journal', ''),
+    ('type_document', ''), ('date_soumission', ''), ('nombre_pages', 0),
+    ('taille_fichier', 0), ('hash_contenu', ''), ('version', 1)
+)
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, db_path=DB_NAME):
         """Initialise la connexion à la base de données"""
-        self.db_path = DB_NAME
+        self.db_path = db_path
         self.logger = logging.getLogger(__name__)
+        # Une connexion persistante par thread
+        self._local = threading.local()
+        self._connexions = []
+        self._lock = threading.Lock()
         self._init_db()
         
+    def _connexion(self):
+        """Retourne la connexion du thread courant, ouverte à la première utilisation
+        
+        Utilisée comme gestionnaire de contexte, elle délimite une transaction
+        (commit ou rollback) sans être fermée.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connexions.append(conn)
+        return conn
+    
+    def close(self):
+        """Ferme toutes les connexions ouvertes"""
+        with self._lock:
+            for conn in self._connexions:
+                conn.close()
+            self._connexions.clear()
+        self._local = threading.local()
+        
     def _init_db(self):
         """Initialise la structure de la base de données"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connexion() as conn:
+                # Schéma d'origine (version 0), complété par les migrations
                 conn.execute('''
                     CREATE TABLE IF NOT EXISTS documents (
                         doc_id TEXT PRIMARY KEY,
@@ -30,40 +113,286 @@ class DatabaseManager:
                         statut TEXT DEFAULT 'nouveau'
                     )
                 ''')
+                # État de la synchronisation incrémentale
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS sync_fichiers (
+                        doc_id TEXT PRIMARY KEY,
+                        version INTEGER DEFAULT 0,
+                        date_soumission TEXT,
+                        etag TEXT,
+                        last_modified TEXT,
+                        hash_contenu TEXT,
+                        chemin_local TEXT
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS sync_etat (
+                        cle TEXT PRIMARY KEY,
+                        valeur TEXT
+                    )
+                ''')
                 conn.commit()
-                self.logger.info(f"Base de données initialisée : {self.db_path}")
+            self._migrer()
+            self.logger.info(f"Base de données initialisée : {self.db_path}")
         except Exception as e:
             self.logger.error(f"Erreur lors de l'initialisation de la base : {e}")
             raise
-            
+    
+    def version_schema(self):
+        """Retourne la version du schéma (PRAGMA user_version)"""
+        return self._connexion().execute('PRAGMA user_version').fetchone()[0]
+    
+    def _migrer(self):
+        """Applique, chacune dans sa transaction, les migrations pas encore passées"""
+        conn = self._connexion()
+        for numero, nom in enumerate(MIGRATIONS, 1):
+            # BEGIN IMMEDIATE : un seul processus migre, les autres attendent puis relisent
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= numero:
+                    conn.execute('COMMIT')
+                    continue
+                migration = getattr(self, nom)
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.logger.info(f"Migration {numero} appliquée : {migration.__doc__}")
+    
+    def _ajouter_colonne(self, conn, table, colonne, definition):
+        """Ajoute une colonne si elle n'existe pas déjà"""
+        colonnes = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if colonne not in colonnes:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {colonne} {definition}')
+    
+    def _migration_fts(self, conn):
+        """Index plein texte FTS5 sur titre, auteurs, résumé et mots-clés"""
+        self._ajouter_colonne(conn, 'documents', 'mots_cles', "TEXT DEFAULT ''")
+        
+        existe = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'"
+        ).fetchone()
+        liste = ', '.join(COLONNES_FTS)
+        nouveaux = ', '.join(f'new.{c}' for c in COLONNES_FTS)
+        anciens = ', '.join(f'old.{c}' for c in COLONNES_FTS)
+        
+        # Table à contenu externe : le texte n'est stocké qu'une fois, dans documents
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                {liste},
+                content='documents', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts(rowid, {liste}) VALUES (new.rowid, {nouveaux});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, {liste})
+                VALUES ('delete', old.rowid, {anciens});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, {liste})
+                VALUES ('delete', old.rowid, {anciens});
+                INSERT INTO documents_fts(rowid, {liste}) VALUES (new.rowid, {nouveaux});
+            END
+        ''')
+        if not existe:
+            conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+    
+    def _migration_metadonnees(self, conn):
+        """Métadonnées complètes des documents et index secondaires"""
+        for colonne, definition in COLONNES_METADONNEES:
+            self._ajouter_colonne(conn, 'documents', colonne, definition)
+        # Le statut n'était jamais renseigné à partir de statut_traitement
+        conn.execute(
+            "UPDATE documents SET statut = 'téléchargé' "
+            "WHERE statut = 'nouveau' AND chemin_local != ''"
+        )
+        for nom, colonne in INDEX_DOCUMENTS:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {nom} ON documents({colonne})')
+    
     def ajouter_document(self, document):
         """Ajoute un nouveau document dans la base"""
+        self.ajouter_documents([document])
+        self.logger.info(f"Document ajouté/mis à jour : {document.get('doc_id')}")
+    
+    def ajouter_documents(self, documents):
+        """Ajoute ou met à jour un lot de documents en une seule transaction"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''
-                    INSERT OR REPLACE INTO documents 
-                    (doc_id, titre, auteurs, resume, date_publication, uri, chemin_local, statut)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    document.get('doc_id', ''),
-                    document.get('titre', ''),
-                    document.get('auteurs', ''),
-                    document.get('resume', ''),
-                    document.get('date_publication', ''),
-                    document.get('uri', ''),
-                    document.get('chemin_local', ''),
-                    document.get('statut', 'nouveau')
-                ))
-                conn.commit()
-                self.logger.info(f"Document ajouté/mis à jour : {document.get('doc_id')}")
+            with ECRITURE.mesurer(), self._connexion() as conn:
+                nombre = self._ecrire_documents(conn, documents)
+            DOCUMENTS_ECRITS.incrementer(nombre)
+            return nombre
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'ajout des documents : {e}")
+            raise
+    
+    def enregistrer_lot(self, documents, infos_sync):
+        """Écrit des documents et leur état de synchronisation dans la même transaction
+        
+        Un arrêt entre les deux écritures ne peut plus laisser un document
+        dont l'état de synchronisation désigne un ancien fichier ou ETag.
+        """
+        try:
+            with ECRITURE.mesurer(), self._connexion() as conn:
+                nombre = self._ecrire_documents(conn, documents)
+                self._ecrire_fichiers_sync(conn, infos_sync)
+            DOCUMENTS_ECRITS.incrementer(nombre)
+            return nombre
         except Exception as e:
-            self.logger.error(f"Erreur lors de l'ajout du document : {e}")
+            self.logger.error(f"Erreur lors de l'enregistrement du lot : {e}")
             raise
+    
+    def _ecrire_documents(self, conn, documents):
+        lignes = []
+        for document in documents:
+            valeurs = {colonne: document.get(colonne, defaut) for colonne, defaut in COLONNES_DOCUMENTS}
+            # Le statut suit l'avancement du traitement quand il est connu
+            valeurs['statut'] = document.get('statut') or document.get('statut_traitement') or 'nouveau'
+            lignes.append(tuple(valeurs.values()))
+        if not lignes:
+            return 0
+        
+        colonnes = [colonne for colonne, _ in COLONNES_DOCUMENTS]
+        # Upsert plutôt que REPLACE : le rowid est conservé et les
+        # triggers FTS voient une mise à jour, pas une suppression
+        conn.executemany(f'''
+            INSERT INTO documents ({', '.join(colonnes)})
+            VALUES ({', '.join('?' * len(colonnes))})
+            ON CONFLICT(doc_id) DO UPDATE SET
+                {', '.join(f'{c} = excluded.{c}' for c in colonnes[1:])}
+        ''', lignes)
+        return len(lignes)
+    
+    def obtenir_document(self, doc_id):
+        """Retourne un document sous forme de dictionnaire, ou None"""
+        documents = self.lister_documents(doc_id=doc_id)
+        return documents[0] if documents else None
+    
+    def documents_par_hash(self, hash_contenu):
+        """Retourne les identifiants des documents ayant ce contenu (détection des doublons)"""
+        with self._connexion() as conn:
+            cursor = conn.execute(
+                'SELECT doc_id FROM documents WHERE hash_contenu = ?', (hash_contenu,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def lister_documents(self, limite=None, decalage=0, **filtres):
+        """Liste les documents correspondant exactement aux filtres donnés
+        
+        Les filtres portent sur les colonnes de la table (statut, langue,
+        domaine_scientifique...) ; ceux qui sont indexés évitent un parcours
+        complet. 'depuis' filtre sur date_publication.
+        """
+        colonnes = {colonne for colonne, _ in COLONNES_DOCUMENTS}
+        clauses, params = [], []
+        for colonne, valeur in filtres.items():
+            if colonne == 'depuis':
+                clauses.append('date_publication >= ?')
+            elif colonne in colonnes:
+                clauses.append(f'{colonne} = ?')
+            else:
+                raise ValueError(f"Filtre inconnu : {colonne}")
+            params.append(valeur)
+        
+        with self._connexion() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(
+                f"SELECT * FROM documents WHERE {' AND '.join(clauses) or '1=1'} "
+                f"ORDER BY rowid LIMIT ? OFFSET ?",
+                (*params, limite or -1, decalage)
+            )
+            return [dict(row) for row in cursor.fetchall()]
             
+    def obtenir_fichiers_sync(self, doc_ids):
+        """Retourne l'état de synchronisation connu pour une liste de documents"""
+        doc_ids = [str(doc_id) for doc_id in doc_ids]
+        if not doc_ids:
+            return {}
+        with self._connexion() as conn:
+            # row_factory sur le curseur : la connexion persistante reste en tuples
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            placeholders = ', '.join('?' * len(doc_ids))
+            cursor.execute(
+                f'SELECT * FROM sync_fichiers WHERE doc_id IN ({placeholders})', doc_ids
+            )
+            return {row['doc_id']: dict(row) for row in cursor.fetchall()}
+    
+    def enregistrer_fichier_sync(self, info):
+        """Enregistre l'état de synchronisation d'un document"""
+        self.enregistrer_fichiers_sync([info])
+    
+    def enregistrer_fichiers_sync(self, infos):
+        """Enregistre l'état de synchronisation d'un lot de documents"""
+        try:
+            with ECRITURE.mesurer(), self._connexion() as conn:
+                self._ecrire_fichiers_sync(conn, infos)
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'enregistrement de la synchronisation : {e}")
+            raise
+    
+    def _ecrire_fichiers_sync(self, conn, infos):
+        lignes = [
+            (
+                str(info['doc_id']),
+                info.get('version', 0),
+                info.get('date_soumission', ''),
+                info.get('etag', ''),
+                info.get('last_modified', ''),
+                info.get('hash_contenu', ''),
+                info.get('chemin_local', '')
+            )
+            for info in infos
+        ]
+        conn.executemany('''
+            INSERT OR REPLACE INTO sync_fichiers
+            (doc_id, version, date_soumission, etag, last_modified, hash_contenu, chemin_local)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', lignes)
+    
+    def remplacer_chemins(self, chemins):
+        """Met à jour chemin_local (doc_id -> chemin) des documents et de leur synchronisation
+        
+        Les deux tables changent dans la même transaction, quand les PDFs
+        sont déplacés (import d'un dossier plat dans le magasin par contenu).
+        """
+        lignes = [(chemin, str(doc_id)) for doc_id, chemin in chemins.items()]
+        try:
+            with ECRITURE.mesurer(), self._connexion() as conn:
+                conn.executemany('UPDATE documents SET chemin_local = ? WHERE doc_id = ?', lignes)
+                conn.executemany('UPDATE sync_fichiers SET chemin_local = ? WHERE doc_id = ?', lignes)
+            return len(lignes)
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la mise à jour des chemins : {e}")
+            raise
+    
+    def obtenir_etat_sync(self, cle, defaut=None):
+        """Retourne une valeur de l'état de synchronisation (ex : watermark)"""
+        with self._connexion() as conn:
+            row = conn.execute('SELECT valeur FROM sync_etat WHERE cle = ?', (cle,)).fetchone()
+            return row[0] if row else defaut
+    
+    def enregistrer_etat_sync(self, cle, valeur):
+        """Enregistre une valeur de l'état de synchronisation"""
+        with self._connexion() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sync_etat (cle, valeur) VALUES (?, ?)', (cle, valeur)
+            )
+    
     def obtenir_statistiques(self):
         """Retourne les statistiques de la base de données"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connexion() as conn:
                 cursor = conn.cursor()
                 
                 # Nombre total de documents
@@ -89,8 +418,12 @@ class DatabaseManager:
     def reset_database(self):
         """Réinitialise la base de données"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connexion() as conn:
+                conn.execute('DROP TABLE IF EXISTS documents_fts')
                 conn.execute('DROP TABLE IF EXISTS documents')
+                conn.execute('DROP TABLE IF EXISTS sync_fichiers')
+                conn.execute('DROP TABLE IF EXISTS sync_etat')
+                conn.execute('PRAGMA user_version = 0')
                 conn.commit()
             self._init_db()
             self.logger.info("Base de données réinitialisée avec succès")
@@ -99,19 +432,38 @@ class DatabaseManager:
             raise
 
     def rechercher_documents(self, criteres):
-        """Recherche des documents selon des critères"""
-        query = "SELECT * FROM documents WHERE 1=1"
-        params = []
+        """Recherche des documents, classés par pertinence (BM25)
         
-        if 'titre' in criteres:
-            query += " AND titre LIKE ?"
-            params.append(f"%{criteres['titre']}%")
+        Critères reconnus : 'texte' (tous les champs indexés), 'titre',
+        'auteurs', 'resume' et 'mots_cles'. Chaque mot est cherché comme
+        préfixe, sans tenir compte des accents. 'limite' et 'decalage'
+        paginent les résultats.
+        """
+        expressions = []
+        for critere in ('texte',) + COLONNES_FTS:
+            requete = self._requete_fts(criteres.get(critere, ''))
+            if requete:
+                expressions.append(requete if critere == 'texte' else f"{critere} : ({requete})")
+        pagination = (criteres.get('limite') or -1, criteres.get('decalage', 0))
         
-        if 'auteurs' in criteres:
-            query += " AND auteurs LIKE ?"
-            params.append(f"%{criteres['auteurs']}%")
-        
-        with sqlite3.connect(self.db_path) as conn:
+        with RECHERCHE.mesurer(), self._connexion() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchall() 
\ No newline at end of file
+            if not expressions:
+                cursor.execute(
+                    "SELECT * FROM documents ORDER BY rowid LIMIT ? OFFSET ?", pagination
+                )
+                return cursor.fetchall()
+            
+            cursor.execute(f'''
+                SELECT documents.* FROM documents_fts
+                JOIN documents ON documents.rowid = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY bm25(documents_fts, {', '.join(map(str, POIDS_BM25))})
+                LIMIT ? OFFSET ?
+            ''', (' AND '.join(expressions), *pagination))
+            return cursor.fetchall()
+    
+    def _requete_fts(self, texte):
+        """Transforme une saisie libre en requête FTS5 (mots en préfixe, tous requis)"""
+        mots = re.findall(r'\w+', str(texte))
+        return ' AND '.join(f'"{mot}"*' for mot in mots)
\ No newline at end of file
@@ -3,47 +3,212 @@ Module de téléchargement des documents HAL
 """
 
 import os
+import json
+import time
 import requests
 import hashlib
-from io import BytesIO
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import PyPDF2
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.config import (
+    DOWNLOADS_DIR, HAL_API_URL, HAL_MAX_WORKERS, HAL_TIMEOUT,
+    HAL_MAX_RETRIES, HAL_BACKOFF_FACTOR, HAL_PAGE_SIZE, HAL_CURSOR_FILE,
+    HAL_CHUNK_SIZE, HAL_MAX_ECHECS, DB_BATCH_SIZE, PAGE_TEXT_DIRNAME
+)
 from ..utils.logger import setup_logging
 from ..utils.data_cleaner import DataCleaner
+from ..utils.metrics import metrics
+from ..database.blob_store import BlobStore
+from ..rag.extraction import PageTextStore, textes_pages
+
+RECHERCHE_HAL = metrics.histogramme('hal_recherche_secondes', "Recherche HAL (page de résultats)")
+TELECHARGEMENT_PDF = metrics.histogramme('hal_telechargement_secondes', "Téléchargement d'un PDF")
+OCTETS_TELECHARGES = metrics.compteur('hal_octets_telecharges_total', "Octets de PDF téléchargés")
+PDFS_TELECHARGES = metrics.compteur('hal_pdfs_telecharges_total', "PDFs téléchargés")
+ECHECS_TELECHARGEMENT = metrics.compteur('hal_echecs_telechargement_total', "Téléchargements en échec")
 
 class HALDownloader:
-    def __init__(self, db_manager):
-        self.logger = setup_logging()
+    def __init__(self, db_manager, api_url=HAL_API_URL, downloads_dir=DOWNLOADS_DIR,
+                 max_workers=HAL_MAX_WORKERS, page_size=HAL_PAGE_SIZE,
+                 cursor_file=HAL_CURSOR_FILE, page_store=None, blob_store=None):
+        self.logger = setup_logging(__name__)
         self.db_manager = db_manager
         self.data_cleaner = DataCleaner()
-        self.downloads_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'downloads')
+        self.api_url = api_url
+        self.downloads_dir = str(downloads_dir)
+        self.max_workers = max(1, max_workers)
+        self.page_size = page_size
+        self.cursor_file = str(cursor_file)
+        self.session = self._create_session()
+        self.moissonnage_complet = False  # Dernier moissonnage allé jusqu'au bout des résultats
         
         if not os.path.exists(self.downloads_dir):
             os.makedirs(self.downloads_dir)
+        # PDFs rangés par hash du contenu, un seul exemplaire par contenu
+        self.blob_store = blob_store or BlobStore(self.downloads_dir)
+        self._migrer_chemins()
+        # Textes des pages extraits à la vérification, relus par l'indexation
+        self.page_store = page_store or PageTextStore(os.path.join(self.downloads_dir, PAGE_TEXT_DIRNAME))
     
-    def download_documents(self, limit=100):
-        """Télécharge les documents depuis HAL"""
-        self.logger.info(f"Démarrage du téléchargement (limite: {limit} documents)")
+    def _migrer_chemins(self):
+        """Range un ancien dossier plat dans le magasin adressé par contenu, une seule fois
         
-        # Recherche des documents
-        documents = self._search_hal_documents(limit)
-        if not documents:
-            self.logger.warning("Aucun document trouvé")
+        Les PDFs sont déplacés sous leur hash et la base pointe sur leur
+        nouvel emplacement : sans cette mise à jour, les chemins enregistrés
+        n'existeraient plus et tout serait retéléchargé.
+        """
+        if self.db_manager.obtenir_etat_sync('stockage') == 'blobs':
             return
+        self.blob_store.importer_fichiers_plats()
+        chemins = {
+            doc_id: self.blob_store.chemin(hash_contenu)
+            for doc_id, hash_contenu in self.blob_store.documents().items()
+        }
+        if chemins:
+            self.db_manager.remplacer_chemins(chemins)
+            self.logger.info(f"Chemins de {len(chemins)} documents mis à jour vers le magasin de PDFs")
+        self.db_manager.enregistrer_etat_sync('stockage', 'blobs')
+    
+    def _create_session(self):
+        """Crée une session HTTP partagée (keep-alive, pool par hôte, retry)"""
+        retry = Retry(
+            total=HAL_MAX_RETRIES,
+            backoff_factor=HAL_BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        # Un pool par hôte, dimensionné pour que chaque worker garde sa connexion
+        adapter = HTTPAdapter(pool_maxsize=self.max_workers, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    def download_documents(self, limit=100, resume=True, incremental=False):
+        """Télécharge les documents depuis HAL et retourne les statistiques de débit
         
-        self.logger.info(f"{len(documents)} documents trouvés")
+        En mode incrémental, seuls les documents soumis depuis la dernière
+        synchronisation sont demandés à HAL, avec ceux restés en échec
+        (statut 'échec'), et seuls ceux dont le PDF a réellement changé sont
+        réécrits en base.
+        """
+        watermark = self.db_manager.obtenir_etat_sync('watermark') if incremental else None
+        echecs = [
+            document['doc_id']
+            for document in self.db_manager.lister_documents(limite=HAL_MAX_ECHECS, statut='échec')
+        ] if watermark else []
+        self.logger.info(
+            f"Démarrage du téléchargement (limite: {limit} documents, "
+            f"{self.max_workers} en parallèle"
+            f"{f', depuis {watermark}' if watermark else ''})"
+        )
+        debut = time.perf_counter()
+        telecharges = []
+        total = 0
+        inchanges = 0
+        plus_recent = watermark or ''
+        premier_echec = None  # Plus ancienne date de soumission d'un document en échec
         
-        # Téléchargement des documents
-        for doc in documents:
-            if 'fileMain_s' in doc:
-                self._process_document(doc)
+        # Les pages sont traitées l'une après l'autre : le curseur n'est
+        # sauvegardé qu'une fois tous les documents de la page enregistrés
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for page in self.iter_hal_documents(limit, resume=resume, since=watermark, echecs=echecs):
+                documents = [doc for doc in page if 'fileMain_s' in doc]
+                total += len(documents)
+                connus = self.db_manager.obtenir_fichiers_sync(doc['docid'] for doc in documents)
+                
+                # Nettoyage des métadonnées de la page en un seul lot, puis
+                # téléchargement des documents : le réseau est parallélisé,
+                # les écritures en base restent dans le thread principal
+                nettoyes = self.data_cleaner.clean_many(
+                    map(self._extract_metadata, documents), ignorer_erreurs=True
+                )
+                futures = {
+                    executor.submit(self._process_document, doc, metadata, connus.get(str(doc['docid']))): doc
+                    for doc, metadata in zip(documents, nettoyes)
+                }
+                a_ecrire, a_synchroniser = [], []
+                for future in as_completed(futures):
+                    doc = futures[future]
+                    soumission = doc.get('submittedDate_s', '')
+                    metadata = future.result()
+                    if not metadata or metadata['statut_traitement'] == 'échec':
+                        premier_echec = min(premier_echec or soumission, soumission)
+                        # Document jamais téléchargé : noté en échec pour être redemandé
+                        if metadata and str(doc['docid']) not in connus:
+                            a_ecrire.append(metadata)
+                        continue
+                    plus_recent = max(plus_recent, soumission)
+                    if metadata['statut_traitement'] == 'inchangé':
+                        inchanges += 1
+                    else:
+                        a_ecrire.append(metadata)
+                        telecharges.append(metadata)
+                    a_synchroniser.append({
+                        **metadata,
+                        'version': int(doc.get('version_i', 0) or 0),
+                        'date_soumission': doc.get('submittedDate_s', '')
+                    })
+                    if len(a_synchroniser) >= DB_BATCH_SIZE:
+                        self._flush(a_ecrire, a_synchroniser)
+                
+                # Tout est en base avant que le curseur de la page ne soit sauvegardé
+                self._flush(a_ecrire, a_synchroniser)
+        
+        # Le watermark n'avance que si le moissonnage est allé à son terme, et
+        # jamais au-delà d'un échec : la borne étant incluse, le document en
+        # échec est redemandé à la prochaine synchronisation. Les résultats
+        # étant triés par docid, une limite atteinte laisse des documents plus
+        # anciens que `plus_recent` à moissonner : le watermark ne bouge pas
+        if premier_echec is not None:
+            plus_recent = min(plus_recent, premier_echec)
+        if incremental and plus_recent and self.moissonnage_complet:
+            self.db_manager.enregistrer_etat_sync('watermark', plus_recent)
+        elif incremental and not self.moissonnage_complet:
+            self.logger.info("Limite atteinte avant la fin du moissonnage : watermark inchangé")
+        
+        if not total:
+            self.logger.warning("Aucun document trouvé")
+        return self._throughput_stats(telecharges, total - inchanges, debut, inchanges)
     
-    def _search_hal_documents(self, limit):
-        """Recherche des documents dans HAL"""
-        url = "http://api.archives-ouvertes.fr/search/"
+    def _flush(self, a_ecrire, a_synchroniser):
+        """Écrit en base, en une transaction par lot, les documents en attente et leur état de synchronisation"""
+        if a_ecrire or a_synchroniser:
+            self.db_manager.enregistrer_lot(a_ecrire, a_synchroniser)
+        if a_ecrire:
+            self.logger.info(f"{len(a_ecrire)} documents ajoutés/mis à jour")
+        a_ecrire.clear()
+        a_synchroniser.clear()
+    
+    def _throughput_stats(self, telecharges, total, debut, inchanges=0):
+        """Calcule et journalise le débit d'un téléchargement"""
+        duree = max(time.perf_counter() - debut, 1e-9)
+        octets = sum(doc.get('taille_fichier', 0) for doc in telecharges)
+        stats = {
+            'documents': len(telecharges),
+            'inchanges': inchanges,
+            'echecs': total - len(telecharges),
+            'octets': octets,
+            'duree': duree,
+            'docs_par_seconde': len(telecharges) / duree,
+            'mo_par_seconde': octets / (1024 * 1024) / duree
+        }
+        self.logger.info(
+            f"Téléchargement terminé : {stats['documents']} documents "
+            f"({inchanges} inchangés, {stats['echecs']} échecs) en {duree:.1f}s - "
+            f"{stats['docs_par_seconde']:.2f} docs/s, {stats['mo_par_seconde']:.2f} Mo/s"
+        )
+        return stats
+    
+    def _search_params(self, since=None, echecs=()):
+        """Paramètres de recherche HAL communs à toutes les pages"""
         params = {
             "q": "*:*",
-            "rows": limit,
             "wt": "json",
+            "sort": "docid asc",  # cursorMark exige un tri sur la clé unique
             "fl": (
                 "docid,label_s,fileMain_s,uri_s,"
                 "authFullName_s,keyword_s,language_s,"
@@ -52,33 +217,124 @@ class HALDownloader:
                 "submitType_s,docType_s"
             )
         }
+        if since:
+            # Borne incluse : les documents déjà connus sont écartés ensuite
+            params["fq"] = f"submittedDate_tdate:[{since.replace(' ', 'T')}Z TO *]"
+            if echecs:
+                params["fq"] += f" OR docid:({' OR '.join(map(str, echecs))})"
+        return params
+    
+    def iter_hal_documents(self, limit=None, resume=True, since=None, echecs=()):
+        """Parcourt les résultats HAL page par page avec cursorMark
+        
+        Chaque page est une liste de documents. Le curseur est sauvegardé sur
+        disque quand le consommateur demande la page suivante, de sorte qu'un
+        moissonnage interrompu reprend à la première page non traitée.
+        """
+        params = self._search_params(since, echecs)
+        self.moissonnage_complet = False
+        etat = self._load_cursor(params) if resume else None
+        curseur = etat['curseur'] if etat else '*'
+        recus = etat['documents'] if etat else 0
+        if etat:
+            self.logger.info(f"Reprise du moissonnage après {recus} documents")
         
+        while limit is None or recus < limit:
+            rows = self.page_size if limit is None else min(self.page_size, limit - recus)
+            try:
+                with RECHERCHE_HAL.mesurer():
+                    response = self.session.get(
+                        self.api_url,
+                        params={**params, "rows": rows, "cursorMark": curseur},
+                        timeout=HAL_TIMEOUT
+                    )
+                    response.raise_for_status()
+                    data = response.json()
+            except Exception as e:
+                self.logger.error(f"Erreur lors de la recherche HAL (reprise possible) : {e}")
+                raise
+            
+            docs = data.get('response', {}).get('docs', [])
+            suivant = data.get('nextCursorMark', curseur)
+            if docs:
+                yield docs
+                recus += len(docs)
+            
+            # Solr renvoie le même curseur quand il n'y a plus de résultats ;
+            # une page incomplète est forcément la dernière
+            if len(docs) < rows or suivant == curseur:
+                self.moissonnage_complet = True
+                break
+            curseur = suivant
+            self._save_cursor(params, curseur, recus)
+        
+        self._clear_cursor()
+    
+    def _load_cursor(self, params):
+        """Charge le curseur d'un moissonnage interrompu pour la même requête"""
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json().get('response', {}).get('docs', [])
+            with open(self.cursor_file, 'r', encoding='utf-8') as f:
+                etat = json.load(f)
+        except FileNotFoundError:
+            return None
         except Exception as e:
-            self.logger.error(f"Erreur lors de la recherche HAL : {e}")
-            return []
+            self.logger.warning(f"Curseur illisible, moissonnage depuis le début : {e}")
+            return None
+        
+        if etat.get('requete') != params:
+            self.logger.warning("Curseur enregistré pour une autre requête, ignoré")
+            return None
+        return etat
     
-    def _process_document(self, doc):
-        """Traite un document"""
+    def _save_cursor(self, params, curseur, recus):
+        """Sauvegarde atomiquement la position du moissonnage"""
+        temporaire = f"{self.cursor_file}.tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump({'requete': params, 'curseur': curseur, 'documents': recus}, f)
+        os.replace(temporaire, self.cursor_file)
+    
+    def _clear_cursor(self):
+        """Supprime le curseur une fois le moissonnage terminé"""
+        if os.path.exists(self.cursor_file):
+            os.remove(self.cursor_file)
+    
+    def _process_document(self, doc, cleaned_metadata, connu=None):
+        """Traite un document et retourne ses métadonnées
+        
+        `cleaned_metadata` sont les métadonnées déjà nettoyées (None si le
+        nettoyage a échoué) et `connu` l'état de synchronisation enregistré
+        pour ce document ; le statut 'inchangé' indique que le fichier local
+        est toujours à jour, 'échec' que le PDF n'a pas pu être téléchargé ou
+        vérifié.
+        """
         doc_id = doc['docid']
         self.logger.info(f"Traitement du document {doc_id}")
         
-        # Extraction des métadonnées
-        metadata = self._extract_metadata(doc)
+        # Ni nouvelle version ni nouvelle soumission : aucune requête
+        if connu and os.path.exists(connu['chemin_local']) and not self._is_newer(doc, connu):
+            return {**connu, 'statut_traitement': 'inchangé'}
         
-        # Nettoyage des métadonnées
+        # Métadonnées invalides : déjà journalisé par le nettoyage
+        if cleaned_metadata is None:
+            return None
+        
+        # Téléchargement du PDF
         try:
-            cleaned_metadata = self.data_cleaner.clean_metadata(metadata)
-            
-            # Téléchargement du PDF
-            if self._download_pdf(doc['fileMain_s'], cleaned_metadata):
-                self.db_manager.ajouter_document(cleaned_metadata)
+            if self._download_pdf(doc['fileMain_s'], cleaned_metadata, connu):
+                return cleaned_metadata
+            return {**cleaned_metadata, 'statut_traitement': 'échec'}
                 
         except Exception as e:
-            self.logger.error(f"Erreur lors du nettoyage des métadonnées pour {doc_id}: {e}")
+            self.logger.error(f"Erreur lors du traitement du document {doc_id}: {e}")
+        return None
+    
+    def _is_newer(self, doc, connu):
+        """Indique si l'enregistrement HAL est plus récent que l'état connu"""
+        version = int(doc.get('version_i', 0) or 0)
+        return (
+            version > (connu['version'] or 0)
+            or doc.get('submittedDate_s', '') > (connu['date_soumission'] or '')
+        )
     
     def _extract_metadata(self, doc):
         """Extrait les métadonnées d'un document"""
@@ -112,54 +368,135 @@ class HALDownloader:
             self.logger.error(f"Erreur lors de la séparation auteurs/titre : {e}")
             return ('', label)
     
-    def _download_pdf(self, url, metadata):
-        """Télécharge un PDF"""
+    def _download_pdf(self, url, metadata, connu=None):
+        """Télécharge un PDF en flux, sans jamais le charger entièrement en mémoire
+        
+        Si le fichier est déjà présent, la requête est conditionnelle et un
+        contenu identique n'est pas réécrit (statut 'inchangé').
+        """
+        temporaire = None
+        headers = {}
+        debut = time.perf_counter()
+        local = connu if connu and os.path.exists(connu['chemin_local']) else None
+        if local:
+            if connu.get('etag'):
+                headers['If-None-Match'] = connu['etag']
+            if connu.get('last_modified'):
+                headers['If-Modified-Since'] = connu['last_modified']
+        
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            with self.session.get(url, headers=headers, timeout=HAL_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                metadata['etag'] = response.headers.get('ETag', '')
+                metadata['last_modified'] = response.headers.get('Last-Modified', '')
+                
+                if response.status_code == 304:
+                    self._mark_unchanged(metadata, connu)
+                    return True
+                
+                # Vérification du type de contenu
+                if 'application/pdf' not in response.headers.get('content-type', '').lower():
+                    self.logger.error(f"Type de contenu invalide pour {metadata['doc_id']}")
+                    return False
+                
+                # Écriture par blocs dans un fichier temporaire, hash calculé au fil de l'eau
+                sha256 = hashlib.sha256()
+                taille = 0
+                with tempfile.NamedTemporaryFile(
+                    dir=self.downloads_dir, suffix='.part', delete=False
+                ) as f:
+                    temporaire = f.name
+                    for bloc in response.iter_content(chunk_size=HAL_CHUNK_SIZE):
+                        f.write(bloc)
+                        sha256.update(bloc)
+                        taille += len(bloc)
             
-            # Vérification du type de contenu
-            if 'application/pdf' not in response.headers.get('content-type', '').lower():
-                self.logger.error(f"Type de contenu invalide pour {metadata['doc_id']}")
-                return False
+            hash_contenu = sha256.hexdigest()
+            # Contenu identique à la version locale : rien à réécrire ni à réindexer
+            if local and hash_contenu == local['hash_contenu']:
+                self._mark_unchanged(metadata, connu)
+                return True
             
-            # Vérification du PDF
-            pdf_content = response.content
-            if not self._verify_pdf(pdf_content, metadata):
+            # Contenu déjà vérifié sous un autre document : pas de nouvelle analyse
+            nombre_pages = self._pages_connues(hash_contenu)
+            if nombre_pages is not None:
+                metadata['nombre_pages'] = nombre_pages
+            elif not self._verify_pdf(temporaire, metadata, hash_contenu):
                 return False
             
-            # Sauvegarde du fichier
-            filename = f"{metadata['doc_id']}.pdf"
-            filepath = os.path.join(self.downloads_dir, filename)
-            
-            with open(filepath, 'wb') as f:
-                f.write(pdf_content)
+            # Mise en place atomique du fichier sous son hash (ou suppression du doublon)
+            filepath = self.blob_store.ajouter(
+                metadata['doc_id'], temporaire, hash_contenu, taille, metadata['nombre_pages']
+            )
+            temporaire = None
             
             # Mise à jour des métadonnées
             metadata.update({
                 'chemin_local': filepath,
-                'hash_contenu': self._calculate_hash(pdf_content),
-                'taille_fichier': len(pdf_content),
+                'hash_contenu': hash_contenu,
+                'taille_fichier': taille,
                 'statut_traitement': 'téléchargé'
             })
             
             self.logger.info(f"Document {metadata['doc_id']} téléchargé avec succès")
+            TELECHARGEMENT_PDF.observer(time.perf_counter() - debut)
+            OCTETS_TELECHARGES.incrementer(taille)
+            PDFS_TELECHARGES.incrementer()
             return True
             
         except Exception as e:
             self.logger.error(f"Erreur lors du téléchargement de {metadata['doc_id']} : {e}")
+            ECHECS_TELECHARGEMENT.incrementer()
             return False
+        finally:
+            if temporaire and os.path.exists(temporaire):
+                os.remove(temporaire)
+    
+    def _pages_connues(self, hash_contenu):
+        """Nombre de pages d'un contenu déjà vérifié, ou None
+        
+        La base est interrogée par l'index sur hash_contenu ; le magasin de
+        PDFs couvre les doublons du lot en cours, pas encore écrits en base.
+        """
+        for doc_id in self.db_manager.documents_par_hash(hash_contenu):
+            document = self.db_manager.obtenir_document(doc_id)
+            if document and document.get('nombre_pages'):
+                return document['nombre_pages']
+        blob = self.blob_store.obtenir(hash_contenu)
+        return blob['nombre_pages'] if blob else None
+    
+    def _mark_unchanged(self, metadata, connu):
+        """Marque un document dont le fichier local est toujours à jour"""
+        metadata['etag'] = metadata['etag'] or connu.get('etag', '')
+        metadata['last_modified'] = metadata['last_modified'] or connu.get('last_modified', '')
+        metadata.update({
+            'chemin_local': connu['chemin_local'],
+            'hash_contenu': connu['hash_contenu'],
+            'statut_traitement': 'inchangé'
+        })
+        self.logger.info(f"Document {metadata['doc_id']} inchangé")
     
-    def _verify_pdf(self, content, metadata):
-        """Vérifie la validité d'un PDF"""
+    def _verify_pdf(self, path, metadata, hash_contenu):
+        """Vérifie la validité d'un PDF enregistré sur disque
+        
+        L'analyse sert aussi à extraire le texte des pages, enregistré sous
+        `hash_contenu` : l'indexation n'aura pas à relire le PDF.
+        """
         try:
-            pdf = PyPDF2.PdfReader(BytesIO(content))
-            metadata['nombre_pages'] = len(pdf.pages)
+            # Un fichier ouvert (et non un chemin) évite que PyPDF2 le copie en mémoire
+            with open(path, 'rb') as f:
+                pdf = PyPDF2.PdfReader(f)
+                metadata['nombre_pages'] = len(pdf.pages)
+                if hash_contenu not in self.page_store:
+                    self._save_page_texts(pdf, metadata, hash_contenu)
             return True
         except Exception as e:
             self.logger.error(f"PDF invalide pour {metadata['doc_id']} : {e}")
             return False
     
-    def _calculate_hash(self, content):
-        """Calcule le hash SHA-256 du contenu"""
-        return hashlib.sha256(content).hexdigest() 
\ No newline at end of file
+    def _save_page_texts(self, pdf, metadata, hash_contenu):
+        """Enregistre le texte des pages ; en cas d'échec, l'indexation extraira le PDF"""
+        try:
+            self.page_store.ecrire(hash_contenu, textes_pages(pdf))
+        except Exception as e:
+            self.logger.warning(f"Texte non extrait pour {metadata['doc_id']} : {e}")
\ No newline at end of file
@@ -5,14 +5,18 @@ Point d'entrée principal du CHATBOT_RAG - Version simplifiée
 
 import os
 import sys
+import json
 from pathlib import Path
 
 # Ajouter le répertoire racine au PYTHONPATH
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.database.manager import DatabaseManager
+from src.database.blob_store import BlobStore
 from src.hal.downloader import HALDownloader
 from src.utils.logger import setup_logging
+from src.utils.metrics import metrics
+from src.config import LOGS_DIR, DOWNLOADS_DIR
 
 def afficher_menu():
     """Affiche le menu principal"""
@@ -20,8 +24,25 @@ def afficher_menu():
     print("1. Télécharger des documents")
     print("2. Voir les statistiques")
     print("3. Réinitialiser la base de données")
+    # « 4. Quitter » garde son numéro d'origine (saisies scriptées) ; q aussi quitte
+    print("5. Synchroniser (documents nouveaux ou modifiés)")
+    print("6. Vérifier les fichiers téléchargés")
     print("4. Quitter")
-    return input("Choisissez une option (1-4): ")
+    return input("Choisissez une option (1-6, q pour quitter): ").strip()
+
+def afficher_metriques():
+    """Affiche les métriques de la session et les exporte dans le dossier des logs"""
+    print("\n=== Performances de la session ===")
+    if not metrics.actif:
+        print("Métriques désactivées (METRICS_ENABLED)")
+        return
+    lignes = metrics.resume()
+    for ligne in lignes or ["Aucune mesure pour l'instant"]:
+        print(ligne)
+    (LOGS_DIR / 'metriques.prom').write_text(metrics.en_prometheus(), encoding='utf-8')
+    (LOGS_DIR / 'metriques.json').write_text(json.dumps(metrics.en_json(), indent=2, ensure_ascii=False),
+                                             encoding='utf-8')
+    print(f"Export : {LOGS_DIR / 'metriques.prom'} (Prometheus), {LOGS_DIR / 'metriques.json'}")
 
 def main():
     # Configuration du logging
@@ -49,6 +70,7 @@ def main():
                     print(f"Documents totaux: {stats['total_documents']}")
                     for statut, nombre in stats['documents_par_statut'].items():
                         print(f"{statut}: {nombre}")
+                    afficher_metriques()
                     
                 elif choix == "3":
                     confirmation = input("Êtes-vous sûr de vouloir réinitialiser ? (oui/non): ")
@@ -57,7 +79,23 @@ def main():
                         logger.info("Base de données réinitialisée")
                         print("Base de données réinitialisée avec succès.")
                     
-                elif choix == "4":
+                elif choix == "5":
+                    logger.info("Démarrage de la synchronisation incrémentale...")
+                    downloader = HALDownloader(db)
+                    stats = downloader.download_documents(limit=None, incremental=True)
+                    print(f"{stats['documents']} documents mis à jour, "
+                          f"{stats['inchanges']} inchangés, {stats['echecs']} échecs")
+                    logger.info("Synchronisation terminée")
+                    
+                elif choix == "6":
+                    # Contrôle des fichiers listés par le manifeste, hash recalculés
+                    store = BlobStore(DOWNLOADS_DIR)
+                    resultat = store.verifier(rehacher=True)
+                    store.close()
+                    print(f"{resultat['documents']} documents, {resultat['blobs']} fichiers distincts, "
+                          f"{len(resultat['manquants'])} manquants, {len(resultat['corrompus'])} corrompus")
+                    
+                elif choix in ("4", "q", "Q"):
                     logger.info("Arrêt de l'application")
                     print("Au revoir!")
                     break
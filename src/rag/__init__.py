@@ -2,6 +2,12 @@
 Module RAG (Retrieval-Augmented Generation) pour CHATBOT_RAG
 """
 
-from .system import RAGSystem
+__all__ = ['RAGSystem']
 
-__all__ = ['RAGSystem'] 
\ No newline at end of file
+
+def __getattr__(name):
+    # Import différé : `import src.rag.vector_store` ne charge pas system.py
+    if name == 'RAGSystem':
+        from .system import RAGSystem
+        return RAGSystem
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
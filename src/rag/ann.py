@@ -0,0 +1,165 @@
+"""
+Recherche des plus proches voisins : exacte et approchée (index IVF)
+"""
+
+import os
+import logging
+import numpy as np
+from src.config import IVF_NLIST, IVF_NPROBE
+
+logger = logging.getLogger(__name__)
+
+
+def top_k(scores, k, rangs=None):
+    """Les k meilleurs scores, triés, avec leurs rangs dans la matrice"""
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    positions = np.argpartition(-scores, k - 1)[:k]
+    positions = positions[np.argsort(-scores[positions])]
+    return (positions if rangs is None else rangs[positions]), scores[positions]
+
+
+def recherche_exacte(matrice, requete, k, supprimes=None):
+    """Produit scalaire avec toutes les lignes puis sélection des k meilleures"""
+    if not len(matrice):
+        return top_k(np.empty(0, dtype=np.float32), k)
+    scores = np.asarray(matrice @ requete)
+    if supprimes is not None:
+        scores[supprimes] = -np.inf
+    return top_k(scores, k)
+
+
+def recherche_candidats(matrice, requete, k, rangs, supprimes=None):
+    """Score exact des seules lignes candidates (triées) puis sélection des k meilleures"""
+    scores = np.asarray(matrice[rangs] @ requete) if len(rangs) else np.empty(0, dtype=np.float32)
+    if supprimes is not None:
+        scores[supprimes[rangs]] = -np.inf
+    return top_k(scores, k, rangs)
+
+
+def assigner(vecteurs, centroides, spherique=True, taille_bloc=65536):
+    """Centroïde le plus proche de chaque vecteur, par blocs
+
+    En mode sphérique, le plus similaire (cosinus) ; sinon le plus proche
+    en distance euclidienne : argmax de x·c - |c|²/2.
+    """
+    biais = 0 if spherique else -0.5 * np.einsum('ij,ij->i', centroides, centroides)
+    listes = np.empty(len(vecteurs), dtype=np.int32)
+    for debut in range(0, len(vecteurs), taille_bloc):
+        bloc = np.asarray(vecteurs[debut:debut + taille_bloc], dtype=np.float32)
+        listes[debut:debut + len(bloc)] = np.argmax(bloc @ centroides.T + biais, axis=1)
+    return listes
+
+
+def kmeans(vecteurs, nlist, iterations=10, graine=0, spherique=True):
+    """K-means entièrement vectorisé ; sphérique (cosinus) pour des vecteurs normalisés"""
+    aleatoire = np.random.default_rng(graine)
+    centroides = vecteurs[aleatoire.choice(len(vecteurs), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        listes = assigner(vecteurs, centroides, spherique)
+        ordre = np.argsort(listes, kind='stable')
+        effectifs = np.bincount(listes, minlength=nlist)
+        sommes = np.zeros_like(centroides)
+        non_vides = np.flatnonzero(effectifs)
+        sommes[non_vides] = np.add.reduceat(vecteurs[ordre], np.cumsum(effectifs)[non_vides] - effectifs[non_vides])
+        centroides = sommes if spherique else sommes / np.maximum(effectifs, 1)[:, None]
+        # Une liste vide repart d'un vecteur tiré au hasard
+        vides = np.flatnonzero(effectifs == 0)
+        centroides[vides] = vecteurs[aleatoire.choice(len(vecteurs), len(vides))]
+        if spherique:
+            centroides /= np.maximum(np.linalg.norm(centroides, axis=1, keepdims=True), 1e-12)
+    return centroides.astype(np.float32)
+
+
+class IVFIndex:
+    """Index approché par listes inversées (IVF) sur la matrice d'un magasin
+
+    Les vecteurs sont répartis entre `nlist` centroïdes appris par k-means ;
+    une requête n'est comparée qu'aux vecteurs des `nprobe` listes les plus
+    proches. `nprobe` règle le compromis rappel/latence à chaque requête.
+    Les centroïdes et la liste de chaque ligne sont persistés dans le
+    dossier du magasin ; les nouvelles lignes sont simplement affectées à
+    leur liste, sans réentraînement.
+    """
+
+    def __init__(self, directory, nlist=IVF_NLIST, nprobe=IVF_NPROBE):
+        self.chemin_centroides = os.path.join(str(directory), 'ivf_centroides.npz')
+        self.chemin_listes = os.path.join(str(directory), 'ivf_listes.i32')
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroides = None
+        self.taille_entrainement = 0  # Lignes au moment de l'entraînement
+        self.listes = np.empty(0, dtype=np.int32)
+        if os.path.exists(self.chemin_centroides):
+            with np.load(self.chemin_centroides) as sauvegarde:
+                self.centroides = sauvegarde['centroides']
+                self.taille_entrainement = int(sauvegarde['taille'])
+        if self.centroides is not None and os.path.exists(self.chemin_listes):
+            self.listes = np.fromfile(self.chemin_listes, dtype=np.int32)
+        self._ordre = None  # Lignes triées par liste, reconstruites à la demande
+        self._bornes = None
+        self._ajouts = []  # (lignes, listes) ajoutées depuis la dernière reconstruction
+        self._taille_ajouts = 0
+
+    @property
+    def entraine(self):
+        return self.centroides is not None
+
+    def entrainer(self, matrice, echantillon_par_liste=64, iterations=10, graine=0):
+        """Apprend les centroïdes sur un échantillon puis affecte toutes les lignes"""
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(matrice))))
+        nlist = min(nlist, len(matrice))
+        aleatoire = np.random.default_rng(graine)
+        taille = min(len(matrice), nlist * echantillon_par_liste)
+        echantillon = np.asarray(matrice[np.sort(aleatoire.choice(len(matrice), taille, replace=False))])
+        self.centroides = kmeans(echantillon, nlist, iterations, graine)
+        self.listes = assigner(matrice, self.centroides)
+        self.taille_entrainement = len(matrice)
+        np.savez(self.chemin_centroides, centroides=self.centroides, taille=self.taille_entrainement)
+        self.listes.tofile(self.chemin_listes)
+        self._reconstruire()
+        logger.info(f"Index IVF entraîné : {nlist} listes pour {len(matrice)} vecteurs")
+
+    def synchroniser(self, matrice):
+        """Affecte à leur liste les lignes ajoutées à la matrice depuis le dernier appel"""
+        debut = len(self.listes)
+        if not self.entraine or debut >= len(matrice):
+            return
+        nouvelles = assigner(matrice[debut:], self.centroides)
+        with open(self.chemin_listes, 'ab') as f:
+            f.truncate(debut * 4)
+            f.write(nouvelles.tobytes())
+        self.listes = np.concatenate([self.listes, nouvelles])
+        if self._ordre is not None:
+            self._ajouts.append((np.arange(debut, len(matrice)), nouvelles))
+            self._taille_ajouts += len(nouvelles)
+
+    def compacter(self, gardes):
+        """Renumérote les lignes après compactage de la matrice"""
+        if not self.entraine:
+            return
+        self.listes = self.listes[gardes]
+        self.listes.tofile(self.chemin_listes)
+        self._ordre = None
+
+    def _reconstruire(self):
+        self._ordre = np.argsort(self.listes, kind='stable').astype(np.int64)
+        self._bornes = np.concatenate([[0], np.cumsum(np.bincount(self.listes, minlength=len(self.centroides)))])
+        self._ajouts = []
+        self._taille_ajouts = 0
+
+    def candidats(self, requete, nprobe=None):
+        """Lignes des `nprobe` listes les plus proches de la requête, triées"""
+        if self._ordre is None or self._taille_ajouts > 0.1 * len(self._ordre):
+            self._reconstruire()
+        nprobe = min(nprobe or self.nprobe, len(self.centroides))
+        sondees = np.argpartition(-(self.centroides @ requete), nprobe - 1)[:nprobe]
+        morceaux = [self._ordre[self._bornes[liste]:self._bornes[liste + 1]] for liste in sondees]
+        for lignes, listes in self._ajouts:
+            morceaux.append(lignes[np.isin(listes, sondees)])
+        return np.sort(np.concatenate(morceaux))
+
+    def rechercher(self, matrice, requete, k, nprobe=None, supprimes=None):
+        """Recherche approchée : score exact des seuls candidats des listes sondées"""
+        return recherche_candidats(matrice, requete, k, self.candidats(requete, nprobe), supprimes)
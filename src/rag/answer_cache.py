@@ -0,0 +1,132 @@
+"""
+Cache des réponses du système RAG : question exacte puis question proche
+"""
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from src.config import (
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD
+)
+
+
+def normaliser_question(question):
+    """Forme canonique d'une question : casse, accents composés, espaces et ponctuation finale"""
+    question = unicodedata.normalize('NFKC', question).casefold()
+    return re.sub(r'\s+', ' ', question).strip(' ?!.')
+
+
+class AnswerCache:
+    """Cache à deux niveaux des réponses, invalidé à chaque changement de l'index
+
+    1. LRU sur la question normalisée ;
+    2. cache sémantique : la réponse d'une question dont l'embedding a une
+       similarité cosinus d'au moins `seuil` avec la nouvelle est réutilisée.
+    Les entrées expirent après `ttl` secondes. Chaque consultation donne la
+    version courante de l'index ; si elle a changé, tout le cache est vidé.
+    """
+
+    def __init__(self, taille=ANSWER_CACHE_SIZE, taille_semantique=SEMANTIC_CACHE_SIZE,
+                 ttl=ANSWER_CACHE_TTL, seuil=SEMANTIC_CACHE_THRESHOLD):
+        self.taille = taille
+        self.taille_semantique = taille_semantique
+        self.ttl = ttl
+        self.seuil = seuil
+        self.hits_exacts = 0
+        self.hits_semantiques = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self.vider()
+
+    def vider(self):
+        """Supprime toutes les entrées"""
+        self._exact = OrderedDict()  # question normalisée -> (réponse, expiration)
+        self._vecteurs = None  # Embeddings des questions, une ligne par entrée sémantique
+        self._reponses = [None] * self.taille_semantique
+        self._expirations = np.full(self.taille_semantique, -np.inf)
+        self._acces = np.zeros(self.taille_semantique)
+
+    def _verifier_version(self, version):
+        if version != self._version:
+            self.vider()
+            self._version = version
+
+    @staticmethod
+    def _normer(vecteur):
+        vecteur = np.asarray(vecteur, dtype=np.float32)
+        norme = np.linalg.norm(vecteur)
+        return vecteur / norme if norme else vecteur
+
+    def obtenir(self, question, version, embedding=None):
+        """Réponse en cache pour cette question, ou None
+
+        `embedding` peut être une fonction appelée seulement si le niveau
+        exact échoue, pour ne pas vectoriser une question déjà connue.
+        """
+        cle = normaliser_question(question)
+        maintenant = time.monotonic()
+        with self._lock:
+            self._verifier_version(version)
+            entree = self._exact.get(cle)
+            if entree and entree[1] > maintenant:
+                self._exact.move_to_end(cle)
+                self.hits_exacts += 1
+                return entree[0]
+            if entree:
+                del self._exact[cle]
+            if self._vecteurs is None or embedding is None:
+                self.misses += 1
+                return None
+
+        vecteur = self._normer(embedding() if callable(embedding) else embedding)
+        with self._lock:
+            if version != self._version or self._vecteurs is None:
+                self.misses += 1
+                return None
+            scores = self._vecteurs @ vecteur
+            scores[self._expirations <= maintenant] = -np.inf
+            meilleur = int(np.argmax(scores))
+            if scores[meilleur] < self.seuil:
+                self.misses += 1
+                return None
+            self._acces[meilleur] = maintenant
+            self.hits_semantiques += 1
+            return self._reponses[meilleur]
+
+    def ajouter(self, question, reponse, version, embedding=None):
+        """Met une réponse en cache pour la version de l'index qui l'a produite"""
+        maintenant = time.monotonic()
+        if embedding is not None:
+            embedding = self._normer(embedding() if callable(embedding) else embedding)
+        with self._lock:
+            self._verifier_version(version)
+            cle = normaliser_question(question)
+            self._exact[cle] = (reponse, maintenant + self.ttl)
+            self._exact.move_to_end(cle)
+            while len(self._exact) > self.taille:
+                self._exact.popitem(last=False)
+
+            if embedding is None or not self.taille_semantique:
+                return
+            if self._vecteurs is None:
+                self._vecteurs = np.zeros((self.taille_semantique, len(embedding)), dtype=np.float32)
+            # Place libre ou expirée, sinon l'entrée la moins récemment utilisée
+            libres = np.flatnonzero(self._expirations <= maintenant)
+            place = int(libres[0]) if len(libres) else int(np.argmin(self._acces))
+            self._vecteurs[place] = embedding
+            self._reponses[place] = reponse
+            self._expirations[place] = maintenant + self.ttl
+            self._acces[place] = maintenant
+
+    def statistiques(self):
+        total = self.hits_exacts + self.hits_semantiques + self.misses
+        return {
+            'hits_exacts': self.hits_exacts,
+            'hits_semantiques': self.hits_semantiques,
+            'misses': self.misses,
+            'taux_succes': (self.hits_exacts + self.hits_semantiques) / total if total else 0.0
+        }
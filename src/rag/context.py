@@ -0,0 +1,196 @@
+"""
+Préparation du contexte envoyé au LLM : fusion des chunks qui se
+chevauchent, suppression des quasi-doublons et budget de tokens
+"""
+
+import re
+import logging
+import threading
+from src.config import (
+    CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD, CONTEXT_MIN_OVERLAP, CONTEXT_TOKENIZER
+)
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TOKENS_CONTEXTE = metrics.compteur('rag_tokens_contexte_total', "Tokens d'extraits envoyés au LLM")
+TOKENS_ECONOMISES = metrics.compteur('rag_tokens_economises_total', "Tokens d'extraits économisés")
+
+SEPARATEUR = "\n\n"  # Entre deux extraits dans le prompt, comme la chaîne "stuff"
+
+
+def estimer_tokens(texte):
+    """Approximation sans tokenizer : environ 4 caractères par token"""
+    return (len(texte) + 3) // 4
+
+
+def compteur_tokens(encodage=CONTEXT_TOKENIZER):
+    """Fonction texte -> nombre de tokens, avec tiktoken s'il est disponible"""
+    try:
+        import tiktoken
+        encodeur = tiktoken.get_encoding(encodage)
+    except Exception as e:
+        logger.warning(f"tiktoken indisponible ({e}), tokens estimés à 4 caractères par token")
+        return estimer_tokens
+    return lambda texte: len(encodeur.encode(texte, disallowed_special=()))
+
+
+def _meme_page(a, b):
+    return 'source' in a and a.get('source') == b.get('source') and a.get('page') == b.get('page')
+
+
+def _raccorder(a, b, chevauchement_min):
+    """(texte, start_index) de deux chunks d'une même page mis bout à bout, ou None s'ils sont disjoints
+
+    Avec les positions du découpage (start_index), les chunks contigus ou
+    qui se chevauchent sont recollés exactement ; sans elles, le
+    chevauchement est cherché dans le texte (fin de l'un = début de l'autre).
+    """
+    (texte_a, meta_a), (texte_b, meta_b) = a, b
+    if 'start_index' in meta_a and 'start_index' in meta_b:
+        if meta_b['start_index'] < meta_a['start_index']:
+            (texte_a, meta_a), (texte_b, meta_b) = (texte_b, meta_b), (texte_a, meta_a)
+        ecart = meta_b['start_index'] - (meta_a['start_index'] + len(texte_a))
+        if ecart > 2:  # Au plus les blancs retirés par le découpage
+            return None
+        texte = texte_a + " " + texte_b if ecart > 0 else texte_a + texte_b[min(-ecart, len(texte_b)):]
+        return texte, meta_a['start_index']
+    if texte_b in texte_a:
+        return texte_a, None
+    if texte_a in texte_b:
+        return texte_b, None
+    for gauche, droite in ((texte_a, texte_b), (texte_b, texte_a)):
+        for taille in range(min(len(gauche), len(droite)) - 1, chevauchement_min - 1, -1):
+            if gauche.endswith(droite[:taille]):
+                return gauche + droite[taille:], None
+    return None
+
+
+def _empreinte(texte):
+    """Triplets de mots, pour mesurer la ressemblance de deux extraits"""
+    mots = re.findall(r'\w+', texte.casefold())
+    return {tuple(mots[i:i + 3]) for i in range(max(1, len(mots) - 2))}
+
+
+class ContextPacker:
+    """Choisit les extraits envoyés au LLM dans un budget de tokens
+
+    Les chunks arrivent par pertinence décroissante. Ceux d'une même page
+    qui se touchent ou se chevauchent sont fusionnés (le recouvrement de
+    100 caractères du découpage n'est envoyé qu'une fois), les
+    quasi-doublons (similarité de Jaccard des triplets de mots d'au moins
+    `seuil_doublons`) sont retirés, puis les extraits sont ajoutés par
+    pertinence tant qu'ils tiennent dans `budget` tokens.
+    """
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, seuil_doublons=CONTEXT_DUPLICATE_THRESHOLD,
+                 chevauchement_min=CONTEXT_MIN_OVERLAP, compter=None):
+        self.budget = budget
+        self.seuil_doublons = seuil_doublons
+        self.chevauchement_min = chevauchement_min
+        self._compter = compter
+        self.requetes = 0
+        self.tokens_avant = 0
+        self.tokens_apres = 0
+        self._lock = threading.Lock()
+
+    @property
+    def compter(self):
+        """Compteur de tokens, chargé à la première requête"""
+        if self._compter is None:
+            self._compter = compteur_tokens()
+        return self._compter
+
+    def fusionner(self, chunks):
+        """Fusionne les chunks contigus d'une même page, au rang du plus pertinent"""
+        fusionnes = []
+        for texte, metadata in chunks:
+            courant, place = (texte, metadata), len(fusionnes)
+            i = 0
+            while i < len(fusionnes):
+                existant = fusionnes[i]
+                raccord = _meme_page(existant[1], courant[1]) and _raccorder(existant, courant, self.chevauchement_min)
+                if not raccord:
+                    i += 1
+                    continue
+                # Métadonnées du plus pertinent des deux
+                texte, debut = raccord
+                metadata = dict(existant[1] if i < place else courant[1])
+                if debut is not None:
+                    metadata['start_index'] = debut
+                courant = (texte, metadata)
+                del fusionnes[i]
+                place = min(place, i)
+                # Le texte agrandi peut maintenant toucher un extrait déjà vu
+                i = 0
+            fusionnes.insert(place, courant)
+        return fusionnes
+
+    def dedoublonner(self, chunks):
+        """Retire les extraits presque identiques à un extrait plus pertinent"""
+        gardes, empreintes = [], []
+        for texte, metadata in chunks:
+            empreinte = _empreinte(texte)
+            if any(len(empreinte & autre) / len(empreinte | autre) >= self.seuil_doublons for autre in empreintes):
+                continue
+            gardes.append((texte, metadata))
+            empreintes.append(empreinte)
+        return gardes
+
+    def emballer(self, chunks):
+        """Extraits à envoyer au LLM et statistiques de tokens de la requête
+
+        `chunks` et le résultat sont des listes de (texte, métadonnées) par
+        pertinence décroissante. Le premier extrait est tronqué s'il dépasse
+        seul le budget.
+        """
+        chunks = list(chunks)
+        tokens_avant = self.compter(SEPARATEUR.join(texte for texte, _ in chunks))
+        gardes, utilises = [], 0
+        for texte, metadata in self.dedoublonner(self.fusionner(chunks)):
+            tokens = self.compter(texte) + (self.compter(SEPARATEUR) if gardes else 0)
+            if utilises + tokens > self.budget:
+                if gardes:
+                    continue  # Un extrait moins pertinent mais plus court peut encore tenir
+                texte = self._tronquer(texte)
+                tokens = self.compter(texte)
+            gardes.append((texte, metadata))
+            utilises += tokens
+        tokens_apres = self.compter(SEPARATEUR.join(texte for texte, _ in gardes))
+
+        with self._lock:
+            self.requetes += 1
+            self.tokens_avant += tokens_avant
+            self.tokens_apres += tokens_apres
+        TOKENS_CONTEXTE.incrementer(tokens_apres)
+        TOKENS_ECONOMISES.incrementer(tokens_avant - tokens_apres)
+        statistiques = {
+            'chunks_avant': len(chunks),
+            'chunks_apres': len(gardes),
+            'tokens_avant': tokens_avant,
+            'tokens_apres': tokens_apres,
+            'tokens_economises': tokens_avant - tokens_apres
+        }
+        logger.debug(f"Contexte : {tokens_apres} tokens au lieu de {tokens_avant} "
+                     f"({len(gardes)} extraits sur {len(chunks)})")
+        return gardes, statistiques
+
+    def _tronquer(self, texte):
+        """Début du texte tenant dans le budget, coupé par dichotomie"""
+        bas, haut = 0, len(texte)
+        while bas < haut:
+            milieu = (bas + haut + 1) // 2
+            if self.compter(texte[:milieu]) <= self.budget:
+                bas = milieu
+            else:
+                haut = milieu - 1
+        return texte[:bas]
+
+    def statistiques(self):
+        return {
+            'requetes': self.requetes,
+            'tokens_avant': self.tokens_avant,
+            'tokens_apres': self.tokens_apres,
+            'tokens_economises': self.tokens_avant - self.tokens_apres,
+            'taux_economie': 1 - self.tokens_apres / self.tokens_avant if self.tokens_avant else 0.0
+        }
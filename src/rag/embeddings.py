@@ -0,0 +1,273 @@
+"""
+Embeddings pour le système RAG : backends interchangeables et cache persistant
+"""
+
+import re
+import zlib
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from src.config import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIMENSION, EMBEDDING_WORKERS,
+    EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB
+)
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+VECTORISATION = metrics.histogramme('embeddings_secondes', "Vectorisation d'un lot de textes")
+TEXTES_VECTORISES = metrics.compteur('embeddings_textes_total', "Textes vectorisés (hors cache)")
+
+MOTS = re.compile(r"\w+", re.UNICODE)
+
+
+class EmbeddingBackend(ABC):
+    """Interface commune des backends d'embeddings (celle des Embeddings LangChain)"""
+
+    model_name = None  # Identifie les vecteurs produits, dans le cache comme dans l'index
+
+    @abstractmethod
+    def embed_documents(self, texts):
+        """Vectorise une liste de textes"""
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _vectoriser(textes, dimension):
+    """Projette des textes sur `dimension` composantes par hachage signé des termes
+
+    Exécuté dans les processus du pool pour les gros lots. Les termes (mots
+    et paires de mots consécutifs) sont hachés avec CRC32, stable d'un
+    processus à l'autre contrairement à hash().
+    """
+    # Chaque terme distinct du lot n'est haché qu'une fois
+    vocabulaire = {}
+    identifiants, longueurs = [], []
+    for texte in textes:
+        mots = MOTS.findall(texte.lower())
+        termes = mots + [f"{a} {b}" for a, b in zip(mots, mots[1:])]
+        identifiants.extend(vocabulaire.setdefault(terme, len(vocabulaire)) for terme in termes)
+        longueurs.append(len(termes))
+
+    hashes = np.fromiter((zlib.crc32(terme.encode('utf-8')) for terme in vocabulaire),
+                         dtype=np.int64, count=len(vocabulaire))
+    identifiants = np.asarray(identifiants, dtype=np.int64)
+    lignes = np.repeat(np.arange(len(textes), dtype=np.int64), longueurs)
+    colonnes = (hashes % dimension)[identifiants]
+    signes = np.where(hashes & 0x80000000, 1.0, -1.0)[identifiants]
+
+    matrice = np.bincount(
+        lignes * dimension + colonnes, weights=signes, minlength=len(textes) * dimension
+    ).reshape(len(textes), dimension)
+
+    # Fréquences amorties puis normalisation L2 : le produit scalaire est le cosinus
+    matrice = np.sign(matrice) * np.log1p(np.abs(matrice))
+    normes = np.linalg.norm(matrice, axis=1, keepdims=True)
+    np.divide(matrice, normes, out=matrice, where=normes > 0)
+    return matrice.astype(np.float32)
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """Backend local, sans modèle ni réseau : projection des termes par hachage
+
+    Moins fin qu'un modèle neuronal mais déterministe et très rapide ; les
+    lots de plus de `lot_min` textes sont répartis sur `workers` processus.
+    """
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION, workers=EMBEDDING_WORKERS, lot_min=2048):
+        self.dimension = dimension
+        self.workers = workers or 1
+        self.lot_min = lot_min
+        self.model_name = f"hashing-{dimension}"
+        self._pool = None
+
+    def embed_matrix(self, texts):
+        """Vectorise un lot de textes en une matrice float32 (n, dimension)"""
+        texts = list(texts)
+        TEXTES_VECTORISES.incrementer(len(texts))
+        with VECTORISATION.mesurer():
+            if self.workers < 2 or len(texts) < self.lot_min:
+                return _vectoriser(texts, self.dimension)
+
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            taille = -(-len(texts) // self.workers)
+            morceaux = [texts[debut:debut + taille] for debut in range(0, len(texts), taille)]
+            return np.vstack(list(self._pool.map(_vectoriser, morceaux, [self.dimension] * len(morceaux))))
+
+    def embed_documents(self, texts):
+        return self.embed_matrix(texts).tolist()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def creer_embeddings(backend=EMBEDDING_BACKEND):
+    """Instancie le backend d'embeddings choisi dans la configuration
+
+    Les backends distants sont placés derrière le cache disque ; le backend
+    local est assez rapide pour s'en passer.
+    """
+    if backend == 'hashing':
+        return HashingEmbeddings()
+    if backend == 'openai':
+        from langchain_community.embeddings import OpenAIEmbeddings
+        return CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL), model_name=EMBEDDING_MODEL)
+    raise ValueError(f"Backend d'embeddings inconnu : {backend}")
+
+
+class CachedEmbeddings(EmbeddingBackend):
+    """Cache disque placé devant n'importe quel backend d'embeddings
+
+    La clé est le hash du nom du modèle et du texte : un chunk déjà vectorisé
+    (boilerplate commun à plusieurs PDFs, reprise après un crash) n'est jamais
+    renvoyé au backend. Les vecteurs sont stockés en float32 dans SQLite et
+    les moins récemment utilisés sont évincés au-delà de `max_mb` Mo.
+    Expose embed_documents/embed_query comme les Embeddings LangChain.
+    """
+
+    def __init__(self, backend, model_name, cache_path=EMBEDDING_CACHE_PATH,
+                 max_mb=EMBEDDING_CACHE_MAX_MB):
+        self.backend = backend
+        self.model_name = model_name
+        self.max_octets = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                cle TEXT PRIMARY KEY,
+                vecteur BLOB NOT NULL,
+                dernier_acces REAL NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_embeddings_acces ON embeddings(dernier_acces)'
+        )
+        self._conn.commit()
+        self.taille_octets = self._conn.execute(
+            'SELECT COALESCE(SUM(LENGTH(vecteur)), 0) FROM embeddings'
+        ).fetchone()[0]
+
+    def _cle(self, texte):
+        return hashlib.sha256(f"{self.model_name}\0{texte}".encode('utf-8')).hexdigest()
+
+    def embed_documents(self, texts):
+        """Vectorise une liste de textes en ne calculant que les absents du cache"""
+        cles = [self._cle(texte) for texte in texts]
+        # Un texte répété dans le lot ne compte qu'une fois
+        uniques = set(cles)
+        with self._lock:
+            trouves = self._lire(uniques)
+            absents = len(uniques) - len(trouves)
+            self.hits += len(trouves)
+            self.misses += absents
+
+        # Textes absents du cache, dédoublonnés avant l'appel au backend
+        manquants = {}
+        for cle, texte in zip(cles, texts):
+            if cle not in trouves:
+                manquants.setdefault(cle, texte)
+
+        if manquants:
+            if isinstance(self.backend, EmbeddingBackend):
+                # Backend local, déjà instrumenté
+                vecteurs = self.backend.embed_documents(list(manquants.values()))
+            else:
+                TEXTES_VECTORISES.incrementer(len(manquants))
+                with VECTORISATION.mesurer():
+                    vecteurs = self.backend.embed_documents(list(manquants.values()))
+            nouveaux = {
+                cle: np.asarray(vecteur, dtype=np.float32)
+                for cle, vecteur in zip(manquants, vecteurs)
+            }
+            with self._lock:
+                self._ecrire(nouveaux)
+            trouves.update(nouveaux)
+
+        return [trouves[cle].tolist() for cle in cles]
+
+    def embed_query(self, text):
+        """Vectorise une question (même cache que les documents)"""
+        return self.embed_documents([text])[0]
+
+    def _lire(self, cles, taille_lot=500):
+        """Lit les vecteurs présents et rafraîchit leur date d'accès"""
+        trouves = {}
+        cles = list(cles)
+        for debut in range(0, len(cles), taille_lot):
+            lot = cles[debut:debut + taille_lot]
+            cursor = self._conn.execute(
+                f"SELECT cle, vecteur FROM embeddings WHERE cle IN ({', '.join('?' * len(lot))})", lot
+            )
+            for cle, vecteur in cursor:
+                trouves[cle] = np.frombuffer(vecteur, dtype=np.float32)
+        if trouves:
+            maintenant = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    'UPDATE embeddings SET dernier_acces = ? WHERE cle = ?',
+                    [(maintenant, cle) for cle in trouves]
+                )
+        return trouves
+
+    def _ecrire(self, vecteurs):
+        """Enregistre de nouveaux vecteurs puis évince si le cache est trop gros"""
+        maintenant = time.time()
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (cle, vecteur, dernier_acces) VALUES (?, ?, ?)',
+                [(cle, vecteur.tobytes(), maintenant) for cle, vecteur in vecteurs.items()]
+            )
+        self.taille_octets += sum(vecteur.nbytes for vecteur in vecteurs.values())
+        if self.taille_octets > self.max_octets:
+            self._evincer()
+
+    def _evincer(self):
+        """Supprime les vecteurs les moins récemment utilisés jusqu'à 90 % de la limite"""
+        a_liberer = self.taille_octets - int(self.max_octets * 0.9)
+        supprimes = []
+        cursor = self._conn.execute(
+            'SELECT cle, LENGTH(vecteur) FROM embeddings ORDER BY dernier_acces'
+        )
+        for cle, taille in cursor:
+            if a_liberer <= 0:
+                break
+            supprimes.append((cle,))
+            a_liberer -= taille
+            self.taille_octets -= taille
+        cursor.close()
+        with self._conn:
+            self._conn.executemany('DELETE FROM embeddings WHERE cle = ?', supprimes)
+        logger.info(f"Cache d'embeddings : {len(supprimes)} vecteurs évincés")
+
+    def statistiques(self):
+        """Taux de succès du cache depuis la dernière remise à zéro"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'taux_succes': self.hits / total if total else 0.0,
+            'taille_mo': self.taille_octets / (1024 * 1024)
+        }
+
+    def reset_statistiques(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        if hasattr(self.backend, 'close'):
+            self.backend.close()
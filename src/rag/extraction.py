@@ -0,0 +1,215 @@
+"""
+Extraction parallèle du texte des PDFs pour le système RAG
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+import tempfile
+import multiprocessing
+from collections import deque
+from itertools import groupby
+from multiprocessing.connection import wait
+import PyPDF2
+from src.config import EXTRACTION_WORKERS, EXTRACTION_TIMEOUT
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION = metrics.histogramme('pdf_extraction_secondes', "Extraction du texte d'un PDF")
+PAGES_EXTRAITES = metrics.compteur('pdf_pages_extraites_total', "Pages de PDF extraites")
+TEXTES_EN_CACHE = metrics.compteur('pdf_textes_en_cache_total', "PDFs lus dans le magasin de textes, sans analyse")
+
+
+class PageTextStore:
+    """Textes des pages des PDFs déjà analysés, un fichier par hash_contenu
+
+    Chaque PDF est enregistré sous <dossier>/<2 premiers caractères du
+    hash>/<hash>.json.gz (liste JSON des textes de ses pages, compressée).
+    Deux fichiers au contenu identique partagent la même entrée.
+    """
+
+    def __init__(self, dossier):
+        self.dossier = str(dossier)
+
+    def chemin(self, hash_contenu):
+        return os.path.join(self.dossier, hash_contenu[:2], f"{hash_contenu}.json.gz")
+
+    def __contains__(self, hash_contenu):
+        return os.path.exists(self.chemin(hash_contenu))
+
+    def lire(self, hash_contenu):
+        """Textes des pages, ou None si le PDF n'a pas encore été analysé"""
+        try:
+            with gzip.open(self.chemin(hash_contenu), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Textes illisibles pour {hash_contenu}, le PDF sera analysé : {e}")
+            return None
+
+    def ecrire(self, hash_contenu, textes):
+        """Enregistre les textes de façon atomique (écritures concurrentes possibles)"""
+        chemin = self.chemin(hash_contenu)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(chemin), suffix='.tmp', delete=False) as f:
+            temporaire = f.name
+            try:
+                with gzip.open(f, 'wt', encoding='utf-8', compresslevel=6) as z:
+                    json.dump(textes, z, ensure_ascii=False)
+            except BaseException:
+                f.close()
+                os.remove(temporaire)
+                raise
+        os.replace(temporaire, chemin)
+
+    def supprimer(self, hash_contenu):
+        try:
+            os.remove(self.chemin(hash_contenu))
+        except FileNotFoundError:
+            pass
+
+
+def textes_pages(reader):
+    """Texte de chaque page d'un PDF déjà ouvert par PyPDF2"""
+    return [page.extract_text() or '' for page in reader.pages]
+
+
+def extraire_pages(chemin):
+    """Extrait le texte de chaque page d'un PDF (exécuté dans un processus du pool)
+
+    Retourne une liste de (texte, métadonnées), avec les mêmes métadonnées
+    que PyPDFLoader : {'source': chemin, 'page': numéro à partir de 0}.
+    """
+    with open(chemin, 'rb') as f:
+        return [(texte, {'source': chemin, 'page': numero}) for numero, texte in enumerate(textes_pages(PyPDF2.PdfReader(f)))]
+
+
+def iter_pages_cache(fichiers, store, **options):
+    """Comme iter_pages, en lisant d'abord le magasin de textes
+
+    `fichiers` associe chaque chemin au hash de son contenu. Les PDFs
+    absents du magasin sont analysés par iter_pages, puis leurs textes
+    y sont enregistrés pour les indexations suivantes.
+    """
+    a_extraire = {}
+    for chemin, hash_contenu in fichiers.items():
+        textes = store.lire(hash_contenu)
+        if textes is None:
+            a_extraire[chemin] = hash_contenu
+            continue
+        TEXTES_EN_CACHE.incrementer()
+        yield from ((texte, {'source': chemin, 'page': numero}) for numero, texte in enumerate(textes))
+
+    # iter_pages rend les pages d'un même fichier à la suite
+    for chemin, pages in groupby(iter_pages(list(a_extraire), **options), key=lambda page: page[1]['source']):
+        textes = []
+        for page in pages:
+            textes.append(page[0])
+            yield page
+        try:
+            store.ecrire(a_extraire[chemin], textes)
+        except OSError as e:
+            logger.warning(f"Textes de {chemin} non enregistrés : {e}")
+
+
+class _Travailleur:
+    """Processus d'extraction dont on garde le handle : un fichier à la fois
+
+    Le fichier en cours est connu : une panne ou un dépassement de délai
+    est imputé au bon PDF, et le processus peut être arrêté sans toucher
+    aux autres.
+    """
+
+    def __init__(self, contexte):
+        self.conn, enfant = contexte.Pipe()
+        self.processus = contexte.Process(target=_boucle_extraction, args=(enfant,), daemon=True)
+        self.processus.start()
+        enfant.close()
+        self.chemin = None
+        self.debut = None
+
+    def soumettre(self, chemin):
+        self.conn.send(chemin)
+        self.chemin = chemin
+        self.debut = time.monotonic()
+
+    def arreter(self):
+        if self.processus.is_alive():
+            self.processus.terminate()
+        self.processus.join()
+        self.conn.close()
+
+
+def _boucle_extraction(conn):
+    """Boucle d'un processus d'extraction : un chemin reçu, ses pages renvoyées"""
+    while True:
+        try:
+            chemin = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, extraire_pages(chemin)))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+def iter_pages(chemins, max_workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT, echecs=None):
+    """Génère les pages des PDFs au fil de leur extraction sur tous les cœurs
+
+    Il n'y a jamais plus d'un fichier en cours par processus, ce qui borne
+    la mémoire quel que soit le nombre de PDFs. Un fichier illisible est
+    ignoré ; un fichier dont l'extraction dépasse `timeout` secondes ou fait
+    tomber son processus est abandonné sans bloquer les autres (le
+    processus est remplacé). Les chemins abandonnés sont ajoutés à
+    l'ensemble `echecs` s'il est fourni.
+    """
+    echecs = set() if echecs is None else echecs
+    max_workers = max_workers or os.cpu_count() or 1
+    contexte = multiprocessing.get_context()
+    restants = deque(chemins)
+    libres = []
+    en_cours = {}  # connexion -> travailleur
+
+    try:
+        while restants or en_cours:
+            while restants and len(en_cours) < max_workers:
+                travailleur = libres.pop() if libres else _Travailleur(contexte)
+                travailleur.soumettre(restants.popleft())
+                en_cours[travailleur.conn] = travailleur
+
+            echeance = min(travailleur.debut for travailleur in en_cours.values()) + timeout
+            for conn in wait(list(en_cours), timeout=max(0.0, echeance - time.monotonic())):
+                travailleur = en_cours.pop(conn)
+                chemin = travailleur.chemin
+                try:
+                    reussi, resultat = conn.recv()
+                except (EOFError, OSError):
+                    logger.error(f"Extraction abandonnée pour {chemin} : le processus s'est arrêté")
+                    echecs.add(chemin)
+                    travailleur.arreter()
+                    continue
+                libres.append(travailleur)
+                if not reussi:
+                    logger.error(f"Erreur lors du chargement de {chemin}: {resultat}")
+                    echecs.add(chemin)
+                    continue
+                logger.info(f"Document chargé : {os.path.basename(chemin)} ({len(resultat)} pages)")
+                # Durée vue du processus principal : attente comprise
+                EXTRACTION.observer(time.monotonic() - travailleur.debut)
+                PAGES_EXTRAITES.incrementer(len(resultat))
+                yield from resultat
+
+            maintenant = time.monotonic()
+            for conn, travailleur in list(en_cours.items()):
+                if maintenant - travailleur.debut >= timeout:
+                    del en_cours[conn]
+                    logger.error(f"Extraction abandonnée pour {travailleur.chemin} : plus de {timeout}s")
+                    echecs.add(travailleur.chemin)
+                    travailleur.arreter()
+    finally:
+        for travailleur in libres + list(en_cours.values()):
+            travailleur.arreter()
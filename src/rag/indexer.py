@@ -0,0 +1,173 @@
+"""
+Indexation incrémentale des PDFs dans le magasin de vecteurs
+"""
+
+import os
+import json
+import hashlib
+import logging
+from itertools import islice
+from src.config import RAG_BATCH_PAGES
+from src.utils.fichiers import hash_fichier
+from .extraction import iter_pages, iter_pages_cache
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalIndexer:
+    """Tient à jour un magasin de vecteurs à partir d'un manifeste par fichier
+
+    Le manifeste (JSON, rangé à côté du magasin) associe à chaque PDF indexé
+    sa taille, sa date de modification, le hash de son contenu et les
+    identifiants de ses chunks. Seuls les fichiers nouveaux ou modifiés sont
+    découpés et vectorisés ; les vecteurs des fichiers modifiés ou supprimés
+    sont retirés du magasin. Avec un `page_store` (PageTextStore), le texte
+    des PDFs déjà analysés, au téléchargement ou lors d'une indexation
+    précédente, y est lu au lieu d'être extrait à nouveau.
+    """
+
+    def __init__(self, manifest_path, page_store=None):
+        self.manifest_path = str(manifest_path)
+        self.page_store = page_store
+        self.manifest = self._charger()
+
+    def _charger(self):
+        """Charge le manifeste, vide s'il n'existe pas encore"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _sauvegarder(self):
+        """Écrit le manifeste de façon atomique"""
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        temporaire = f"{self.manifest_path}.tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(temporaire, self.manifest_path)
+
+    def planifier(self, chemins, hashes=None):
+        """Calcule le delta entre les fichiers présents et le manifeste
+
+        Le contenu n'est hashé que si la taille ou la date de modification
+        a changé, et seulement s'il n'est pas connu par `hashes` (chemin ->
+        hash, fourni par un magasin adressé par contenu). Un fichier absent
+        du disque est ignoré, et retiré de l'index s'il y était. Retourne un
+        dictionnaire 'nouveaux', 'modifies', 'supprimes', 'inchanges'
+        (chemin -> informations du fichier).
+        """
+        hashes = hashes or {}
+        plan = {'nouveaux': {}, 'modifies': {}, 'supprimes': {}, 'inchanges': {}}
+        presents = set()
+        manquants = []
+        for chemin in chemins:
+            try:
+                stat = os.stat(chemin)
+            except FileNotFoundError:
+                manquants.append(chemin)
+                continue
+            presents.add(chemin)
+            info = {'taille': stat.st_size, 'mtime': stat.st_mtime_ns}
+            connu = self.manifest.get(chemin)
+            if connu and (connu['taille'], connu['mtime']) == (info['taille'], info['mtime']):
+                plan['inchanges'][chemin] = connu
+                continue
+
+            info['hash'] = hashes.get(chemin) or hash_fichier(chemin)
+            if not connu:
+                plan['nouveaux'][chemin] = info
+            elif connu['hash'] != info['hash']:
+                plan['modifies'][chemin] = info
+            else:
+                # Fichier simplement touché : on garde ses vecteurs
+                plan['inchanges'][chemin] = {**connu, **info}
+
+        if manquants:
+            logger.warning(f"{len(manquants)} PDFs introuvables sur le disque, ignorés : {', '.join(manquants[:5])}")
+        for chemin, connu in self.manifest.items():
+            if chemin not in presents:
+                plan['supprimes'][chemin] = connu
+        return plan
+
+    @staticmethod
+    def resumer(plan):
+        """Résumé lisible d'un plan d'indexation"""
+        return (
+            f"{len(plan['nouveaux'])} nouveaux, {len(plan['modifies'])} modifiés, "
+            f"{len(plan['supprimes'])} supprimés, {len(plan['inchanges'])} inchangés"
+        )
+
+    def appliquer(self, plan, store, decouper, taille_lot=RAG_BATCH_PAGES):
+        """Applique un plan au magasin de vecteurs
+
+        `store` expose delete(ids=...) et add_texts(textes, metadatas=..., ids=...)
+        (API des VectorStore LangChain) ; `decouper` transforme une liste de
+        pages (texte, métadonnées) en chunks de même forme. Retourne le
+        nombre de chunks ajoutés et supprimés, et celui des PDFs dont
+        l'extraction a échoué (laissés hors du manifeste).
+        """
+        # Retrait des vecteurs obsolètes
+        obsoletes = [
+            chunk_id
+            for chemin in list(plan['modifies']) + list(plan['supprimes'])
+            for chunk_id in self.manifest.get(chemin, {}).get('ids', [])
+        ]
+        if obsoletes:
+            store.delete(ids=obsoletes)
+        anciens_hash = set()
+        for chemin in list(plan['modifies']) + list(plan['supprimes']):
+            anciens_hash.add(self.manifest.pop(chemin, {}).get('hash'))
+        self._sauvegarder()
+
+        # Indexation des fichiers nouveaux ou modifiés ; les identifiants
+        # déterministes rendent une reprise après interruption idempotente
+        a_indexer = {**plan['nouveaux'], **plan['modifies']}
+        ids_par_fichier = {chemin: [] for chemin in a_indexer}
+        echecs = set()  # Extraction en erreur ou abandonnée : retentée au prochain passage
+        if self.page_store is None:
+            pages = iter_pages(list(a_indexer), echecs=echecs)
+        else:
+            pages = iter_pages_cache({chemin: info['hash'] for chemin, info in a_indexer.items()},
+                                     self.page_store, echecs=echecs)
+        ajoutes = 0
+        while True:
+            lot = list(islice(pages, taille_lot))
+            if not lot:
+                break
+            chunks = decouper(lot)
+            if not chunks:
+                continue
+            ids = []
+            for _, metadata in chunks:
+                chemin = metadata['source']
+                ids.append(self._chunk_id(chemin, a_indexer[chemin]['hash'], len(ids_par_fichier[chemin])))
+                ids_par_fichier[chemin].append(ids[-1])
+            store.add_texts(
+                [texte for texte, _ in chunks],
+                metadatas=[metadata for _, metadata in chunks],
+                ids=ids
+            )
+            ajoutes += len(chunks)
+
+        for chemin, info in a_indexer.items():
+            if chemin in echecs:
+                continue  # Absent du manifeste : replanifié comme nouveau la prochaine fois
+            self.manifest[chemin] = {**info, 'ids': ids_par_fichier[chemin]}
+        self.manifest.update(plan['inchanges'])
+        self._sauvegarder()
+
+        # Textes des contenus qui ne sont plus indexés nulle part
+        if self.page_store is not None:
+            for hash_contenu in anciens_hash - {info.get('hash') for info in self.manifest.values()} - {None}:
+                self.page_store.supprimer(hash_contenu)
+
+        logger.info(f"Indexation incrémentale : {ajoutes} chunks ajoutés, {len(obsoletes)} supprimés")
+        if echecs:
+            logger.warning(f"{len(echecs)} PDFs non indexés (extraction en échec), retentés au prochain passage")
+        return {'chunks_ajoutes': ajoutes, 'chunks_supprimes': len(obsoletes), 'echecs': len(echecs)}
+
+    @staticmethod
+    def _chunk_id(chemin, hash_contenu, numero):
+        """Identifiant stable d'un chunk : fichier, version du contenu, rang"""
+        return f"{hashlib.sha1(chemin.encode()).hexdigest()[:12]}-{hash_contenu[:16]}-{numero}"
@@ -0,0 +1,206 @@
+"""
+Quantification des vecteurs : codes compacts pour présélectionner les
+candidats, re-classés ensuite avec les vecteurs en pleine précision
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+import numpy as np
+from src.config import PQ_SUBVECTOR_DIM
+from .ann import assigner, kmeans
+
+logger = logging.getLogger(__name__)
+
+
+class Quantizer(ABC):
+    """Codes uint8 d'une matrice de vecteurs, persistés dans le dossier du magasin
+
+    Les codes sont ajoutés à la suite dans un fichier relu par np.memmap,
+    comme la matrice : seuls eux sont parcourus à chaque requête, les
+    vecteurs float32 ne sont lus que pour les candidats re-classés.
+    """
+
+    nom = None
+    taille_echantillon = 65536  # Vecteurs utilisés pour l'entraînement
+
+    def __init__(self, directory):
+        self.chemin_parametres = os.path.join(str(directory), f"{self.nom}_parametres.npz")
+        self.chemin_codes = os.path.join(str(directory), f"{self.nom}_codes.u8")
+        self.parametres = None
+        self._lignes = 0
+        self._codes = None
+        if os.path.exists(self.chemin_parametres):
+            with np.load(self.chemin_parametres) as sauvegarde:
+                self.parametres = {cle: sauvegarde[cle] for cle in sauvegarde.files}
+            if os.path.exists(self.chemin_codes):
+                self._lignes = os.path.getsize(self.chemin_codes) // self.taille_code
+
+    @property
+    def entraine(self):
+        return self.parametres is not None
+
+    @property
+    @abstractmethod
+    def taille_code(self):
+        """Octets par vecteur"""
+
+    @abstractmethod
+    def _apprendre(self, echantillon):
+        """Paramètres appris sur un échantillon, enregistrés avec np.savez"""
+
+    @abstractmethod
+    def _encoder(self, vecteurs):
+        """Codes uint8 (n, taille_code) des vecteurs"""
+
+    @abstractmethod
+    def _preparer(self, requete):
+        """Ce qui, calculé une fois par requête, sert à noter tous les codes"""
+
+    @abstractmethod
+    def _scorer(self, codes, prepare):
+        """Produits scalaires approchés de la requête avec des vecteurs encodés"""
+
+    def codes(self):
+        """Matrice des codes, projetée en mémoire à la demande"""
+        if self._codes is None:
+            if not self._lignes:
+                return np.empty((0, self.taille_code), dtype=np.uint8)
+            self._codes = np.memmap(self.chemin_codes, dtype=np.uint8, mode='r', shape=(self._lignes, self.taille_code))
+        return self._codes
+
+    def entrainer(self, matrice, graine=0):
+        """Apprend les paramètres sur un échantillon puis encode toute la matrice"""
+        aleatoire = np.random.default_rng(graine)
+        taille = min(len(matrice), self.taille_echantillon)
+        self.parametres = self._apprendre(np.asarray(matrice[np.sort(aleatoire.choice(len(matrice), taille, replace=False))]))
+        np.savez(self.chemin_parametres, **self.parametres)
+        self._lignes = 0
+        self._codes = None
+        open(self.chemin_codes, 'wb').close()
+        self.synchroniser(matrice)
+        logger.info(f"Quantification {self.nom} entraînée : {self.taille_code} octets par vecteur")
+
+    def synchroniser(self, matrice, taille_bloc=65536):
+        """Encode les lignes ajoutées à la matrice depuis le dernier appel"""
+        if not self.entraine or self._lignes >= len(matrice):
+            return
+        with open(self.chemin_codes, 'ab') as f:
+            f.truncate(self._lignes * self.taille_code)
+            for debut in range(self._lignes, len(matrice), taille_bloc):
+                f.write(self._encoder(np.asarray(matrice[debut:debut + taille_bloc], dtype=np.float32)).tobytes())
+        self._lignes = len(matrice)
+        self._codes = None
+
+    def compacter(self, gardes):
+        """Renumérote les codes après compactage de la matrice"""
+        if not self.entraine:
+            return
+        codes = np.asarray(self.codes()[gardes])
+        self._codes = None
+        codes.tofile(self.chemin_codes)
+        self._lignes = len(codes)
+
+    def scores(self, codes, requete, rangs=None, taille_bloc=16384):
+        """Scores approchés de tous les codes (voir codes()), ou des seuls rangs donnés"""
+        prepare = self._preparer(requete)
+        nombre = len(codes) if rangs is None else len(rangs)
+        scores = np.empty(nombre, dtype=np.float32)
+        for debut in range(0, nombre, taille_bloc):
+            bloc = codes[debut:debut + taille_bloc] if rangs is None else codes[rangs[debut:debut + taille_bloc]]
+            scores[debut:debut + len(bloc)] = self._scorer(np.asarray(bloc), prepare)
+        return scores
+
+
+class ScalarQuantizer(Quantizer):
+    """Quantification scalaire sur 8 bits : 1 octet par composante (4x moins que float32)
+
+    Chaque composante est ramenée linéairement entre son minimum et son
+    maximum observés sur l'échantillon d'entraînement.
+    """
+
+    nom = 'sq8'
+
+    @property
+    def taille_code(self):
+        return len(self.parametres['minimum'])
+
+    def _apprendre(self, echantillon):
+        minimum = echantillon.min(axis=0)
+        echelle = np.maximum(echantillon.max(axis=0) - minimum, 1e-12) / 255
+        return {'minimum': minimum.astype(np.float32), 'echelle': echelle.astype(np.float32)}
+
+    def _encoder(self, vecteurs):
+        codes = np.rint((vecteurs - self.parametres['minimum']) / self.parametres['echelle'])
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def _preparer(self, requete):
+        # q·v ≈ q·minimum + (q × echelle)·code
+        return requete * self.parametres['echelle'], requete @ self.parametres['minimum']
+
+    def _scorer(self, codes, prepare):
+        poids, constante = prepare
+        return codes.astype(np.float32) @ poids + constante
+
+
+class ProductQuantizer(Quantizer):
+    """Quantification par produit : 1 octet par sous-vecteur de PQ_SUBVECTOR_DIM composantes
+
+    Le vecteur est découpé en sous-vecteurs, chacun remplacé par le plus
+    proche de 256 centroïdes appris sur l'échantillon. Avec des
+    sous-vecteurs de 8 composantes, un vecteur float32 occupe 32x moins.
+    Le score d'un code est une somme de lectures dans une table calculée
+    une fois par requête.
+    """
+
+    nom = 'pq'
+    taille_echantillon = 16384  # 64 vecteurs par centroïde suffisent
+
+    def __init__(self, directory, dimension_sous_vecteur=PQ_SUBVECTOR_DIM):
+        self.dimension_sous_vecteur = dimension_sous_vecteur
+        super().__init__(directory)
+
+    @property
+    def taille_code(self):
+        return len(self.parametres['centroides'])
+
+    def _decouper(self, vecteurs):
+        """(n, d) -> (m, n, d/m) ; la dimension doit être un multiple du sous-vecteur"""
+        m = vecteurs.shape[1] // self.dimension_sous_vecteur
+        return vecteurs.reshape(len(vecteurs), m, -1).transpose(1, 0, 2)
+
+    def _apprendre(self, echantillon):
+        if echantillon.shape[1] % self.dimension_sous_vecteur:
+            raise ValueError(
+                f"Dimension {echantillon.shape[1]} non divisible en sous-vecteurs de {self.dimension_sous_vecteur}"
+            )
+        centroides = min(256, len(echantillon))
+        return {'centroides': np.stack([
+            kmeans(np.ascontiguousarray(sous_vecteurs), centroides, spherique=False)
+            for sous_vecteurs in self._decouper(echantillon)
+        ])}
+
+    def _encoder(self, vecteurs):
+        return np.stack([
+            assigner(np.ascontiguousarray(sous_vecteurs), centroides, spherique=False)
+            for sous_vecteurs, centroides in zip(self._decouper(vecteurs), self.parametres['centroides'])
+        ], axis=1).astype(np.uint8)
+
+    def _preparer(self, requete):
+        # Produit scalaire de chaque sous-vecteur de la requête avec chaque centroïde
+        return np.einsum('mkd,md->mk', self.parametres['centroides'], self._decouper(requete[None])[:, 0])
+
+    def _scorer(self, codes, table):
+        return table[np.arange(codes.shape[1]), codes].sum(axis=1)
+
+
+QUANTIFICATEURS = {'sq8': ScalarQuantizer, 'pq': ProductQuantizer}
+
+
+def creer_quantizer(nom, directory):
+    """Quantificateur configuré (VECTOR_QUANTIZATION), None sans quantification"""
+    if nom in (None, 'none'):
+        return None
+    if nom not in QUANTIFICATEURS:
+        raise ValueError(f"Quantification inconnue : {nom}")
+    return QUANTIFICATEURS[nom](directory)
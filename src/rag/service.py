@@ -0,0 +1,291 @@
+"""
+Service HTTP/JSON de questions-réponses partageant un seul index chargé
+
+    python -m src.rag.service
+
+POST /query {"question": "..."} -> {"réponse": "...", "sources": [...]}
+GET /health -> {"statut": "ok", "en_cours": n, ...}
+GET /metrics -> métriques du pipeline au format texte de Prometheus
+"""
+
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.config import (
+    SERVICE_HOST, SERVICE_PORT, SERVICE_BATCH_WINDOW_MS, SERVICE_MAX_BATCH,
+    SERVICE_MAX_PENDING, SERVICE_TIMEOUT, SERVICE_WORKERS
+)
+from src.utils.metrics import metrics
+from .answer_cache import AnswerCache
+
+logger = logging.getLogger(__name__)
+
+RECHERCHE_LOT = metrics.histogramme('service_recherche_lot_secondes', "Vectorisation et recherche d'un lot de questions")
+GENERATION = metrics.histogramme('rag_llm_secondes', "Génération d'une réponse par le LLM")
+
+
+class ServiceSature(Exception):
+    """Trop de requêtes en cours : le client doit réessayer plus tard"""
+
+
+class MicroBatcher:
+    """Regroupe les recherches arrivées à quelques millisecondes d'intervalle
+
+    Un thread unique attend une première question, ramasse celles qui
+    arrivent pendant `fenetre_ms` (au plus `lot_max`), vectorise le lot en
+    un appel au backend d'embeddings puis cherche toutes les questions d'un
+    coup dans le magasin. Chaque appelant reçoit un Future de
+    (embedding, [(texte, métadonnées)]).
+    """
+
+    def __init__(self, store, embeddings, search_kwargs, fenetre_ms=SERVICE_BATCH_WINDOW_MS,
+                 lot_max=SERVICE_MAX_BATCH):
+        self.store = store
+        self.embeddings = embeddings
+        self.search_kwargs = search_kwargs
+        self.fenetre = fenetre_ms / 1000
+        self.lot_max = lot_max
+        self.lots = 0
+        self.questions = 0
+        self._file = queue.Queue()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+        self._thread.start()
+
+    def soumettre(self, question):
+        future = Future()
+        self._file.put((question, future))
+        return future
+
+    def arreter(self):
+        self._file.put(None)
+        self._thread.join()
+
+    def _boucle(self):
+        while True:
+            premier = self._file.get()
+            if premier is None:
+                return
+            lot = [premier]
+            limite = time.monotonic() + self.fenetre
+            while len(lot) < self.lot_max:
+                restant = limite - time.monotonic()
+                if restant <= 0:
+                    break
+                try:
+                    suivant = self._file.get(timeout=restant)
+                except queue.Empty:
+                    break
+                if suivant is None:
+                    self._file.put(None)
+                    break
+                lot.append(suivant)
+            # Les requêtes déjà abandonnées (délai dépassé) ne sont pas traitées
+            lot = [(question, future) for question, future in lot if future.set_running_or_notify_cancel()]
+            if lot:
+                self._traiter(lot)
+
+    def _traiter(self, lot):
+        self.lots += 1
+        self.questions += len(lot)
+        try:
+            with RECHERCHE_LOT.mesurer():
+                vecteurs = self.embeddings.embed_documents([question for question, _ in lot])
+                resultats = self._rechercher(vecteurs)
+        except Exception as e:
+            logger.error(f"Erreur lors de la recherche d'un lot de {len(lot)} questions : {e}")
+            for _, future in lot:
+                future.set_exception(e)
+            return
+        for (_, future), vecteur, chunks in zip(lot, vecteurs, resultats):
+            future.set_result((vecteur, chunks))
+
+    def _rechercher(self, vecteurs):
+        if hasattr(self.store, 'rechercher_lot'):
+            return self.store.rechercher_lot(vecteurs, **self.search_kwargs)
+        # Magasin LangChain (Chroma) : une recherche par question
+        options = {cle: valeur for cle, valeur in self.search_kwargs.items() if cle != 'search_type'}
+        return [
+            [(doc.page_content, doc.metadata) for doc in
+             self.store.max_marginal_relevance_search_by_vector(vecteur, **options)]
+            for vecteur in vecteurs
+        ]
+
+
+class QueryService:
+    """Répond aux questions de nombreux clients avec un seul index en mémoire
+
+    `generer(question, chunks)` produit la réponse à partir des chunks
+    trouvés (le LLM, ou un bouchon pour les tests de charge) et `version()`
+    donne la version de l'index pour le cache des réponses. Au-delà de
+    `max_en_attente` requêtes en cours, les nouvelles sont refusées
+    (ServiceSature) ; une requête plus longue que `timeout` secondes lève
+    TimeoutError. Avec un ContextPacker (`contexte`), les chunks sont
+    fusionnés et limités en tokens avant `generer`.
+    """
+
+    def __init__(self, store, embeddings, generer, search_kwargs=None, cache=None, version=None, contexte=None,
+                 max_en_attente=SERVICE_MAX_PENDING, timeout=SERVICE_TIMEOUT, workers=SERVICE_WORKERS, **options):
+        self.store = store
+        self.generer = generer
+        self.cache = cache if cache is not None else AnswerCache()
+        self.version = version or (lambda: getattr(store, 'version', 0))
+        self.contexte = contexte
+        self.timeout = timeout
+        self.max_en_attente = max_en_attente
+        self.en_cours = 0
+        self.batcher = MicroBatcher(store, embeddings, search_kwargs or {'k': 5, 'fetch_k': 20, 'lambda_mult': 0.7},
+                                    **options)
+        self._lock = threading.Lock()
+        self._generation = ThreadPoolExecutor(max_workers=workers)
+
+    def repondre(self, question):
+        """Réponse à une question ; lève ServiceSature ou TimeoutError"""
+        with self._lock:
+            if self.en_cours >= self.max_en_attente:
+                raise ServiceSature()
+            self.en_cours += 1
+        try:
+            limite = time.monotonic() + self.timeout
+            version = self.version()
+            recherche = self.batcher.soumettre(question)
+            try:
+                vecteur, chunks = recherche.result(timeout=self.timeout)
+            except TimeoutError:
+                recherche.cancel()
+                raise
+            reponse = self.cache.obtenir(question, version, vecteur)
+            if reponse is not None:
+                return reponse
+
+            extras = {}
+            if self.contexte is not None:
+                chunks, extras['contexte'] = self.contexte.emballer(chunks)
+            generation = self._generation.submit(self._generer, question, chunks)
+            try:
+                texte = generation.result(timeout=max(0, limite - time.monotonic()))
+            except TimeoutError:
+                generation.cancel()
+                raise
+            reponse = {"réponse": texte, "sources": [metadata for _, metadata in chunks], **extras}
+            self.cache.ajouter(question, reponse, version, vecteur)
+            return reponse
+        finally:
+            with self._lock:
+                self.en_cours -= 1
+
+    def _generer(self, question, chunks):
+        with GENERATION.mesurer():
+            return self.generer(question, chunks)
+
+    def statistiques(self):
+        lots = self.batcher.lots
+        statistiques = {
+            'en_cours': self.en_cours,
+            'lots': lots,
+            'taille_moyenne_lot': self.batcher.questions / lots if lots else 0.0,
+            'cache': self.cache.statistiques()
+        }
+        if self.contexte is not None:
+            statistiques['contexte'] = self.contexte.statistiques()
+        return statistiques
+
+    def serveur(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """Serveur HTTP (un thread par connexion) exposant ce service"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    return self._repondre(200, metrics.en_prometheus(), type_contenu='text/plain; version=0.0.4')
+                if self.path != '/health':
+                    return self._repondre(404, {'erreur': 'introuvable'})
+                self._repondre(200, {'statut': 'ok', **service.statistiques()})
+
+            def do_POST(self):
+                if self.path != '/query':
+                    return self._repondre(404, {'erreur': 'introuvable'})
+                try:
+                    corps = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    question = json.loads(corps)['question']
+                except (ValueError, KeyError, TypeError):
+                    return self._repondre(400, {'erreur': 'JSON {"question": "..."} attendu'})
+                try:
+                    self._repondre(200, service.repondre(question))
+                except ServiceSature:
+                    self._repondre(503, {'erreur': 'service saturé'}, {'Retry-After': '1'})
+                except TimeoutError:
+                    self._repondre(504, {'erreur': 'délai dépassé'})
+                except Exception as e:
+                    logger.error(f"Erreur lors de la réponse à '{question}': {e}")
+                    self._repondre(500, {'erreur': str(e)})
+
+            def _repondre(self, code, contenu, entetes=None, type_contenu=None):
+                if type_contenu:
+                    corps = contenu.encode('utf-8')
+                else:
+                    corps = json.dumps(contenu, ensure_ascii=False).encode('utf-8')
+                    type_contenu = 'application/json'
+                self.send_response(code)
+                self.send_header('Content-Type', f'{type_contenu}; charset=utf-8')
+                self.send_header('Content-Length', str(len(corps)))
+                for nom, valeur in (entetes or {}).items():
+                    self.send_header(nom, valeur)
+                self.end_headers()
+                self.wfile.write(corps)
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        return httpd
+
+    def close(self):
+        self.batcher.arreter()
+        self._generation.shutdown(wait=False, cancel_futures=True)
+
+
+def depuis_rag(rag, **options):
+    """Service branché sur un RAGSystem indexé : son magasin, ses embeddings, son LLM"""
+    if not rag.qa_chain:
+        rag.setup_qa_chain()
+
+    def generer(question, chunks):
+        return rag.llm.invoke(rag._prompt(question, chunks)).content
+
+    return QueryService(rag.db, rag.embeddings, generer, cache=rag.answer_cache,
+                        version=lambda: rag.index_version, contexte=rag.context_packer, **options)
+
+
+def main():
+    from src.utils.logger import setup_logging
+    from .system import RAGSystem
+
+    setup_logging()
+    rag = RAGSystem()
+    # Démarrage à chaud sur l'index existant, indexation complète sinon
+    if rag.has_index():
+        rag.warm_start()
+    else:
+        rag.setup()
+    service = depuis_rag(rag)
+    httpd = service.serveur()
+    print(f"Service prêt sur http://{httpd.server_address[0]}:{httpd.server_address[1]}/query")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+        rag.close()
+
+
+if __name__ == "__main__":
+    main()
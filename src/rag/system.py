@@ -1,44 +1,110 @@
 import os
+import sys
+import time
+import asyncio
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain_community.llms import HuggingFacePipeline
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-import torch
-import chromadb
-from chromadb.config import Settings
-from langchain_openai import ChatOpenAI
+from src.config import VECTOR_STORE, EMBEDDING_BACKEND, PAGE_TEXT_DIRNAME
+from src.utils.metrics import metrics
+from .answer_cache import AnswerCache
+from .context import ContextPacker
+from .embeddings import creer_embeddings
+from .extraction import PageTextStore, iter_pages_cache
+from .indexer import IncrementalIndexer
+from .vector_store import NumpyVectorStore
 
 # Chargement des variables d'environnement
 load_dotenv()
 
+RECHERCHE = metrics.histogramme('rag_recherche_secondes', "Recherche des extraits d'une question")
+GENERATION = metrics.histogramme('rag_llm_secondes', "Génération d'une réponse par le LLM")
+PREMIER_TOKEN = metrics.histogramme('rag_llm_premier_token_secondes', "Délai avant le premier token du LLM")
+TOKENS_REPONSE = metrics.compteur('rag_tokens_reponse_total', "Tokens de réponse générés (morceaux du flux)")
+
+# LangChain, ChromaDB et le client OpenAI sont importés à la première
+# utilisation : ouvrir un index persisté n'en a pas besoin
+
 class RAGSystem:
-    def __init__(self, pdf_directory="downloads"):
+    def __init__(self, pdf_directory="downloads", persist_directory="chroma_db", vector_store=VECTOR_STORE,
+                 embedding_backend=EMBEDDING_BACKEND):
         self.pdf_directory = pdf_directory
+        self.persist_directory = persist_directory
+        # Un index Chroma construit avant le magasin numpy reste utilisé tel quel
+        if vector_store == "numpy" and self._index_chroma_existant(persist_directory):
+            print(f"Index Chroma existant dans {persist_directory} : il reste utilisé. Supprimez-le "
+                  "pour reconstruire l'index avec le magasin numpy (VECTOR_STORE)")
+            vector_store = "chroma"
+        self.vector_store = vector_store
+        self.embedding_backend = embedding_backend
         self.documents = []
         self.db = None
+        self.embeddings = None
+        self.retriever = None
         self.qa_chain = None
         
-        # Configuration ChromaDB
-        self.chroma_settings = Settings(
-            anonymized_telemetry=False,
-            is_persistent=True,
-            persist_directory="chroma_db",
-            allow_reset=True
+        # Réponses en cache, invalidées dès que l'index change
+        self.answer_cache = AnswerCache()
+        
+        # Extraits fusionnés, dédoublonnés et limités en tokens avant le LLM
+        self.context_packer = ContextPacker()
+        
+        self._chroma_client = None
+        self._llm = None
+        
+        # Manifeste des fichiers déjà indexés, à côté de la collection
+        self.store_directory = (
+            os.path.join(persist_directory, "numpy") if vector_store == "numpy" else persist_directory
         )
+        # Textes des pages enregistrés au téléchargement : les PDFs ne sont analysés qu'une fois
+        self.page_store = PageTextStore(os.path.join(pdf_directory, PAGE_TEXT_DIRNAME))
+        self.indexer = IncrementalIndexer(os.path.join(self.store_directory, "manifest.json"), self.page_store)
+        self._blob_store = None
         
-        self.chroma_client = chromadb.Client(self.chroma_settings)
+    @staticmethod
+    def _index_chroma_existant(persist_directory):
+        """Vrai si persist_directory contient un index Chroma et pas d'index numpy"""
+        return (
+            not os.path.exists(os.path.join(persist_directory, "numpy", "manifest.json"))
+            and any(os.path.exists(os.path.join(persist_directory, nom)) for nom in ("manifest.json", "chroma.sqlite3"))
+        )
+    
+    @property
+    def blob_store(self):
+        """Magasin des PDFs (manifeste SQLite), ouvert à la première indexation"""
+        if self._blob_store is None:
+            from src.database.blob_store import BlobStore
+            self._blob_store = BlobStore(self.pdf_directory)
+        return self._blob_store
         
-        # Initialisation du modèle OpenAI GPT-4
-        self.init_openai_model()
+    @property
+    def chroma_client(self):
+        """Client ChromaDB, créé à la première utilisation"""
+        if self._chroma_client is None:
+            import chromadb
+            from chromadb.config import Settings
+            
+            # Configuration ChromaDB
+            self.chroma_settings = Settings(
+                anonymized_telemetry=False,
+                is_persistent=True,
+                persist_directory=self.persist_directory,
+                allow_reset=True
+            )
+            self._chroma_client = chromadb.Client(self.chroma_settings)
+        return self._chroma_client
+    
+    @property
+    def llm(self):
+        """Modèle OpenAI GPT-4, initialisé à la première question"""
+        if self._llm is None:
+            self.init_openai_model()
+        return self._llm
         
     def init_openai_model(self):
         """Initialise le modèle OpenAI GPT-4"""
+        from langchain_openai import ChatOpenAI
+        
         print("Initialisation du modèle GPT-4...")
-        self.llm = ChatOpenAI(
+        self._llm = ChatOpenAI(
             model="gpt-4-0125-preview",  # GPT-4 Turbo
             temperature=0.7,
             max_tokens=4096,
@@ -46,50 +112,105 @@ class RAGSystem:
             verbose=True
         )
         
+    def _pdf_paths(self):
+        """PDFs distincts du manifeste (chemin -> hash du contenu), sans parcourir le dossier"""
+        fichiers = self.blob_store.fichiers()
+        if not fichiers and any(nom.endswith('.pdf') for nom in os.listdir(self.pdf_directory)):
+            print("PDFs d'un ancien dossier plat : lancez une synchronisation HAL pour les ranger dans le magasin")
+        return fichiers
+    
+    def _planifier(self):
+        fichiers = self._pdf_paths()
+        return self.indexer.planifier(list(fichiers), hashes=fichiers)
+    
+    def iter_documents(self):
+        """Génère les pages de tous les PDFs du dossier, lues dans le magasin de textes ou extraites en parallèle"""
+        from langchain.docstore.document import Document
+        
+        plan = self._planifier()
+        fichiers = {
+            chemin: info['hash']
+            for groupe in ('nouveaux', 'modifies', 'inchanges')
+            for chemin, info in plan[groupe].items()
+        }
+        for texte, metadata in iter_pages_cache(fichiers, self.page_store):
+            yield Document(page_content=texte, metadata=metadata)
+    
     def load_documents(self):
         """Charge tous les PDFs du dossier"""
         print("Chargement des documents...")
-        for filename in os.listdir(self.pdf_directory):
-            if filename.endswith('.pdf'):
-                file_path = os.path.join(self.pdf_directory, filename)
-                try:
-                    loader = PyPDFLoader(file_path)
-                    self.documents.extend(loader.load())
-                    print(f"Document chargé : {filename}")
-                except Exception as e:
-                    print(f"Erreur lors du chargement de {filename}: {str(e)}")
-    
-    def process_documents(self):
-        """Traite les documents avec une configuration optimisée"""
+        self.documents.extend(self.iter_documents())
+    
+    def process_documents(self, dry_run=False):
+        """Met à jour l'index avec une configuration optimisée
+        
+        Seuls les PDFs nouveaux ou modifiés depuis la dernière indexation sont
+        découpés et vectorisés, par lots au fil de l'extraction ; les vecteurs
+        des PDFs modifiés ou supprimés sont retirés. Avec dry_run, le delta
+        prévu est retourné sans rien modifier.
+        """
         print("Traitement des documents...")
+        plan = self._planifier()
+        print(f"Delta à indexer : {self.indexer.resumer(plan)}")
+        if dry_run:
+            return plan
+        
+        from langchain.docstore.document import Document
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,  # Augmenté car GPT-4 peut gérer plus de contexte
             chunk_overlap=100,
             length_function=len,
+            add_start_index=True,  # Positions pour recoller les chunks voisins dans le prompt
             separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
         )
-        texts = text_splitter.split_documents(self.documents)
         
-        # Utilisation d'OpenAI pour les embeddings
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-large"  # Utilisation du dernier modèle d'embedding
-        )
+        # Un contenu partagé par plusieurs documents HAL n'est indexé qu'une fois
+        documents_par_fichier = self.blob_store.documents_par_fichier()
+        
+        def decouper(pages):
+            documents = [
+                Document(page_content=texte,
+                         metadata={**metadata, 'doc_id': ', '.join(documents_par_fichier.get(metadata['source'], []))})
+                for texte, metadata in pages
+            ]
+            return [(doc.page_content, doc.metadata) for doc in text_splitter.split_documents(documents)]
+        
+        # Backend d'embeddings choisi dans src/config.py (EMBEDDING_BACKEND)
+        embeddings = creer_embeddings(self.embedding_backend)
+        
+        self._fermer_index()
+        self.embeddings = embeddings
+        self.db = self.open_store(embeddings)
         
-        self.db = Chroma.from_documents(
-            documents=texts,
-            embedding=embeddings,
+        self.indexer.appliquer(plan, self.db, decouper)
+        self.db.persist()
+        
+        if hasattr(embeddings, 'statistiques'):
+            cache = embeddings.statistiques()
+            print(f"Cache d'embeddings : {cache['taux_succes']:.0%} de succès "
+                  f"({cache['hits']} trouvés, {cache['misses']} calculés)")
+        return plan
+        
+    def open_store(self, embeddings):
+        """Ouvre le magasin de vecteurs choisi dans la configuration"""
+        if self.vector_store == "numpy":
+            return NumpyVectorStore(self.store_directory, embeddings)
+        from langchain_community.vectorstores import Chroma
+        return Chroma(
             client=self.chroma_client,
             collection_name="hal_documents",
-            persist_directory="chroma_db"
+            embedding_function=embeddings,
+            persist_directory=self.persist_directory
         )
         
-        self.db.persist()
-        
     def setup_qa_chain(self):
         """Configure la chaîne de question-réponse"""
+        from langchain.chains import RetrievalQA
+        
         print("Configuration de la chaîne QA...")
-        retriever = self.db.as_retriever(
+        self.retriever = self.db.as_retriever(
             search_type="mmr",
             search_kwargs={
                 "k": 5,
@@ -101,33 +222,196 @@ class RAGSystem:
         self.qa_chain = RetrievalQA.from_chain_type(
             llm=self.llm,
             chain_type="stuff",
-            retriever=retriever,
+            retriever=self.retriever,
             return_source_documents=True,
             verbose=True
         )
     
+    def _embedding_question(self, question):
+        """Embedding de la question calculé au plus une fois, et seulement si besoin"""
+        if not self.embeddings:
+            return None
+        vecteur = []
+        
+        def calculer():
+            if not vecteur:
+                vecteur.append(self.embeddings.embed_query(question))
+            return vecteur[0]
+        return calculer
+    
+    def _prompt(self, question, chunks):
+        """Prompt de la chaîne QA ("stuff") rempli avec les extraits [(texte, métadonnées)]"""
+        chaine = self.qa_chain.combine_documents_chain
+        return chaine.llm_chain.prompt.format(
+            question=question,
+            **{chaine.document_variable_name: "\n\n".join(texte for texte, _ in chunks)}
+        )
+    
+    def _contexte(self, documents):
+        """Extraits envoyés au LLM parmi les documents trouvés, et tokens économisés"""
+        return self.context_packer.emballer((doc.page_content, doc.metadata) for doc in documents)
+    
     def query(self, question):
-        """Pose une question au système"""
+        """Pose une question au système
+        
+        Une question déjà posée, ou assez proche d'une question déjà posée,
+        reçoit la réponse en cache tant que l'index n'a pas changé. La
+        réponse indique aussi les tokens du contexte économisés ("contexte").
+        """
+        morceaux, reponse = [], {}
+        for type_, contenu in self.stream_query(question):
+            if type_ == "token":
+                morceaux.append(contenu)
+            else:
+                reponse[type_] = contenu
+        return {"réponse": "".join(morceaux), **reponse}
+    
+    def stream_query(self, question):
+        """Pose une question et génère la réponse au fil de l'eau
+        
+        Produit ("sources", [métadonnées]) dès la fin de la recherche,
+        ("contexte", statistiques de tokens) puis ("token", texte) à mesure
+        que le modèle répond. Une réponse en cache produit les mêmes événements,
+        le texte en un seul token.
+        """
         if not self.qa_chain:
             self.setup_qa_chain()
         
-        result = self.qa_chain({"query": question})
-        return {
-            "réponse": result["result"],
-            "sources": [doc.metadata for doc in result["source_documents"]]
-        }
+        version = self.index_version
+        embedding = self._embedding_question(question)
+        reponse = self.answer_cache.obtenir(question, version, embedding)
+        if reponse is not None:
+            yield "sources", reponse["sources"]
+            yield "contexte", reponse["contexte"]
+            yield "token", reponse["réponse"]
+            return
+        
+        with RECHERCHE.mesurer():
+            documents = self.retriever.get_relevant_documents(question)
+        chunks, contexte = self._contexte(documents)
+        sources = [metadata for _, metadata in chunks]
+        yield "sources", sources
+        yield "contexte", contexte
+        
+        morceaux = []
+        debut = time.perf_counter()
+        for morceau in self.llm.stream(self._prompt(question, chunks)):
+            if not morceaux:
+                PREMIER_TOKEN.observer(time.perf_counter() - debut)
+            morceaux.append(morceau.content)
+            yield "token", morceau.content
+        GENERATION.observer(time.perf_counter() - debut)
+        TOKENS_REPONSE.incrementer(len(morceaux))
+        reponse = {"réponse": "".join(morceaux), "sources": sources, "contexte": contexte}
+        self.answer_cache.ajouter(question, reponse, version, embedding)
     
+    async def astream_query(self, question):
+        """Version asynchrone de stream_query"""
+        if not self.qa_chain:
+            self.setup_qa_chain()
+        
+        loop = asyncio.get_running_loop()
+        version = self.index_version
+        embedding = self._embedding_question(question)
+        # Le calcul éventuel de l'embedding ne bloque pas la boucle
+        reponse = await loop.run_in_executor(None, self.answer_cache.obtenir, question, version, embedding)
+        if reponse is not None:
+            yield "sources", reponse["sources"]
+            yield "contexte", reponse["contexte"]
+            yield "token", reponse["réponse"]
+            return
+        
+        with RECHERCHE.mesurer():
+            documents = await self.retriever.aget_relevant_documents(question)
+        chunks, contexte = self._contexte(documents)
+        sources = [metadata for _, metadata in chunks]
+        yield "sources", sources
+        yield "contexte", contexte
+        
+        morceaux = []
+        debut = time.perf_counter()
+        async for morceau in self.llm.astream(self._prompt(question, chunks)):
+            if not morceaux:
+                PREMIER_TOKEN.observer(time.perf_counter() - debut)
+            morceaux.append(morceau.content)
+            yield "token", morceau.content
+        GENERATION.observer(time.perf_counter() - debut)
+        TOKENS_REPONSE.incrementer(len(morceaux))
+        reponse = {"réponse": "".join(morceaux), "sources": sources, "contexte": contexte}
+        await loop.run_in_executor(None, self.answer_cache.ajouter, question, reponse, version, embedding)
+    
+    async def aquery(self, question):
+        """Version asynchrone de query"""
+        morceaux, reponse = [], {}
+        async for type_, contenu in self.astream_query(question):
+            if type_ == "token":
+                morceaux.append(contenu)
+            else:
+                reponse[type_] = contenu
+        return {"réponse": "".join(morceaux), **reponse}
+    
+    @property
+    def index_version(self):
+        """Version persistée de l'index, clé d'invalidation du cache des réponses
+
+        Celle du magasin numpy, incrémentée à chaque ajout ou suppression et
+        conservée d'un démarrage à l'autre ; pour Chroma, la date du manifeste.
+        """
+        version = getattr(self.db, 'version', None)
+        if version is not None:
+            return version
+        try:
+            return os.stat(self.indexer.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
     def setup(self):
         """Configure tout le système"""
-        self.load_documents()
         self.process_documents()
         print("Système RAG prêt à l'emploi!")
+    
+    def has_index(self):
+        """Vrai si un index a déjà été construit dans persist_directory"""
+        return bool(self.indexer.manifest)
+    
+    def warm_start(self):
+        """Ouvre l'index persisté tel quel, sans relire ni revectoriser les PDFs
+        
+        Les PDFs ajoutés ou modifiés depuis ne sont pas pris en compte :
+        process_documents() (ou --update) met l'index à jour.
+        """
+        self._fermer_index()
+        self.embeddings = creer_embeddings(self.embedding_backend)
+        self.db = self.open_store(self.embeddings)
+        print(f"Index chargé : {len(self.indexer.manifest)} PDFs déjà indexés")
+        print("Système RAG prêt à l'emploi!")
+
+    def _fermer_index(self):
+        """Ferme le magasin de vecteurs et les embeddings ouverts, avant d'en ouvrir d'autres
+
+        La chaîne QA et le retriever, liés à l'ancien magasin, seront recréés.
+        """
+        for ressource in (self.embeddings, self.db):
+            if ressource is not None and hasattr(ressource, 'close'):
+                ressource.close()
+        self.embeddings = self.db = None
+        self.retriever = self.qa_chain = None
+
+    def close(self):
+        """Libère les connexions SQLite et les workers ouverts par le système"""
+        self._fermer_index()
+        if self._blob_store is not None:
+            self._blob_store.close()
+            self._blob_store = None
 
     def maintenance(self):
         """Effectue la maintenance de la base de données"""
         print("Maintenance de la base de données...")
+        if isinstance(self.db, NumpyVectorStore):
+            self.db.compacter()
         self.db.persist()
-        self.chroma_client.persist()
+        if self.vector_store == "chroma":
+            self.chroma_client.persist()
 
 def main():
     if not os.path.exists('.env'):
@@ -137,23 +421,45 @@ def main():
         return
     
     rag = RAGSystem()
-    rag.setup()
+    if '--dry-run' in sys.argv[1:]:
+        # Affiche le delta à indexer sans rien modifier
+        rag.process_documents(dry_run=True)
+        return
+    if rag.has_index() and '--update' not in sys.argv[1:]:
+        # Démarrage à chaud sur l'index existant
+        rag.warm_start()
+    else:
+        rag.setup()
     
     print("\nPosez vos questions (tapez 'quit' pour quitter):")
     
-    while True:
-        question = input("\nVotre question : ")
-        if question.lower() == 'quit':
-            break
+    try:
+        while True:
+            question = input("\nVotre question : ")
+            if question.lower() == 'quit':
+                break
             
-        try:
-            result = rag.query(question)
-            print("\nRéponse :", result["réponse"])
-            print("\nSources :")
-            for source in result["sources"]:
-                print(f"- {source.get('source', 'Source inconnue')}")
-        except Exception as e:
-            print(f"Erreur : {str(e)}")
+            try:
+                # Sources dès la fin de la recherche, puis réponse au fil de la génération
+                debut_reponse = True
+                for type_, contenu in rag.stream_query(question):
+                    if type_ == "sources":
+                        print("\nSources :")
+                        for source in contenu:
+                            print(f"- {source.get('doc_id') or source.get('source', 'Source inconnue')}")
+                    elif type_ == "contexte":
+                        print(f"\nContexte : {contenu['tokens_apres']} tokens "
+                              f"({contenu['tokens_economises']} économisés)")
+                    else:
+                        if debut_reponse:
+                            print("\nRéponse : ", end="", flush=True)
+                            debut_reponse = False
+                        print(contenu, end="", flush=True)
+                print()
+            except Exception as e:
+                print(f"Erreur : {str(e)}")
+    finally:
+        rag.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,368 @@
+"""
+Magasin de vecteurs en mémoire mappée pour le système RAG
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import logging
+import threading
+import numpy as np
+from src.config import (
+    VECTOR_INDEX, IVF_MIN_VECTORS, IVF_RETRAIN_GROWTH,
+    VECTOR_QUANTIZATION, QUANTIZATION_MIN_VECTORS, QUANTIZATION_RERANK
+)
+from .ann import IVFIndex, recherche_exacte, recherche_candidats, top_k
+from .quantization import creer_quantizer
+
+logger = logging.getLogger(__name__)
+
+
+class NumpyVectorStore:
+    """Magasin de vecteurs local : une matrice float32 et un index SQLite
+
+    Les vecteurs, normalisés, sont ajoutés à la suite dans `vecteurs.f32`
+    et relus par np.memmap : l'ouverture est immédiate et seules les pages
+    utiles sont chargées par le système. `chunks.db` associe à chaque rang
+    de la matrice l'identifiant, le texte et les métadonnées du chunk. Les
+    suppressions sont des marques, retirées par compacter().
+
+    Avec index="ivf", un index IVF (voir ann.py) est entraîné dès que le
+    magasin atteint IVF_MIN_VECTORS chunks, puis tenu à jour à chaque ajout.
+    De même, avec quantization="sq8" ou "pq", les requêtes parcourent des
+    codes compacts (voir quantization.py) et seuls les meilleurs candidats
+    sont re-classés avec les vecteurs float32.
+
+    Expose l'API des VectorStore LangChain utilisée par le projet
+    (add_texts, delete, similarity_search, max_marginal_relevance_search,
+    as_retriever).
+    """
+
+    def __init__(self, persist_directory, embedding, index=VECTOR_INDEX, quantization=VECTOR_QUANTIZATION):
+        self.persist_directory = str(persist_directory)
+        self.embedding = embedding
+        os.makedirs(self.persist_directory, exist_ok=True)
+        self.chemin_vecteurs = os.path.join(self.persist_directory, 'vecteurs.f32')
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.persist_directory, 'chunks.db'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                rang INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                texte TEXT,
+                metadata TEXT,
+                supprime INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_id ON chunks(id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_supprime ON chunks(rang) WHERE supprime = 1')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (cle TEXT PRIMARY KEY, valeur TEXT)')
+        self._conn.commit()
+
+        meta = dict(self._conn.execute('SELECT cle, valeur FROM meta'))
+        self.dimension = int(meta['dimension']) if 'dimension' in meta else None
+        self.version = int(meta.get('version', 0))
+        self.modele = meta.get('modele')
+        self._verifier_embeddings()
+        self._lignes = self._conn.execute('SELECT COALESCE(MAX(rang) + 1, 0) FROM chunks').fetchone()[0]
+        self._supprimes = np.zeros(self._lignes, dtype=bool)
+        self._supprimes[[rang for rang, in self._conn.execute('SELECT rang FROM chunks WHERE supprime = 1')]] = True
+        self._matrice = None
+        self.index = IVFIndex(self.persist_directory) if index == "ivf" else None
+        if self.index is not None:
+            self.index.synchroniser(self._vecteurs())
+        self.quantizer = creer_quantizer(quantization, self.persist_directory)
+        if self.quantizer is not None:
+            self.quantizer.synchroniser(self._vecteurs())
+
+    def __len__(self):
+        return int(self._lignes - self._supprimes.sum())
+
+    def _vecteurs(self):
+        """Matrice des vecteurs, projetée en mémoire à la demande"""
+        if self._matrice is None:
+            if not self._lignes:
+                return np.empty((0, self.dimension or 0), dtype=np.float32)
+            self._matrice = np.memmap(self.chemin_vecteurs, dtype=np.float32, mode='r',
+                                      shape=(self._lignes, self.dimension))
+        return self._matrice
+
+    def _verifier_embeddings(self):
+        """Refuse un backend d'embeddings différent de celui qui a construit l'index
+
+        Des vecteurs de modèles différents ne sont pas comparables : la
+        recherche renverrait des résultats sans rapport avec la question.
+        """
+        modele = getattr(self.embedding, 'model_name', None)
+        dimension = getattr(self.embedding, 'dimension', None)
+        if self.modele and modele and modele != self.modele:
+            raise ValueError(
+                f"Index {self.persist_directory} construit avec le modèle d'embeddings {self.modele}, "
+                f"incompatible avec {modele} : supprimez le dossier pour reconstruire l'index"
+            )
+        if self.dimension and isinstance(dimension, int) and dimension != self.dimension:
+            raise ValueError(
+                f"Index {self.persist_directory} en dimension {self.dimension}, incompatible avec "
+                f"les vecteurs de dimension {dimension} : supprimez le dossier pour reconstruire l'index"
+            )
+
+    def _changer_version(self):
+        """Incrémente la version de l'index, à chaque ajout ou suppression"""
+        self.version += 1
+        self._conn.execute("INSERT OR REPLACE INTO meta (cle, valeur) VALUES ('version', ?)", (str(self.version),))
+
+    @staticmethod
+    def _normaliser(vecteurs):
+        vecteurs = np.atleast_2d(np.asarray(vecteurs, dtype=np.float32))
+        normes = np.linalg.norm(vecteurs, axis=1, keepdims=True)
+        return np.divide(vecteurs, normes, out=np.zeros_like(vecteurs), where=normes > 0)
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        """Vectorise et ajoute des textes ; un identifiant existant est remplacé"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vecteurs = self._normaliser(self.embedding.embed_documents(texts))
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vecteurs.shape[1]
+                self._conn.execute("INSERT INTO meta (cle, valeur) VALUES ('dimension', ?)", (str(self.dimension),))
+            elif vecteurs.shape[1] != self.dimension:
+                raise ValueError(f"Dimension {vecteurs.shape[1]} incompatible avec l'index ({self.dimension})")
+            if self.modele is None and getattr(self.embedding, 'model_name', None):
+                self.modele = self.embedding.model_name
+                self._conn.execute("INSERT INTO meta (cle, valeur) VALUES ('modele', ?)", (self.modele,))
+
+            self._marquer_supprimes(ids)
+            debut = self._lignes
+            # Les lignes non enregistrées dans SQLite (arrêt brutal) sont écrasées
+            with open(self.chemin_vecteurs, 'ab') as f:
+                f.truncate(debut * self.dimension * 4)
+                f.write(vecteurs.tobytes())
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO chunks (rang, id, texte, metadata) VALUES (?, ?, ?, ?)',
+                    [
+                        (debut + i, chunk_id, texte, json.dumps(metadata, ensure_ascii=False))
+                        for i, (chunk_id, texte, metadata) in enumerate(zip(ids, texts, metadatas))
+                    ]
+                )
+                self._changer_version()
+            self._lignes += len(texts)
+            self._supprimes = np.concatenate([self._supprimes, np.zeros(len(texts), dtype=bool)])
+            self._matrice = None
+            self._mettre_a_jour_index()
+        return ids
+
+    def _mettre_a_jour_index(self):
+        """Entraîne l'index IVF et la quantification au seuil, puis les tient à jour"""
+        if self.quantizer is not None:
+            if self.quantizer.entraine:
+                self.quantizer.synchroniser(self._vecteurs())
+            elif len(self) >= QUANTIZATION_MIN_VECTORS:
+                self.quantizer.entrainer(self._vecteurs())
+        if self.index is None:
+            return
+        if not self.index.entraine:
+            if len(self) >= IVF_MIN_VECTORS:
+                self.index.entrainer(self._vecteurs())
+        elif self._lignes >= IVF_RETRAIN_GROWTH * self.index.taille_entrainement:
+            self.index.entrainer(self._vecteurs())
+        else:
+            self.index.synchroniser(self._vecteurs())
+
+    def delete(self, ids=None):
+        """Retire des chunks par identifiant"""
+        if not ids:
+            return
+        with self._lock:
+            with self._conn:
+                if self._marquer_supprimes(ids):
+                    self._changer_version()
+
+    def _marquer_supprimes(self, ids, taille_lot=500):
+        """Marque comme supprimés les chunks actifs portant ces identifiants"""
+        rangs = []
+        ids = list(ids)
+        for debut in range(0, len(ids), taille_lot):
+            lot = ids[debut:debut + taille_lot]
+            rangs.extend(rang for rang, in self._conn.execute(
+                f"SELECT rang FROM chunks WHERE supprime = 0 AND id IN ({', '.join('?' * len(lot))})", lot
+            ))
+        if rangs:
+            self._conn.executemany(
+                'UPDATE chunks SET supprime = 1, texte = NULL, metadata = NULL WHERE rang = ?',
+                [(rang,) for rang in rangs]
+            )
+            self._supprimes[rangs] = True
+        return len(rangs)
+
+    def compacter(self):
+        """Réécrit la matrice et l'index sans les chunks supprimés"""
+        with self._lock:
+            if not self._supprimes.any():
+                return 0
+            gardes = np.flatnonzero(~self._supprimes)
+            temporaire = f"{self.chemin_vecteurs}.tmp"
+            with open(temporaire, 'wb') as f:
+                matrice = self._vecteurs()
+                for debut in range(0, len(gardes), 65536):
+                    f.write(np.ascontiguousarray(matrice[gardes[debut:debut + 65536]]).tobytes())
+            retires = self._lignes - len(gardes)
+            with self._conn:
+                self._conn.execute('DELETE FROM chunks WHERE supprime = 1')
+                # Dans l'ordre croissant, le nouveau rang est toujours libre
+                self._conn.executemany(
+                    'UPDATE chunks SET rang = ? WHERE rang = ?',
+                    ((nouveau, int(ancien)) for nouveau, ancien in enumerate(gardes) if nouveau != ancien)
+                )
+                self._changer_version()
+            self._matrice = None
+            os.replace(temporaire, self.chemin_vecteurs)
+            self._lignes = len(gardes)
+            self._supprimes = np.zeros(self._lignes, dtype=bool)
+            if self.index is not None:
+                self.index.compacter(gardes)
+            if self.quantizer is not None:
+                self.quantizer.compacter(gardes)
+        logger.info(f"Magasin de vecteurs compacté : {retires} chunks retirés")
+        return retires
+
+    def persist(self):
+        """Les écritures sont déjà sur disque ; conservé pour l'API Chroma"""
+        self._conn.commit()
+
+    def close(self):
+        self._matrice = None
+        self._conn.close()
+
+    # Recherche
+
+    def _top_k(self, requete, k, nprobe=None):
+        """Rangs et scores des k chunks les plus proches, du plus au moins similaire
+
+        Si l'index IVF est entraîné, seuls les chunks des listes sondées sont
+        notés ; avec la quantification, ils le sont d'abord sur leurs codes.
+        """
+        with self._lock:
+            matrice, supprimes = self._vecteurs(), self._supprimes
+            candidats = codes = None
+            if self.index is not None and self.index.entraine:
+                candidats = self.index.candidats(requete, nprobe)
+            if self.quantizer is not None and self.quantizer.entraine:
+                codes = self.quantizer.codes()
+        if codes is not None:
+            approches = self.quantizer.scores(codes, requete, candidats)
+            approches[supprimes if candidats is None else supprimes[candidats]] = -np.inf
+            candidats = np.sort(top_k(approches, k * QUANTIZATION_RERANK, candidats)[0])
+        if candidats is None:
+            return recherche_exacte(matrice, requete, k, supprimes)
+        return recherche_candidats(matrice, requete, k, candidats, supprimes)
+
+    def _top_k_lot(self, requetes, k):
+        """_top_k pour plusieurs requêtes : en recherche exacte, un seul produit matriciel"""
+        with self._lock:
+            matrice, supprimes = self._vecteurs(), self._supprimes
+            approche = any(structure is not None and structure.entraine for structure in (self.index, self.quantizer))
+        if approche or not len(matrice):
+            return [self._top_k(requete, k) for requete in requetes]
+        scores = np.asarray(matrice @ requetes.T)
+        scores[supprimes] = -np.inf
+        return [top_k(np.ascontiguousarray(colonne), k) for colonne in scores.T]
+
+    def _mmr(self, requete, k, fetch_k, lambda_mult):
+        """Maximal Marginal Relevance vectorisé sur les fetch_k meilleurs candidats"""
+        return self._mmr_candidats(*self._top_k(requete, fetch_k), k, lambda_mult)
+
+    def _mmr_candidats(self, candidats, pertinence, k, lambda_mult):
+        """Sélection MMR parmi des candidats triés par pertinence"""
+        if len(candidats) <= 1:
+            return candidats, pertinence
+        vecteurs = np.asarray(self._vecteurs()[candidats])
+        similarites = vecteurs @ vecteurs.T
+
+        choisis = [0]  # Le plus pertinent est toujours retenu en premier
+        redondance = similarites[0].copy()
+        disponibles = np.ones(len(candidats), dtype=bool)
+        disponibles[0] = False
+        for _ in range(min(k, len(candidats)) - 1):
+            score = lambda_mult * pertinence - (1 - lambda_mult) * redondance
+            score[~disponibles] = -np.inf
+            choix = int(np.argmax(score))
+            choisis.append(choix)
+            disponibles[choix] = False
+            np.maximum(redondance, similarites[choix], out=redondance)
+        return candidats[choisis], pertinence[choisis]
+
+    def _chunks(self, rangs):
+        """Textes et métadonnées des chunks, dans l'ordre des rangs demandés"""
+        rangs = [int(rang) for rang in rangs]
+        if not rangs:
+            return []
+        with self._lock:
+            lignes = {
+                rang: (texte, json.loads(metadata))
+                for rang, texte, metadata in self._conn.execute(
+                    f"SELECT rang, texte, metadata FROM chunks WHERE rang IN ({', '.join('?' * len(rangs))})", rangs
+                )
+            }
+        return [lignes[rang] for rang in rangs]
+
+    def _requete(self, query):
+        return self._normaliser(self.embedding.embed_query(query))[0]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        """Retourne [(texte, métadonnées, score)] des k chunks les plus proches"""
+        rangs, scores = self._top_k(self._normaliser(embedding)[0], k)
+        return [(texte, metadata, float(score)) for (texte, metadata), score in zip(self._chunks(rangs), scores)]
+
+    def rechercher_lot(self, embeddings, k=4, fetch_k=20, lambda_mult=0.5, search_type="mmr"):
+        """Recherche de plusieurs requêtes à la fois ; [(texte, métadonnées)] par requête"""
+        requetes = self._normaliser(embeddings)
+        if search_type == "mmr":
+            resultats = [
+                self._mmr_candidats(rangs, scores, k, lambda_mult)
+                for rangs, scores in self._top_k_lot(requetes, fetch_k)
+            ]
+        else:
+            resultats = self._top_k_lot(requetes, k)
+        return [self._chunks(rangs) for rangs, _ in resultats]
+
+    def similarity_search(self, query, k=4):
+        from langchain.docstore.document import Document
+        return [
+            Document(page_content=texte, metadata=metadata)
+            for texte, metadata, _ in self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+        ]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5):
+        from langchain.docstore.document import Document
+        rangs, _ = self._mmr(self._requete(query), k, fetch_k, lambda_mult)
+        return [Document(page_content=texte, metadata=metadata) for texte, metadata in self._chunks(rangs)]
+
+    def as_retriever(self, search_type="similarity", search_kwargs=None):
+        """Retriever LangChain (RetrievalQA) sur ce magasin"""
+        from langchain.schema import BaseRetriever
+
+        store = self
+        options = dict(search_kwargs or {})
+        if search_type == "mmr":
+            def rechercher(question):
+                return store.max_marginal_relevance_search(question, **options)
+        elif search_type == "similarity":
+            def rechercher(question):
+                return store.similarity_search(question, k=options.get('k', 4))
+        else:
+            raise ValueError(f"Type de recherche inconnu : {search_type}")
+
+        class NumpyRetriever(BaseRetriever):
+            def _get_relevant_documents(self, query, *, run_manager=None):
+                return rechercher(query)
+
+        return NumpyRetriever()
@@ -4,5 +4,7 @@ Initialisation du package utils
 
 from .logger import setup_logging
 from .data_cleaner import DataCleaner
+from .metrics import metrics, MetricsRegistry
+from .fichiers import hash_fichier
 
-__all__ = ['setup_logging', 'DataCleaner'] 
\ No newline at end of file
+__all__ = ['setup_logging', 'DataCleaner', 'metrics', 'MetricsRegistry', 'hash_fichier'] 
\ No newline at end of file
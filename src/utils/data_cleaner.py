@@ -3,24 +3,70 @@ Module de nettoyage et normalisation des données pour CHATBOT_RAG
 """
 
 import re
+import time
 from datetime import datetime
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, Optional
 from .logger import setup_logging
+from .metrics import metrics, BORNES_RAPIDES
+
+NETTOYAGE = metrics.histogramme('nettoyage_secondes', "Nettoyage des métadonnées d'un document", BORNES_RAPIDES)
+DOCUMENTS_NETTOYES = metrics.compteur('nettoyage_documents_total', "Documents nettoyés par lots (clean_many)")
+
+# Caractères de contrôle retirés des textes (C0, DEL et C1), pour str.translate
+CONTROLES = dict.fromkeys([*range(0x00, 0x20), *range(0x7F, 0xA0)])
+
+TEXT_FIELDS = ('titre', 'auteurs', 'mots_cles', 'resume', 'domaine_scientifique', 'journal', 'type_document')
+DATE_FIELDS = ('date_publication', 'date_soumission')
+
+# Formats essayés dans l'ordre quand la date n'a pas une forme HAL
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%Y-%m", "%Y", "%Y-%m-%dT%H:%M:%SZ")
+
+# Formes HAL reconnues sans strptime : AAAA, AAAA-MM, AAAA-MM-JJ, AAAA-MM-JJThh:mm:ssZ
+DATE_HAL = re.compile(r'([1-9]\d{3})(?:-(\d{2})(?:-(\d{2})(?:T(\d{2}):(\d{2}):(\d{2})Z)?)?)?')
+
+LANGUES = {'fr': 'fr', 'fre': 'fr', 'french': 'fr', 'en': 'en', 'eng': 'en', 'english': 'en'}
+
+
+@lru_cache(maxsize=65536)
+def _date_normalisee(date_str):
+    """Date au format AAAA-MM-JJ, ou None si aucun format ne convient"""
+    forme = DATE_HAL.fullmatch(date_str)
+    if forme:
+        annee, mois, jour, heure, minute, seconde = forme.groups()
+        try:
+            datetime(int(annee), int(mois or 1), int(jour or 1), int(heure or 0), int(minute or 0), int(seconde or 0))
+            return f"{annee}-{mois or '01'}-{jour or '01'}"
+        except ValueError:
+            pass  # Date impossible : strptime tranche, comme avant
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _langue(valeur):
+    valeur = valeur.lower()
+    return LANGUES.get(valeur, valeur)
+
 
 class DataCleaner:
     def __init__(self):
-        self.logger = setup_logging()
+        self.logger = setup_logging(__name__)
 
     def clean_text(self, text: str) -> str:
         """Nettoie un texte"""
         if not text:
             return ""
         
-        # Suppression des caractères spéciaux indésirables
-        text = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', text)
-        # Normalisation des espaces
-        text = ' '.join(text.split())
-        return text.strip()
+        # Cas le plus courant : ASCII imprimable sans espaces à réduire
+        if text.isascii() and text.isprintable() and '  ' not in text and text[0] != ' ' and text[-1] != ' ':
+            return text
+        # Suppression des caractères de contrôle puis normalisation des espaces
+        return ' '.join(text.translate(CONTROLES).split())
 
     def normalize_date(self, date_str: str) -> str:
         """Normalise une date au format YYYY-MM-DD"""
@@ -28,18 +74,10 @@ class DataCleaner:
             return ""
         
         try:
-            # Gestion des différents formats possibles
-            formats = [
-                "%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y",
-                "%Y-%m", "%Y", "%Y-%m-%dT%H:%M:%SZ"
-            ]
-            
-            for fmt in formats:
-                try:
-                    date_obj = datetime.strptime(date_str, fmt)
-                    return date_obj.strftime("%Y-%m-%d")
-                except ValueError:
-                    continue
+            # Formes HAL analysées directement, autres formats par strptime ; mémorisé
+            date = _date_normalisee(date_str)
+            if date is not None:
+                return date
                     
             self.logger.warning(f"Format de date non reconnu : {date_str}")
             return date_str
@@ -50,54 +88,73 @@ class DataCleaner:
 
     def clean_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
         """Nettoie et normalise les métadonnées d'un document"""
-        cleaned = {}
-        
+        debut = time.perf_counter()
         try:
-            # Nettoyage des champs textuels
-            text_fields = ['titre', 'auteurs', 'mots_cles', 'resume', 
-                          'domaine_scientifique', 'journal', 'type_document']
-            for field in text_fields:
-                if field in metadata:
-                    cleaned[field] = self.clean_text(str(metadata.get(field, '')))
-
-            # Normalisation des dates
-            date_fields = ['date_publication', 'date_soumission']
-            for field in date_fields:
-                if field in metadata:
-                    cleaned[field] = self.normalize_date(str(metadata.get(field, '')))
-
-            # Normalisation de la langue
-            if 'langue' in metadata:
-                langue = str(metadata['langue']).lower()
-                cleaned['langue'] = {
-                    'fr': 'fr',
-                    'fre': 'fr',
-                    'french': 'fr',
-                    'en': 'en',
-                    'eng': 'en',
-                    'english': 'en'
-                }.get(langue, langue)
-
-            # Conversion et validation des champs numériques
-            cleaned['nombre_pages'] = max(0, int(metadata.get('nombre_pages', 0)))
-            cleaned['taille_fichier'] = max(0, int(metadata.get('taille_fichier', 0)))
-            cleaned['version'] = max(1, int(metadata.get('version', 1)))
-
-            # Champs qui ne nécessitent pas de nettoyage
-            cleaned['doc_id'] = str(metadata['doc_id'])
-            cleaned['uri'] = str(metadata.get('uri', ''))
-            cleaned['chemin_local'] = str(metadata.get('chemin_local', ''))
-            cleaned['hash_contenu'] = str(metadata.get('hash_contenu', ''))
-            cleaned['statut_traitement'] = str(metadata.get('statut_traitement', 'nouveau'))
-
-            # Validation finale
-            self._validate_cleaned_data(cleaned)
-            
-            return cleaned
-
+            cleaned = self._nettoyer(metadata)
         except Exception as e:
             self.logger.error(f"Erreur lors du nettoyage des métadonnées : {e}")
             raise
+        NETTOYAGE.observer(time.perf_counter() - debut)
+        return cleaned
+
+    def clean_many(self, records: Iterable[Dict[str, Any]], ignorer_erreurs: bool = False
+                   ) -> Iterator[Optional[Dict[str, Any]]]:
+        """Nettoie une liste ou un flux de métadonnées, au fil de l'eau
+        
+        Même résultat que clean_metadata pour chaque enregistrement. Avec
+        ignorer_erreurs, un enregistrement invalide donne None (journalisé)
+        au lieu d'interrompre le lot.
+        """
+        nombre = 0
+        try:
+            for metadata in records:
+                debut = time.perf_counter()
+                try:
+                    cleaned = self._nettoyer(metadata)
+                except Exception as e:
+                    self.logger.error(f"Erreur lors du nettoyage des métadonnées : {e}")
+                    if not ignorer_erreurs:
+                        raise
+                    cleaned = None
+                else:
+                    NETTOYAGE.observer(time.perf_counter() - debut)
+                nombre += 1
+                yield cleaned
+        finally:
+            DOCUMENTS_NETTOYES.incrementer(nombre)
+
+    def _nettoyer(self, metadata):
+        cleaned = {}
+        
+        # Nettoyage des champs textuels
+        for field in TEXT_FIELDS:
+            if field in metadata:
+                cleaned[field] = self.clean_text(str(metadata.get(field, '')))
+
+        # Normalisation des dates
+        for field in DATE_FIELDS:
+            if field in metadata:
+                cleaned[field] = self.normalize_date(str(metadata.get(field, '')))
+
+        # Normalisation de la langue
+        if 'langue' in metadata:
+            cleaned['langue'] = _langue(str(metadata['langue']))
+
+        # Conversion et validation des champs numériques
+        cleaned['nombre_pages'] = max(0, int(metadata.get('nombre_pages', 0)))
+        cleaned['taille_fichier'] = max(0, int(metadata.get('taille_fichier', 0)))
+        cleaned['version'] = max(1, int(metadata.get('version', 1)))
+
+        # Champs qui ne nécessitent pas de nettoyage
+        cleaned['doc_id'] = str(metadata['doc_id'])
+        cleaned['uri'] = str(metadata.get('uri', ''))
+        cleaned['chemin_local'] = str(metadata.get('chemin_local', ''))
+        cleaned['hash_contenu'] = str(metadata.get('hash_contenu', ''))
+        cleaned['statut_traitement'] = str(metadata.get('statut_traitement', 'nouveau'))
+
+        # Validation finale
+        self._validate_cleaned_data(cleaned)
+        return cleaned
 
     def _validate_cleaned_data(self, data: Dict[str, Any]) -> None:
         """Valide les données nettoyées"""
@@ -0,0 +1,14 @@
+"""
+Outils communs sur les fichiers téléchargés : empreinte du contenu
+"""
+
+import hashlib
+
+
+def hash_fichier(chemin, taille_bloc=1024 * 1024):
+    """Calcule le hash SHA-256 d'un fichier, bloc par bloc"""
+    sha256 = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b''):
+            sha256.update(bloc)
+    return sha256.hexdigest()
@@ -1,43 +1,148 @@
 """
 Configuration du système de logging
+
+Les threads qui journalisent ne font que déposer les messages dans une
+file ; un thread d'écriture unique les envoie vers la console et vers les
+fichiers (JSON, une ligne par message).
 """
 
+import json
+import queue
+import atexit
 import logging
-import os
+import threading
+import time
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from src.config import LOGS_DIR
+from src.config import LOGS_DIR, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_RATE_LIMIT
+from .metrics import metrics
+
+LIMITES = metrics.compteur('logs_limites_total', "Messages de log écartés par la limite de débit")
+ABANDONNES = metrics.compteur('logs_abandonnes_total', "Messages de log abandonnés (file pleine)")
+
+_lock = threading.Lock()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par message : date, niveau, logger, message, thread"""
+
+    def format(self, record):
+        entree = {
+            'date': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'niveau': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        if getattr(record, 'ignores', 0):
+            entree['ignores'] = record.ignores
+        if record.exc_info or record.exc_text:
+            entree['exception'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entree, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Limite les messages INFO et DEBUG à `par_seconde` par ligne de code
+
+    Seau de jetons par emplacement d'appel : un message répété dans une
+    boucle (un par document) ne coûte plus qu'un test une fois la limite
+    atteinte. Le nombre de messages écartés est joint au suivant qui passe
+    (attribut `ignores`). Les avertissements et erreurs passent toujours.
+    """
+
+    def __init__(self, par_seconde=LOG_RATE_LIMIT):
+        super().__init__()
+        self.par_seconde = par_seconde
+        self._seaux = {}  # (fichier, ligne) -> [jetons, dernier remplissage, ignorés]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.par_seconde:
+            return True
+        maintenant = time.monotonic()
+        cle = (record.pathname, record.lineno)
+        with self._lock:
+            seau = self._seaux.get(cle)
+            if seau is None:
+                seau = self._seaux[cle] = [self.par_seconde, maintenant, 0]
+            seau[0] = min(self.par_seconde, seau[0] + (maintenant - seau[1]) * self.par_seconde)
+            seau[1] = maintenant
+            if seau[0] < 1:
+                seau[2] += 1
+                LIMITES.incrementer()
+                return False
+            seau[0] -= 1
+            record.ignores, seau[2] = seau[2], 0
+        return True
+
 
-def setup_logging():
-    """Configure le système de logging global"""
-    
+class NonBlockingQueueHandler(QueueHandler):
+    """Dépose les messages dans une file bornée sans jamais attendre
+
+    File pleine (écriture plus lente que la production) : le message est
+    abandonné et compté, le thread appelant n'est pas ralenti.
+    """
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.abandonnes = 0
+
+    def prepare(self, record):
+        # Mise en forme différée au thread d'écriture : seuls le message et
+        # l'exception sont figés ici, les arguments pouvant changer ensuite
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.abandonnes += 1
+            ABANDONNES.incrementer()
+
+
+def setup_logging(nom=__name__, repertoire=None):
+    """Configure une seule fois le logging global et retourne le logger `nom`
+
+    Les fichiers de logs sont écrits dans `repertoire` (LOGS_DIR par
+    défaut). Les appels suivants ne modifient plus rien : les handlers ne
+    s'accumulent pas quel que soit le nombre d'instances créées.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            _listener = _configurer(Path(repertoire or LOGS_DIR))
+    return logging.getLogger(nom)
+
+
+def _configurer(repertoire):
     # Création du répertoire de logs si nécessaire
-    Path(LOGS_DIR).mkdir(exist_ok=True)
-    
-    # Nom du fichier de log avec la date
-    log_file = LOGS_DIR / f'hal_manager_{datetime.now().strftime("%Y%m%d")}.log'
-    
-    # Configuration du logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            # Handler pour la console
-            logging.StreamHandler(),
-            # Handler pour le fichier
-            logging.FileHandler(log_file)
-        ]
-    )
-    
-    # Logger spécifique pour les erreurs
-    error_logger = logging.getLogger('errors')
-    error_logger.setLevel(logging.ERROR)
-    
-    error_file = LOGS_DIR / 'erreurs_hal.log'
-    error_handler = logging.FileHandler(error_file)
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    
-    error_logger.addHandler(error_handler)
-    
-    return logging.getLogger(__name__) 
\ No newline at end of file
+    repertoire.mkdir(parents=True, exist_ok=True)
+
+    # Console lisible, fichier du jour en JSON, erreurs à part
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    fichier = logging.FileHandler(repertoire / f'hal_manager_{datetime.now().strftime("%Y%m%d")}.log', encoding='utf-8')
+    fichier.setFormatter(JsonFormatter())
+    erreurs = logging.FileHandler(repertoire / 'erreurs_hal.log', encoding='utf-8')
+    erreurs.setLevel(logging.ERROR)
+    erreurs.setFormatter(JsonFormatter())
+
+    file = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(file)
+    handler.addFilter(RateLimitFilter())
+    racine = logging.getLogger()
+    racine.setLevel(LOG_LEVEL)
+    racine.addHandler(handler)
+
+    listener = QueueListener(file, console, fichier, erreurs, respect_handler_level=True)
+    listener.start()
+    # Les messages encore en file sont écrits avant la sortie
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,205 @@
+"""
+Métriques légères du pipeline : compteurs et histogrammes par étape,
+exportés au format texte de Prometheus ou en JSON
+"""
+
+import time
+import bisect
+import threading
+from src.config import METRICS_ENABLED
+
+# Bornes des histogrammes, en secondes
+BORNES_DUREE = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BORNES_RAPIDES = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 0.001, 0.0025, 0.005, 0.01, 0.1)
+
+
+class _Chrono:
+    """Mesure la durée d'un bloc `with` dans un histogramme"""
+
+    __slots__ = ('histogramme', 'debut')
+
+    def __init__(self, histogramme):
+        self.histogramme = histogramme
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogramme.observer(time.perf_counter() - self.debut)
+
+
+class _ChronoInactif:
+    """Chronomètre sans effet, partagé quand les métriques sont désactivées"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+CHRONO_INACTIF = _ChronoInactif()
+
+
+class Counter:
+    """Total qui ne fait qu'augmenter (octets, pages, tokens...)"""
+
+    type = 'counter'
+
+    def __init__(self, registre, nom, aide):
+        self.registre = registre
+        self.nom = nom
+        self.aide = aide
+        self._lock = threading.Lock()
+        self.reinitialiser()
+
+    def reinitialiser(self):
+        self.valeur = 0
+
+    def incrementer(self, valeur=1):
+        if not self.registre.actif:
+            return
+        with self._lock:
+            self.valeur += valeur
+
+    def en_json(self):
+        return {'type': self.type, 'aide': self.aide, 'valeur': self.valeur}
+
+    def en_prometheus(self):
+        return [f"{self.nom} {self.valeur}"]
+
+    def resume(self):
+        return f"{self.valeur:,}"
+
+
+class Histogram:
+    """Répartition de valeurs (des durées par défaut) dans des intervalles fixes
+
+    Comme dans Prometheus, l'intervalle `le=b` compte les valeurs <= b ;
+    les quantiles sont estimés par interpolation dans l'intervalle.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, registre, nom, aide, bornes=BORNES_DUREE):
+        self.registre = registre
+        self.nom = nom
+        self.aide = aide
+        self.bornes = tuple(bornes)
+        self._lock = threading.Lock()
+        self.reinitialiser()
+
+    def reinitialiser(self):
+        self.comptes = [0] * (len(self.bornes) + 1)  # Le dernier : au-delà de la plus grande borne
+        self.somme = 0.0
+        self.nombre = 0
+
+    def observer(self, valeur):
+        if not self.registre.actif:
+            return
+        i = bisect.bisect_left(self.bornes, valeur)
+        with self._lock:
+            self.comptes[i] += 1
+            self.somme += valeur
+            self.nombre += 1
+
+    def mesurer(self):
+        """Chronomètre à utiliser avec `with`"""
+        return _Chrono(self) if self.registre.actif else CHRONO_INACTIF
+
+    def quantile(self, q):
+        if not self.nombre:
+            return 0.0
+        rang = q * self.nombre
+        cumul = 0
+        for i, compte in enumerate(self.comptes):
+            if compte and cumul + compte >= rang:
+                bas = self.bornes[i - 1] if i else 0.0
+                haut = self.bornes[i] if i < len(self.bornes) else self.bornes[-1]
+                return bas + (haut - bas) * (rang - cumul) / compte
+            cumul += compte
+        return self.bornes[-1]
+
+    def en_json(self):
+        return {
+            'type': self.type,
+            'aide': self.aide,
+            'nombre': self.nombre,
+            'somme': self.somme,
+            'moyenne': self.somme / self.nombre if self.nombre else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'intervalles': dict(zip([str(borne) for borne in self.bornes] + ['+Inf'], self.comptes))
+        }
+
+    def en_prometheus(self):
+        lignes, cumul = [], 0
+        for borne, compte in zip([repr(float(borne)) for borne in self.bornes] + ['+Inf'], self.comptes):
+            cumul += compte
+            lignes.append(f'{self.nom}_bucket{{le="{borne}"}} {cumul}')
+        return lignes + [f"{self.nom}_sum {self.somme}", f"{self.nom}_count {self.nombre}"]
+
+    def resume(self):
+        if not self.nombre:
+            return "-"
+        return (f"{self.nombre:,} mesures, moyenne {self.somme / self.nombre * 1000:.2f} ms, "
+                f"p50 {self.quantile(0.5) * 1000:.2f} ms, p99 {self.quantile(0.99) * 1000:.2f} ms")
+
+
+class MetricsRegistry:
+    """Ensemble des métriques d'un processus
+
+    Les modules déclarent leurs métriques une fois à l'import ; demander
+    deux fois le même nom rend la même métrique. Désactivé, chaque mesure
+    se réduit à un test d'attribut.
+    """
+
+    def __init__(self, actif=METRICS_ENABLED):
+        self.actif = actif
+        self._metriques = {}
+        self._lock = threading.Lock()
+
+    def compteur(self, nom, aide=''):
+        return self._enregistrer(Counter, nom, aide)
+
+    def histogramme(self, nom, aide='', bornes=BORNES_DUREE):
+        return self._enregistrer(Histogram, nom, aide, bornes)
+
+    def _enregistrer(self, classe, nom, *args):
+        with self._lock:
+            metrique = self._metriques.get(nom)
+            if metrique is None:
+                metrique = self._metriques[nom] = classe(self, nom, *args)
+            elif not isinstance(metrique, classe):
+                raise ValueError(f"Métrique {nom} déjà déclarée comme {metrique.type}")
+            return metrique
+
+    def reinitialiser(self):
+        for metrique in self._metriques.values():
+            metrique.reinitialiser()
+
+    def en_json(self):
+        return {nom: metrique.en_json() for nom, metrique in sorted(self._metriques.items())}
+
+    def en_prometheus(self):
+        lignes = []
+        for nom, metrique in sorted(self._metriques.items()):
+            lignes.append(f"# HELP {nom} {metrique.aide}")
+            lignes.append(f"# TYPE {nom} {metrique.type}")
+            lignes.extend(metrique.en_prometheus())
+        return "\n".join(lignes) + "\n"
+
+    def resume(self):
+        """Une ligne lisible par métrique ayant reçu des mesures"""
+        return [
+            f"{metrique.aide or nom} : {metrique.resume()}"
+            for nom, metrique in sorted(self._metriques.items())
+            if getattr(metrique, 'nombre', None) or getattr(metrique, 'valeur', None)
+        ]
+
+
+# Registre partagé par tout le pipeline
+metrics = MetricsRegistry()
@@ -0,0 +1,14 @@
+"""
+Configuration commune des tests
+"""
+
+import pytest
+from src.utils.logger import setup_logging
+
+
+@pytest.fixture(scope='session', autouse=True)
+def logs_temporaires(tmp_path_factory):
+    """Logs des tests écrits dans un dossier temporaire, pas dans logs/ du dépôt"""
+    repertoire = tmp_path_factory.mktemp('logs')
+    setup_logging(repertoire=repertoire)
+    return repertoire
@@ -0,0 +1,154 @@
+"""
+Serveur HTTP local imitant l'API de recherche HAL et le service des PDFs
+"""
+
+import json
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def make_pdf(pages):
+    """Construit un PDF minimal valide contenant une page par texte fourni"""
+    def echapper(texte):
+        return texte.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objets = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for i, texte in enumerate(pages):
+        page_id, contenu_id = 4 + 2 * i, 5 + 2 * i
+        flux = f"BT /F1 12 Tf 72 720 Td ({echapper(texte)}) Tj ET".encode('latin-1')
+        objets[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {contenu_id} 0 R >>"
+        ).encode()
+        objets[contenu_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(flux), flux)
+        kids.append(f"{page_id} 0 R")
+    objets[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    sortie = bytearray(b"%PDF-1.4\n")
+    positions = {}
+    for num in sorted(objets):
+        positions[num] = len(sortie)
+        sortie += b"%d 0 obj\n%s\nendobj\n" % (num, objets[num])
+    xref = len(sortie)
+    sortie += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objets) + 1)
+    for num in sorted(objets):
+        sortie += b"%010d 00000 n \n" % positions[num]
+    sortie += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objets) + 1, xref)
+    return bytes(sortie)
+
+
+def make_hal_doc(doc_id, base_url, **champs):
+    """Construit un enregistrement de recherche HAL pointant vers le serveur local"""
+    doc = {
+        'docid': str(doc_id),
+        'label_s': f"Auteur {doc_id}. Titre du document {doc_id}",
+        'fileMain_s': f"{base_url}/pdf/{doc_id}.pdf",
+        'uri_s': f"https://hal.science/hal-{doc_id}",
+        'authFullName_s': [f"Auteur {doc_id}"],
+        'abstract_s': f"Résumé du document {doc_id}",
+        'publicationDate_s': '2024-01-15',
+        'submittedDate_s': '2024-01-16 10:00:00',
+        'language_s': 'fr',
+        'version_i': 1,
+    }
+    doc.update(champs)
+    return doc
+
+
+class FakeHALServer:
+    """Serveur HAL local lancé dans un thread, pour les tests et benchmarks"""
+
+    def __init__(self, nombre_documents=10, pages_par_document=2, latence=0.0):
+        self.documents = {}
+        self.pdfs = {}
+        self.pannes = {}  # chemin -> nombre de réponses 503 à renvoyer
+        self.etags = True  # Gestion des requêtes conditionnelles If-None-Match
+        self.latence = latence
+        self.requetes = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self.search_url = f"{self.base_url}/search/"
+        for i in range(1, nombre_documents + 1):
+            self.add_document(
+                make_hal_doc(i, self.base_url),
+                make_pdf([f"Page {p} du document {i}" for p in range(1, pages_par_document + 1)])
+            )
+
+    def add_document(self, doc, pdf):
+        self.documents[doc['docid']] = doc
+        self.pdfs[f"/pdf/{doc['docid']}.pdf"] = pdf
+
+    def _handler(self):
+        serveur = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with serveur._lock:
+                    serveur.requetes.append((url.path, dict(self.headers)))
+                    pannes = serveur.pannes.get(url.path, 0)
+                    if pannes:
+                        serveur.pannes[url.path] = pannes - 1
+                if serveur.latence:
+                    threading.Event().wait(serveur.latence)
+                if pannes:
+                    return self._repondre(503, b'', 'text/plain')
+                if url.path == '/search/':
+                    return self._repondre(200, serveur.search(parse_qs(url.query)), 'application/json')
+                if url.path in serveur.pdfs:
+                    pdf = serveur.pdfs[url.path]
+                    etag = f'"{hashlib.sha1(pdf).hexdigest()}"' if serveur.etags else None
+                    if etag and self.headers.get('If-None-Match') == etag:
+                        return self._repondre(304, b'', 'application/pdf', etag)
+                    return self._repondre(200, pdf, 'application/pdf', etag)
+                self._repondre(404, b'', 'text/plain')
+
+            def _repondre(self, code, corps, content_type, etag=None):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                if etag:
+                    self.send_header('ETag', etag)
+                if code != 304:
+                    self.send_header('Content-Length', str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+        return Handler
+
+    def search(self, params):
+        """Répond à une recherche HAL (rows, cursorMark trié par docid, fq sur la date ou docid)"""
+        docs = sorted(self.documents.values(), key=lambda d: int(d['docid']))
+        for filtre in params.get('fq', []):
+            if filtre.startswith('submittedDate_tdate:['):
+                depuis = filtre.split('[', 1)[1].split(' TO ')[0].rstrip('Z').replace('T', ' ')
+                # "... OR docid:(1 OR 2)" : documents redemandés par identifiant
+                ids = filtre.split(' OR docid:(', 1)[1].rstrip(')').split(' OR ') if ' OR docid:(' in filtre else []
+                docs = [d for d in docs if d['submittedDate_s'] >= depuis or d['docid'] in ids]
+        rows = int(params.get('rows', ['10'])[0])
+        curseur = params.get('cursorMark', ['*'])[0]
+        if curseur != '*':
+            docs = [d for d in docs if int(d['docid']) > int(curseur)]
+        page = docs[:rows]
+        suivant = page[-1]['docid'] if page else curseur
+        return json.dumps({
+            'response': {'numFound': len(self.documents), 'docs': page},
+            'nextCursorMark': suivant
+        }).encode()
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,73 @@
+"""
+Tests de l'index approché IVF
+"""
+
+import numpy as np
+import pytest
+from src.rag import vector_store
+from src.rag.ann import IVFIndex, recherche_exacte
+
+
+def make_vectors(nombre, dimension=32, groupes=20, graine=0):
+    aleatoire = np.random.default_rng(graine)
+    centres = aleatoire.normal(size=(groupes, dimension))
+    vecteurs = centres[aleatoire.integers(groupes, size=nombre)] + 0.3 * aleatoire.normal(size=(nombre, dimension))
+    return (vecteurs / np.linalg.norm(vecteurs, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def matrice():
+    return make_vectors(4000)
+
+
+def rappel(index, matrice, requetes, k, nprobe):
+    trouves = 0
+    for requete in requetes:
+        exacts, _ = recherche_exacte(matrice, requete, k)
+        approches, _ = index.rechercher(matrice, requete, k, nprobe=nprobe)
+        trouves += len(set(exacts) & set(approches))
+    return trouves / (k * len(requetes))
+
+
+def test_ivf_recall_tunable_with_nprobe(matrice, tmp_path):
+    index = IVFIndex(tmp_path, nlist=32)
+    index.entrainer(matrice)
+    requetes = make_vectors(50, graine=1)
+
+    assert rappel(index, matrice, requetes, 10, nprobe=32) == 1.0  # Toutes les listes : exact
+    assert rappel(index, matrice, requetes, 10, nprobe=4) >= 0.8
+    assert len(index.candidats(requetes[0], nprobe=4)) < len(matrice) / 2
+
+
+def test_ivf_persists_and_adds_without_retraining(matrice, tmp_path):
+    index = IVFIndex(tmp_path, nlist=32)
+    index.entrainer(matrice[:3000])
+    centroides = index.centroides.copy()
+
+    reouvert = IVFIndex(tmp_path)
+    reouvert.synchroniser(matrice)
+
+    assert np.array_equal(reouvert.centroides, centroides)
+    assert len(reouvert.listes) == 4000 and reouvert.taille_entrainement == 3000
+    rangs, scores = reouvert.rechercher(matrice, matrice[3500], 1, nprobe=2)
+    assert rangs[0] == 3500 and scores[0] == pytest.approx(1.0)
+    assert len(IVFIndex(tmp_path).listes) == 4000
+
+
+def test_store_trains_index_at_threshold(monkeypatch, tmp_path):
+    monkeypatch.setattr(vector_store, 'IVF_MIN_VECTORS', 1000)
+    vecteurs = make_vectors(1500)
+
+    class Embeddings:
+        def embed_documents(self, texts):
+            return vecteurs[[int(texte) for texte in texts]]
+
+    store = vector_store.NumpyVectorStore(tmp_path, Embeddings(), index="ivf")
+    store.add_texts([str(i) for i in range(900)])
+    assert not store.index.entraine
+
+    store.add_texts([str(i) for i in range(900, 1500)])
+    resultats = store.similarity_search_by_vector_with_score(vecteurs[1200], k=3)
+
+    assert store.index.entraine
+    assert resultats[0][2] == pytest.approx(1.0)
@@ -0,0 +1,55 @@
+"""
+Tests du cache des réponses
+"""
+
+import numpy as np
+from src.rag import answer_cache
+from src.rag.answer_cache import AnswerCache, normaliser_question
+
+
+def test_normalized_question_hits_exact_level():
+    cache = AnswerCache()
+    cache.ajouter("Qu'est-ce que le RAG ?", {'réponse': 'A'}, version=1)
+
+    assert normaliser_question("  QU'EST-CE   que le rag?") == "qu'est-ce que le rag"
+    assert cache.obtenir("qu'est-ce que le  RAG", version=1) == {'réponse': 'A'}
+    assert cache.statistiques()['hits_exacts'] == 1
+
+
+def test_semantic_level_uses_threshold_and_embeds_lazily():
+    cache = AnswerCache(seuil=0.9)
+    cache.ajouter("question un", 'A', version=1, embedding=[1.0, 0.0])
+    appels = []
+
+    def embedding():
+        appels.append(1)
+        return [0.99, 0.1]
+
+    assert cache.obtenir("question une", version=1, embedding=embedding) == 'A'
+    assert cache.obtenir("autre", version=1, embedding=[0.0, 1.0]) is None
+    assert cache.obtenir("question un", version=1, embedding=embedding) == 'A'
+    assert len(appels) == 1  # Pas d'embedding pour un hit exact
+    assert cache.statistiques() == {'hits_exacts': 1, 'hits_semantiques': 1, 'misses': 1, 'taux_succes': 2 / 3}
+
+
+def test_index_change_invalidates_every_entry():
+    cache = AnswerCache()
+    cache.ajouter("question", 'A', version=1, embedding=[1.0, 0.0])
+
+    assert cache.obtenir("question", version=2, embedding=[1.0, 0.0]) is None
+    assert cache.obtenir("question", version=1, embedding=[1.0, 0.0]) is None
+
+
+def test_ttl_and_size_limits(monkeypatch):
+    horloge = [0.0]
+    monkeypatch.setattr(answer_cache.time, 'monotonic', lambda: horloge[0])
+    cache = AnswerCache(taille=2, taille_semantique=2, ttl=10)
+    for i, vecteur in enumerate(np.eye(3)):
+        horloge[0] += 1
+        cache.ajouter(f"q{i}", i, version=1, embedding=vecteur)
+
+    # q0, la plus ancienne, a quitté les deux niveaux
+    assert cache.obtenir("q0", version=1, embedding=np.eye(3)[0]) is None
+    assert cache.obtenir("q2", version=1) == 2
+    horloge[0] += 10
+    assert cache.obtenir("q2", version=1, embedding=np.eye(3)[2]) is None
@@ -0,0 +1,63 @@
+"""
+Tests du magasin de PDFs adressé par contenu
+"""
+
+import hashlib
+import os
+from fake_hal import make_pdf
+from src.database.blob_store import BlobStore
+
+
+def deposer(dossier, contenu, nom='depot.part'):
+    """Écrit un fichier temporaire et retourne (chemin, hash, taille)"""
+    chemin = dossier / nom
+    chemin.write_bytes(contenu)
+    return str(chemin), hashlib.sha256(contenu).hexdigest(), len(contenu)
+
+
+def test_content_is_sharded_and_deduplicated(tmp_path):
+    store = BlobStore(tmp_path)
+    pdf = make_pdf(['Contenu partagé'])
+
+    chemin, hash_contenu, taille = deposer(tmp_path, pdf)
+    blob = store.ajouter('1', chemin, hash_contenu, taille, 1)
+    chemin, _, _ = deposer(tmp_path, pdf)
+    assert store.ajouter('2', chemin, hash_contenu, taille, 1) == blob
+
+    assert blob == os.path.join(tmp_path, 'blobs', hash_contenu[:2], hash_contenu[2:4], f"{hash_contenu}.pdf")
+    assert not os.path.exists(chemin)
+    assert store.fichiers() == {blob: hash_contenu}
+    assert store.documents_par_fichier() == {blob: ['1', '2']}
+    assert store.obtenir(hash_contenu) == {'taille': taille, 'nombre_pages': 1}
+
+
+def test_replaced_content_is_freed_once_unreferenced(tmp_path):
+    store = BlobStore(tmp_path)
+    ancien = store.ajouter('1', *deposer(tmp_path, make_pdf(['v1'])))
+    store.ajouter('2', *deposer(tmp_path, make_pdf(['v1'])))
+
+    store.ajouter('1', *deposer(tmp_path, make_pdf(['v2'])))
+    assert os.path.exists(ancien)  # Encore référencé par le document 2
+
+    store.ajouter('2', *deposer(tmp_path, make_pdf(['v2'])))
+    assert not os.path.exists(ancien) and len(store.fichiers()) == 1
+
+
+def test_flat_folder_is_imported_and_verified(tmp_path):
+    for doc_id in ('a', 'b'):
+        (tmp_path / f"{doc_id}.pdf").write_bytes(make_pdf([f"Document {doc_id}"]))
+
+    store = BlobStore(tmp_path)
+    assert not store.documents()  # Ouvrir le magasin ne déplace rien
+
+    assert store.importer_fichiers_plats() == 2 and store.importer_fichiers_plats() == 0
+    assert sorted(store.documents()) == ['a', 'b']
+    assert not list(tmp_path.glob('*.pdf'))
+    assert store.verifier(rehacher=True) == {'blobs': 2, 'documents': 2, 'manquants': [], 'corrompus': []}
+
+    chemin_a, chemin_b = sorted(store.documents_par_fichier().items(), key=lambda item: item[1])
+    with open(chemin_a[0], 'ab') as f:
+        f.write(b'\n')
+    os.remove(chemin_b[0])
+    resultat = store.verifier(rehacher=True)
+    assert resultat['manquants'] == [store.documents()['b']] and resultat['corrompus'] == [store.documents()['a']]
@@ -0,0 +1,57 @@
+"""
+Tests de la préparation du contexte envoyé au LLM
+"""
+
+from src.rag.context import ContextPacker, estimer_tokens
+
+PAGE = " ".join(f"Phrase {i} sur les réseaux de neurones et la vision par ordinateur." for i in range(40))
+
+
+def decouper(texte, taille=300, chevauchement=60, **metadata):
+    """Chunks qui se recouvrent, comme RecursiveCharacterTextSplitter avec add_start_index"""
+    return [
+        (texte[debut:debut + taille], {**metadata, 'start_index': debut})
+        for debut in range(0, len(texte), taille - chevauchement)
+    ]
+
+
+def make_packer(**options):
+    return ContextPacker(compter=estimer_tokens, **options)
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    chunks = decouper(PAGE, source='a.pdf', page=0)
+    packer = make_packer()
+    # Par pertinence : le 3e chunk d'abord, le 2e relie le 1er aux suivants
+    pertinents = [chunks[2], chunks[0], chunks[3], chunks[1]]
+    assert packer.fusionner(pertinents) == [(PAGE[:1020], {'source': 'a.pdf', 'page': 0, 'start_index': 0})]
+
+    # Sans positions (index antérieur), le recouvrement est retrouvé dans le texte
+    sans_positions = [(texte, {'source': 'a.pdf', 'page': 0}) for texte, _ in pertinents]
+    assert packer.fusionner(sans_positions) == [(PAGE[:1020], {'source': 'a.pdf', 'page': 0})]
+
+    # Chunks disjoints : rien à recoller
+    assert packer.fusionner([chunks[3], chunks[1]]) == [chunks[3], chunks[1]]
+
+
+def test_other_pages_duplicates_and_budget():
+    autre_page = ("Le droit européen des contrats encadre les clauses abusives. " * 5,
+                  {'source': 'b.pdf', 'page': 0})
+    doublon = (PAGE[:300].replace("Phrase 1 ", "Phrase une "), {'source': 'c.pdf', 'page': 3})
+    court = ("Conclusion courte.", {'source': 'd.pdf', 'page': 1})
+    chunks = decouper(PAGE, source='a.pdf', page=0)[:2] + [doublon, autre_page, court]
+
+    packer = make_packer(budget=estimer_tokens(PAGE[:540]) + 10)
+    gardes, statistiques = packer.emballer(chunks)
+
+    # Le doublon est retiré, l'autre page ne tient plus mais le chunk court si
+    assert [metadata['source'] for _, metadata in gardes] == ['a.pdf', 'd.pdf']
+    assert gardes[0][0] == PAGE[:540]
+    assert statistiques['chunks_avant'] == 5 and statistiques['chunks_apres'] == 2
+    assert statistiques['tokens_economises'] == statistiques['tokens_avant'] - statistiques['tokens_apres'] > 0
+    assert packer.statistiques()['tokens_economises'] == statistiques['tokens_economises']
+
+
+def test_first_chunk_is_truncated_to_the_budget():
+    gardes, statistiques = make_packer(budget=50).emballer([(PAGE, {'source': 'a.pdf', 'page': 0})])
+    assert PAGE.startswith(gardes[0][0]) and statistiques['tokens_apres'] == 50
@@ -0,0 +1,116 @@
+"""
+Nettoyage des métadonnées : les chemins rapides (clean_many, dates HAL,
+langues mémorisées) donnent exactement le résultat du nettoyage d'origine
+"""
+
+import random
+import re
+from datetime import datetime
+
+import pytest
+
+from src.utils.data_cleaner import DataCleaner
+
+LANGUES = ['fr', 'FR', 'fre', 'French', 'en', 'ENG', 'english', 'de', 'Español', '', 3]
+DATES = [
+    '2024', '2024-01', '2024-01-16', '2024-01-16T10:00:00Z', '2024-01-16 10:00:00',
+    '2024/01/16', '16/01/2024', '2024-1-5', '2024-02-30', '2024-13', '2024-01-16T24:00:00Z',
+    '2024-01-16T10:00:60Z', '0999-01-01', '0999', ' 2024-01-16', 'inconnue', '', None, 2024
+]
+TEXTES = [
+    'Titre simple', '  espaces   multiples ', 'tab\tulation', 'ligne\nsuivante', 'ctrl\x00\x1f\x7f\x85fin',
+    'insécable\xa0et cadratin', 'accents éàü', 'a', ' ', '', 42
+]
+
+
+def nettoyage_reference(metadata):
+    """Nettoyage d'origine, enregistrement par enregistrement"""
+    def texte(valeur):
+        if not valeur:
+            return ""
+        valeur = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', valeur)
+        return ' '.join(valeur.split()).strip()
+
+    def date(valeur):
+        if not valeur:
+            return ""
+        for fmt in ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%Y-%m", "%Y", "%Y-%m-%dT%H:%M:%SZ"]:
+            try:
+                return datetime.strptime(valeur, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        return valeur
+
+    cleaned = {}
+    for field in ['titre', 'auteurs', 'mots_cles', 'resume', 'domaine_scientifique', 'journal', 'type_document']:
+        if field in metadata:
+            cleaned[field] = texte(str(metadata.get(field, '')))
+    for field in ['date_publication', 'date_soumission']:
+        if field in metadata:
+            cleaned[field] = date(str(metadata.get(field, '')))
+    if 'langue' in metadata:
+        langue = str(metadata['langue']).lower()
+        cleaned['langue'] = {'fr': 'fr', 'fre': 'fr', 'french': 'fr', 'en': 'en', 'eng': 'en',
+                             'english': 'en'}.get(langue, langue)
+    cleaned['nombre_pages'] = max(0, int(metadata.get('nombre_pages', 0)))
+    cleaned['taille_fichier'] = max(0, int(metadata.get('taille_fichier', 0)))
+    cleaned['version'] = max(1, int(metadata.get('version', 1)))
+    cleaned['doc_id'] = str(metadata['doc_id'])
+    cleaned['uri'] = str(metadata.get('uri', ''))
+    cleaned['chemin_local'] = str(metadata.get('chemin_local', ''))
+    cleaned['hash_contenu'] = str(metadata.get('hash_contenu', ''))
+    cleaned['statut_traitement'] = str(metadata.get('statut_traitement', 'nouveau'))
+    return cleaned
+
+
+def make_records(nombre, graine=0):
+    """Métadonnées variées, toutes valides (identifiant, titre et auteurs présents)"""
+    aleatoire = random.Random(graine)
+    records = []
+    for i in range(nombre):
+        record = {
+            'doc_id': f"hal-{i:08d}",
+            'titre': f"{aleatoire.choice(TEXTES[:-4])} {i}",
+            'auteurs': aleatoire.choice(TEXTES[:-4]),
+            'date_publication': aleatoire.choice(DATES[:4]),
+            'nombre_pages': aleatoire.randint(-2, 40),
+            'version': aleatoire.randint(0, 3)
+        }
+        for field in ('mots_cles', 'resume', 'journal'):
+            if aleatoire.random() < 0.7:
+                record[field] = aleatoire.choice(TEXTES)
+        if aleatoire.random() < 0.8:
+            record['date_soumission'] = aleatoire.choice(DATES)
+        if aleatoire.random() < 0.8:
+            record['langue'] = aleatoire.choice(LANGUES)
+        records.append(record)
+    return records
+
+
+@pytest.mark.parametrize('date', DATES)
+def test_normalize_date_identique(date):
+    attendu = nettoyage_reference({'doc_id': 1, 'date_publication': date})['date_publication']
+    assert DataCleaner().normalize_date(str(date)) == attendu
+
+
+@pytest.mark.parametrize('texte', TEXTES)
+def test_clean_text_identique(texte):
+    assert DataCleaner().clean_text(str(texte)) == nettoyage_reference({'doc_id': 1, 'titre': texte})['titre']
+
+
+def test_clean_many_identique_au_nettoyage_d_origine():
+    cleaner = DataCleaner()
+    records = make_records(2000)
+    attendus = [nettoyage_reference(record) for record in records]
+    assert [cleaner.clean_metadata(record) for record in records] == attendus
+    assert list(cleaner.clean_many(iter(records))) == attendus
+
+
+def test_clean_many_enregistrement_invalide():
+    cleaner = DataCleaner()
+    records = [{'doc_id': 'a', 'titre': 'Un', 'auteurs': 'A', 'date_publication': '2024'},
+               {'doc_id': 'b', 'titre': 'Sans auteurs'}]
+    with pytest.raises(ValueError):
+        list(cleaner.clean_many(records))
+    resultats = list(cleaner.clean_many(records, ignorer_erreurs=True))
+    assert resultats[0]['date_publication'] == '2024-01-01' and resultats[1] is None
@@ -0,0 +1,157 @@
+"""
+Tests du gestionnaire de base de données
+"""
+
+import threading
+import pytest
+from src.database.manager import DatabaseManager
+
+
+def make_document(i, **champs):
+    document = {
+        'doc_id': str(i),
+        'titre': f"Titre {i}",
+        'auteurs': f"Auteur {i}",
+        'resume': f"Résumé {i}",
+        'date_publication': '2024-01-15',
+        'uri': f"https://hal.science/hal-{i}",
+        'chemin_local': f"/downloads/{i}.pdf",
+    }
+    document.update(champs)
+    return document
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(tmp_path / 'hal.db')
+    yield manager
+    manager.close()
+
+
+def test_connection_uses_wal(db):
+    assert db._connexion().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_document_and_sync_state_written_together(db):
+    db.enregistrer_lot([make_document(1)], [{'doc_id': '1', 'hash_contenu': 'h1', 'chemin_local': '/a.pdf'}])
+    assert db.obtenir_document('1')['titre'] == 'Titre 1'
+    assert db.obtenir_fichiers_sync(['1'])['1']['hash_contenu'] == 'h1'
+
+    # Un état de synchronisation invalide annule aussi l'écriture du document
+    with pytest.raises(KeyError):
+        db.enregistrer_lot([make_document(1, titre='Titre 2')], [{'hash_contenu': 'h2'}])
+    assert db.obtenir_document('1')['titre'] == 'Titre 1'
+    assert db.obtenir_fichiers_sync(['1'])['1']['hash_contenu'] == 'h1'
+
+
+def test_bulk_upsert(db):
+    assert db.ajouter_documents([make_document(i) for i in range(1000)]) == 1000
+    db.ajouter_documents([make_document(7, titre='Titre corrigé')])
+
+    stats = db.obtenir_statistiques()
+    assert stats['total_documents'] == 1000
+    titre = db._connexion().execute("SELECT titre FROM documents WHERE doc_id = '7'").fetchone()[0]
+    assert titre == 'Titre corrigé'
+
+
+def test_one_connection_per_thread(db):
+    def ecrire(debut):
+        db.ajouter_documents([make_document(i) for i in range(debut, debut + 100)])
+
+    threads = [threading.Thread(target=ecrire, args=(n * 100,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert db.obtenir_statistiques()['total_documents'] == 400
+    assert len(db._connexions) == 5  # Thread principal (initialisation) + 4 workers
+
+
+def test_full_text_search_ranks_with_bm25(db):
+    db.ajouter_documents([
+        make_document(1, titre='Bases de données', resume='Étude des réseaux de capteurs'),
+        make_document(2, titre='Réseaux de neurones profonds', resume='Apprentissage'),
+        make_document(3, titre='Compilation', resume='Analyse statique', mots_cles='graphes, réseaux'),
+    ])
+
+    resultats = db.rechercher_documents({'texte': 'reseau'})
+
+    # Préfixe sans accent ; le titre pèse plus que les mots-clés, puis le résumé
+    assert [row[0] for row in resultats] == ['2', '3', '1']
+    assert [row[0] for row in db.rechercher_documents({'titre': 'neuro prof'})] == ['2']
+    assert db.rechercher_documents({'auteurs': 'Auteur 3', 'texte': 'graph'})[0][0] == '3'
+
+
+def test_full_text_search_paginates(db):
+    db.ajouter_documents([make_document(i, titre=f"Apprentissage {i}") for i in range(25)])
+
+    pages = [db.rechercher_documents({'texte': 'apprent', 'limite': 10, 'decalage': d})
+             for d in (0, 10, 20)]
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert len({row[0] for page in pages for row in page}) == 25
+
+
+def test_full_text_index_follows_updates(db):
+    db.ajouter_documents([make_document(1, titre='Bases de données')])
+    db.ajouter_documents([make_document(1, titre='Bases relationnelles')])
+
+    assert db.rechercher_documents({'texte': 'données'}) == []
+    assert len(db.rechercher_documents({'texte': 'relationnelles'})) == 1
+
+
+def test_existing_database_is_migrated(tmp_path):
+    import sqlite3
+    chemin = tmp_path / 'ancienne.db'
+    with sqlite3.connect(chemin) as conn:
+        conn.execute('''
+            CREATE TABLE documents (
+                doc_id TEXT PRIMARY KEY, titre TEXT, auteurs TEXT, resume TEXT,
+                date_publication TEXT, uri TEXT, chemin_local TEXT, statut TEXT DEFAULT 'nouveau'
+            )
+        ''')
+        conn.execute("INSERT INTO documents (doc_id, titre, auteurs) VALUES ('1', 'Vision par ordinateur', 'A')")
+    conn.close()
+
+    db = DatabaseManager(chemin)
+
+    assert db.version_schema() == 2
+    assert db.rechercher_documents({'titre': 'ordi'})[0][0] == '1'
+    assert db.obtenir_document('1')['hash_contenu'] == ''
+    db.close()
+
+
+def test_all_metadata_is_persisted(db):
+    db.ajouter_documents([make_document(
+        1, mots_cles='vision, images', langue='fr', domaine_scientifique='info',
+        journal='Revue', type_document='ART', date_soumission='2024-01-16', nombre_pages=12,
+        taille_fichier=34567, hash_contenu='abc', version=3, statut_traitement='téléchargé'
+    )])
+
+    document = db.obtenir_document('1')
+
+    assert document['statut'] == 'téléchargé'
+    assert (document['langue'], document['nombre_pages'], document['version']) == ('fr', 12, 3)
+    assert db.documents_par_hash('abc') == ['1']
+    assert [d['doc_id'] for d in db.lister_documents(statut='téléchargé', langue='fr')] == ['1']
+    with pytest.raises(ValueError):
+        db.lister_documents(inconnu='x')
+
+
+def test_lookups_use_secondary_indexes(db):
+    conn = db._connexion()
+    for colonne, index in (('hash_contenu', 'idx_documents_hash'), ('statut', 'idx_documents_statut'),
+                           ('langue', 'idx_documents_langue')):
+        plan = conn.execute(f'EXPLAIN QUERY PLAN SELECT * FROM documents WHERE {colonne} = ?', ('x',))
+        assert index in ' '.join(str(row) for row in plan)
+
+
+def test_reset_reapplies_migrations(db):
+    db.ajouter_documents([make_document(1, langue='fr')])
+    db.reset_database()
+
+    assert db.version_schema() == 2
+    assert db.obtenir_statistiques()['total_documents'] == 0
+    db.ajouter_documents([make_document(2, langue='en')])
+    assert db.obtenir_document('2')['langue'] == 'en'
@@ -1,41 +1,19 @@
-from db_manager import DatabaseManager
-import sqlite3
+"""
+Test de bout en bout de la base HAL : structure, ajout d'un document et statistiques
+"""
 
-def afficher_tables():
-    """Affiche la structure et le contenu des tables"""
-    db = DatabaseManager()
-    with sqlite3.connect(db.db_name) as conn:
-        cursor = conn.cursor()
-        
-        # Liste des tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        print("\nTables dans la base de données:")
-        for table in tables:
-            table_name = table[0]
-            print(f"\n=== Table: {table_name} ===")
-            
-            # Structure de la table
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns = cursor.fetchall()
-            print("\nStructure:")
-            for col in columns:
-                print(f"- {col[1]} ({col[2]})")
-            
-            # Contenu de la table
-            cursor.execute(f"SELECT * FROM {table_name} LIMIT 5;")
-            rows = cursor.fetchall()
-            print(f"\nContenu (5 premiers enregistrements):")
-            if rows:
-                for row in rows:
-                    print(row)
-            else:
-                print("(Table vide)")
+from src.database.manager import DatabaseManager
 
-def ajouter_donnee_test():
-    """Ajoute une donnée de test dans la base"""
-    db = DatabaseManager()
+
+def lister_tables(db):
+    """Tables de la base et leurs colonnes"""
+    conn = db._connexion()
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    return {table: [col[1] for col in conn.execute(f"PRAGMA table_info({table})")] for table in tables}
+
+
+def test_document_round_trip(tmp_path):
+    db = DatabaseManager(tmp_path / 'hal.db')
     doc_info = {
         'doc_id': 'TEST001',
         'titre': 'Document de test',
@@ -57,40 +35,17 @@ def ajouter_donnee_test():
         'type_document': 'ART',
         'hash_contenu': 'abc123'
     }
-    
     try:
-        db.ajouter_document(doc_info)
-        print("Donnée de test ajoutée avec succès")
-        
-        # Ajouter un enregistrement dans l'historique
-        db.enregistrer_telechargement('TEST001', 'succès', 'Test réussi')
-        print("Historique de test ajouté avec succès")
-    except Exception as e:
-        print(f"Erreur lors de l'ajout des données de test : {e}")
+        tables = lister_tables(db)
+        assert {'documents', 'sync_fichiers', 'sync_etat', 'documents_fts'} <= set(tables)
+        assert 'hash_contenu' in tables['documents']
 
-def main():
-    print("=== Test de la base de données HAL ===")
-    
-    # Afficher la structure actuelle
-    print("\n1. Structure actuelle de la base de données:")
-    afficher_tables()
-    
-    # Ajouter une donnée de test
-    print("\n2. Ajout d'une donnée de test:")
-    ajouter_donnee_test()
-    
-    # Réafficher la structure avec les nouvelles données
-    print("\n3. Structure après ajout des données de test:")
-    afficher_tables()
-    
-    # Afficher les statistiques
-    print("\n4. Statistiques de la base de données:")
-    db = DatabaseManager()
-    stats = db.obtenir_statistiques()
-    print(f"Total des documents: {stats['total_documents']}")
-    print("Documents par statut:")
-    for statut, nombre in stats['documents_par_statut'].items():
-        print(f"- {statut}: {nombre}")
+        db.ajouter_document(doc_info)
+        db.enregistrer_fichier_sync({'doc_id': 'TEST001', 'hash_contenu': 'abc123', 'version': 1})
 
-if __name__ == "__main__":
-    main() 
\ No newline at end of file
+        document = db.obtenir_document('TEST001')
+        assert (document['titre'], document['statut'], document['journal']) == ('Document de test', 'test', 'Journal Test')
+        assert db.obtenir_fichiers_sync(['TEST001'])['TEST001']['hash_contenu'] == 'abc123'
+        assert db.obtenir_statistiques() == {'total_documents': 1, 'documents_par_statut': {'test': 1}}
+    finally:
+        db.close()
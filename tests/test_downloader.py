@@ -0,0 +1,362 @@
+"""
+Tests du téléchargeur HAL contre un serveur HAL local
+"""
+
+import json
+import hashlib
+import pytest
+from pathlib import Path
+from fake_hal import FakeHALServer, make_hal_doc
+from src.hal.downloader import HALDownloader
+from src.utils.metrics import metrics
+
+
+class MemoryDB:
+    """Remplace DatabaseManager en gardant les documents en mémoire"""
+
+    def __init__(self):
+        self.documents = {}
+        self.sync = {}
+        self.etat = {}
+
+    def ajouter_documents(self, documents):
+        for document in documents:
+            self.documents[document['doc_id']] = document
+
+    def obtenir_document(self, doc_id):
+        return self.documents.get(str(doc_id))
+
+    def documents_par_hash(self, hash_contenu):
+        return [doc_id for doc_id, document in self.documents.items() if document.get('hash_contenu') == hash_contenu]
+
+    def lister_documents(self, limite=None, decalage=0, statut=None):
+        documents = [document for document in self.documents.values()
+                     if statut is None or document.get('statut_traitement') == statut]
+        return documents[decalage:decalage + limite if limite else None]
+
+    def obtenir_fichiers_sync(self, doc_ids):
+        return {doc_id: self.sync[doc_id] for doc_id in map(str, doc_ids) if doc_id in self.sync}
+
+    def enregistrer_fichiers_sync(self, infos):
+        for info in infos:
+            self.sync[str(info['doc_id'])] = dict(info)
+
+    def enregistrer_lot(self, documents, infos):
+        self.ajouter_documents(documents)
+        self.enregistrer_fichiers_sync(infos)
+
+    def remplacer_chemins(self, chemins):
+        for doc_id, chemin in chemins.items():
+            for table in (self.documents, self.sync):
+                if str(doc_id) in table:
+                    table[str(doc_id)]['chemin_local'] = chemin
+
+    def obtenir_etat_sync(self, cle, defaut=None):
+        return self.etat.get(cle, defaut)
+
+    def enregistrer_etat_sync(self, cle, valeur):
+        self.etat[cle] = valeur
+
+
+@pytest.fixture
+def hal():
+    with FakeHALServer(nombre_documents=12, pages_par_document=3) as serveur:
+        yield serveur
+
+
+def make_downloader(hal, tmp_path, db=None, **options):
+    options.setdefault('cursor_file', tmp_path / 'cursor.json')
+    downloads = tmp_path / 'downloads'
+    return HALDownloader(db or MemoryDB(), api_url=hal.search_url, downloads_dir=downloads, **options)
+
+
+def test_download_concurrent(hal, tmp_path):
+    db = MemoryDB()
+    downloader = make_downloader(hal, tmp_path, db, max_workers=4, page_size=5)
+
+    stats = downloader.download_documents(limit=None)
+    hash_5 = hashlib.sha256(hal.pdfs['/pdf/5.pdf']).hexdigest()
+
+    assert stats['documents'] == 12
+    assert stats['echecs'] == 0
+    assert stats['octets'] == sum(len(pdf) for pdf in hal.pdfs.values())
+    assert stats['docs_par_seconde'] > 0 and stats['mo_par_seconde'] > 0
+    assert sorted(downloader.blob_store.documents(), key=int) == [str(i) for i in range(1, 13)]
+    assert db.documents['5']['nombre_pages'] == 3
+    assert db.documents['5']['titre'] == 'Titre du document 5'
+    assert db.documents['5']['hash_contenu'] == hash_5
+    assert db.documents['5']['chemin_local'] == downloader.blob_store.chemin(hash_5)
+    assert db.documents['5']['taille_fichier'] == len(hal.pdfs['/pdf/5.pdf'])
+
+
+def test_metadata_is_cleaned_once_per_page(hal, tmp_path, monkeypatch):
+    nettoyage = metrics.histogramme('nettoyage_secondes')
+    avant = nettoyage.nombre
+    downloader = make_downloader(hal, tmp_path, page_size=5)
+    clean_many, lots = downloader.data_cleaner.clean_many, []
+
+    def par_lot(records, **options):
+        records = list(records)
+        lots.append(len(records))
+        return clean_many(records, **options)
+
+    monkeypatch.setattr(downloader.data_cleaner, 'clean_many', par_lot)
+    monkeypatch.setattr(downloader.data_cleaner, 'clean_metadata', None)
+    assert downloader.download_documents(limit=None)['documents'] == 12
+    assert lots == [5, 5, 2]
+    assert nettoyage.nombre == avant + 12
+
+
+def test_identical_pdfs_are_stored_once(hal, tmp_path):
+    hal.add_document(make_hal_doc(13, hal.base_url), hal.pdfs['/pdf/2.pdf'])
+    db = MemoryDB()
+    downloader = make_downloader(hal, tmp_path, db, max_workers=1)
+
+    downloader.download_documents(limit=None)
+
+    assert len(downloader.blob_store.documents()) == 13 and len(downloader.blob_store.fichiers()) == 12
+    assert db.documents['13']['chemin_local'] == db.documents['2']['chemin_local']
+    assert db.documents['13']['nombre_pages'] == 3
+
+
+def test_known_content_is_not_parsed_again(hal, tmp_path, monkeypatch):
+    from src.database.manager import DatabaseManager
+    db = DatabaseManager(tmp_path / 'hal.db')
+    make_downloader(hal, tmp_path, db).download_documents(limit=None)
+
+    # Nouveau document au contenu déjà en base, magasin de PDFs neuf
+    hal.add_document(make_hal_doc(13, hal.base_url), hal.pdfs['/pdf/2.pdf'])
+    downloader = make_downloader(hal, tmp_path / 'autre', db)
+    monkeypatch.setattr(downloader, '_verify_pdf', lambda *args: pytest.fail("PDF analysé à nouveau"))
+    downloader.download_documents(limit=None)
+
+    assert db.documents_par_hash(db.obtenir_document('2')['hash_contenu']) == ['2', '13']
+    assert db.obtenir_document('13')['nombre_pages'] == 3
+
+
+def test_download_saves_page_texts(hal, tmp_path):
+    db = MemoryDB()
+    downloader = make_downloader(hal, tmp_path, db)
+
+    downloader.download_documents(limit=2)
+
+    textes = downloader.page_store.lire(db.documents['1']['hash_contenu'])
+    assert [texte.strip() for texte in textes] == [f"Page {p} du document 1" for p in (1, 2, 3)]
+
+
+def test_download_streams_to_disk_and_rejects_invalid_pdf(hal, tmp_path):
+    hal.add_document(make_hal_doc(13, hal.base_url), b'%PDF-1.4 tronque' * 1000)
+    db = MemoryDB()
+    downloader = make_downloader(hal, tmp_path, db)
+    downloader.page_size = 3
+
+    stats = downloader.download_documents(limit=None)
+
+    assert stats['documents'] == 12 and stats['echecs'] == 1
+    assert db.documents['13']['statut_traitement'] == 'échec' and not db.documents['13']['chemin_local']
+    # Aucun fichier partiel ni PDF invalide ne reste dans le répertoire
+    assert len(downloader.blob_store.fichiers()) == 12 and '13' not in downloader.blob_store.documents()
+    assert not list((tmp_path / 'downloads').rglob('*.part'))
+
+
+def test_download_retry_on_server_error(hal, tmp_path):
+    hal.pannes['/pdf/3.pdf'] = 2
+    db = MemoryDB()
+    downloader = make_downloader(hal, tmp_path, db, max_workers=2)
+    downloader.session.adapters['http://'].max_retries.backoff_factor = 0
+
+    stats = downloader.download_documents(limit=4)
+
+    assert stats['documents'] == 4
+    assert '3' in db.documents
+
+
+def test_download_gives_up_after_retries(hal, tmp_path):
+    hal.pannes['/pdf/2.pdf'] = 100
+    db = MemoryDB()
+    downloader = make_downloader(hal, tmp_path, db, max_workers=2)
+    downloader.session.adapters['http://'].max_retries.backoff_factor = 0
+
+    stats = downloader.download_documents(limit=3)
+
+    assert stats['documents'] == 2
+    assert stats['echecs'] == 1
+    assert db.documents['2']['statut_traitement'] == 'échec' and '2' not in db.sync
+
+
+def test_harvest_pages_with_cursor(hal, tmp_path):
+    downloader = make_downloader(hal, tmp_path, page_size=5)
+
+    pages = list(downloader.iter_hal_documents())
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert [doc['docid'] for page in pages for doc in page] == [str(i) for i in range(1, 13)]
+    assert not (tmp_path / 'cursor.json').exists()
+
+
+def test_harvest_resumes_after_interruption(hal, tmp_path):
+    downloader = make_downloader(hal, tmp_path, page_size=4)
+    pages = downloader.iter_hal_documents()
+    next(pages)
+    next(pages)
+    pages.close()  # Interruption pendant le traitement de la deuxième page
+
+    assert json.loads((tmp_path / 'cursor.json').read_text())['documents'] == 4
+
+    reprise = make_downloader(hal, tmp_path, page_size=4)
+    docids = [doc['docid'] for page in reprise.iter_hal_documents() for doc in page]
+
+    assert docids == [str(i) for i in range(5, 13)]
+    assert not (tmp_path / 'cursor.json').exists()
+
+
+def test_harvest_respects_limit_across_resume(hal, tmp_path):
+    downloader = make_downloader(hal, tmp_path, page_size=4)
+    pages = downloader.iter_hal_documents(limit=6)
+    next(pages)
+    next(pages)
+    pages.close()
+
+    reprise = make_downloader(hal, tmp_path, page_size=4)
+    docids = [doc['docid'] for page in reprise.iter_hal_documents(limit=6) for doc in page]
+
+    assert docids == ['5', '6']
+
+
+def test_incremental_sync_skips_unchanged_documents(hal, tmp_path):
+    from src.database.manager import DatabaseManager
+    db = DatabaseManager(tmp_path / 'hal.db')
+    make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+    assert db.obtenir_etat_sync('watermark') == '2024-01-16 10:00:00'
+
+    # Rien n'a changé : aucun PDF n'est redemandé
+    hal.requetes.clear()
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+    assert stats['documents'] == 0 and stats['inchanges'] == 12
+    assert not [chemin for chemin, _ in hal.requetes if chemin.startswith('/pdf/')]
+
+    # Nouvelle version avec nouveau contenu, nouvelle version au contenu identique
+    hal.add_document(make_hal_doc(3, hal.base_url, version_i=2, submittedDate_s='2024-02-01 08:00:00'),
+                     hal.pdfs['/pdf/1.pdf'] + b'\n')
+    hal.documents['4'].update(version_i=2, submittedDate_s='2024-02-01 09:00:00')
+    hal.requetes.clear()
+
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+
+    assert stats['documents'] == 1 and stats['inchanges'] == 11
+    recherches = [chemin for chemin, _ in hal.requetes if chemin == '/search/']
+    pdfs = {chemin: headers for chemin, headers in hal.requetes if chemin.startswith('/pdf/')}
+    assert len(recherches) == 1 and sorted(pdfs) == ['/pdf/3.pdf', '/pdf/4.pdf']
+    assert 'If-None-Match' in pdfs['/pdf/4.pdf']
+    assert db.obtenir_etat_sync('watermark') == '2024-02-01 09:00:00'
+
+
+def test_incremental_sync_retries_failed_documents(hal, tmp_path):
+    from src.database.manager import DatabaseManager
+    db = DatabaseManager(tmp_path / 'hal.db')
+    hal.documents['7'].update(submittedDate_s='2024-01-10 08:00:00')
+    hal.pannes['/pdf/7.pdf'] = 100
+    downloader = make_downloader(hal, tmp_path, db)
+    downloader.session.adapters['http://'].max_retries.backoff_factor = 0
+
+    stats = downloader.download_documents(limit=None, incremental=True)
+
+    assert stats['echecs'] == 1 and db.obtenir_etat_sync('watermark') == '2024-01-10 08:00:00'
+
+    hal.pannes.clear()
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+
+    assert stats['documents'] == 1 and stats['inchanges'] == 11
+    assert db.obtenir_fichiers_sync(['7'])['7']['hash_contenu']
+    assert db.obtenir_etat_sync('watermark') == '2024-01-16 10:00:00'
+
+
+def test_failed_documents_are_retried_by_id(hal, tmp_path):
+    from src.database.manager import DatabaseManager
+    db = DatabaseManager(tmp_path / 'hal.db')
+    hal.pannes['/pdf/7.pdf'] = 100
+    downloader = make_downloader(hal, tmp_path, db)
+    downloader.session.adapters['http://'].max_retries.backoff_factor = 0
+
+    # Moissonnage complet : pas de watermark pour rattraper l'échec
+    stats = downloader.download_documents(limit=None)
+
+    assert stats['echecs'] == 1
+    assert [document['doc_id'] for document in db.lister_documents(statut='échec')] == ['7']
+
+    # Rien de soumis depuis le watermark : seul le document en échec est redemandé
+    hal.pannes.clear()
+    hal.requetes.clear()
+    db.enregistrer_etat_sync('watermark', '2025-01-01 00:00:00')
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+
+    assert stats['documents'] == 1
+    assert [chemin for chemin, _ in hal.requetes if chemin.startswith('/pdf/')] == ['/pdf/7.pdf']
+    assert db.obtenir_document('7')['statut'] == 'téléchargé' and not db.lister_documents(statut='échec')
+
+
+def test_incremental_sync_with_limit_keeps_older_documents(hal, tmp_path):
+    from src.database.manager import DatabaseManager
+    db = DatabaseManager(tmp_path / 'hal.db')
+    # Tri par docid : les premiers documents sont aussi les plus récents
+    for doc_id in '12345':
+        hal.documents[doc_id].update(submittedDate_s='2024-03-01 08:00:00')
+
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=5, incremental=True)
+
+    assert stats['documents'] == 5 and db.obtenir_etat_sync('watermark') is None
+
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+
+    assert stats['documents'] == 7 and stats['inchanges'] == 5
+    assert sorted(db.obtenir_fichiers_sync(hal.documents), key=int) == [str(i) for i in range(1, 13)]
+    assert db.obtenir_etat_sync('watermark') == '2024-03-01 08:00:00'
+
+
+def test_incremental_sync_compares_hash_without_etag(hal, tmp_path):
+    from src.database.manager import DatabaseManager
+    hal.etags = False
+    db = DatabaseManager(tmp_path / 'hal.db')
+    make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+    chemin = Path(db.obtenir_fichiers_sync(['5'])['5']['chemin_local'])
+    mtime = chemin.stat().st_mtime_ns
+
+    hal.documents['5'].update(version_i=2)
+    stats = make_downloader(hal, tmp_path, db).download_documents(limit=None, incremental=True)
+
+    assert stats['documents'] == 0 and stats['inchanges'] == 12
+    assert chemin.stat().st_mtime_ns == mtime
+    assert not list((tmp_path / 'downloads').glob('*.part'))
+
+
+def test_flat_folder_upgrade_keeps_documents_in_sync(hal, tmp_path):
+    from src.database.manager import DatabaseManager
+    db = DatabaseManager(tmp_path / 'hal.db')
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+
+    # Arborescence d'avant le magasin par contenu : {doc_id}.pdf, chemins plats en base
+    lignes = []
+    for doc_id, doc in hal.documents.items():
+        pdf = hal.pdfs[f'/pdf/{doc_id}.pdf']
+        chemin = downloads / f'{doc_id}.pdf'
+        chemin.write_bytes(pdf)
+        lignes.append({'doc_id': doc_id, 'titre': f'Document {doc_id}', 'chemin_local': str(chemin),
+                       'hash_contenu': hashlib.sha256(pdf).hexdigest(), 'version': doc.get('version_i', 0),
+                       'date_soumission': doc['submittedDate_s']})
+    db.enregistrer_lot(lignes, lignes)
+    db.enregistrer_etat_sync('watermark', max(doc['submittedDate_s'] for doc in hal.documents.values()))
+
+    downloader = make_downloader(hal, tmp_path, db)
+    stats = downloader.download_documents(limit=None, incremental=True)
+
+    assert stats['documents'] == 0 and stats['inchanges'] == 12
+    assert not [chemin for chemin, _ in hal.requetes if chemin.startswith('/pdf/')]
+    assert not list(downloads.glob('*.pdf'))
+    sync = db.obtenir_fichiers_sync(hal.documents)
+    for ligne in lignes:
+        blob = downloader.blob_store.chemin(ligne['hash_contenu'])
+        assert Path(blob).exists()
+        assert sync[ligne['doc_id']]['chemin_local'] == blob
+        assert db.obtenir_document(ligne['doc_id'])['chemin_local'] == blob
+    assert db.obtenir_etat_sync('stockage') == 'blobs'
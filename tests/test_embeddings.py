@@ -0,0 +1,107 @@
+"""
+Tests du cache d'embeddings
+"""
+
+import numpy as np
+import pytest
+from src.rag.embeddings import CachedEmbeddings, EmbeddingBackend, HashingEmbeddings, creer_embeddings
+
+
+class CountingBackend:
+    """Backend déterministe qui compte les textes vectorisés"""
+
+    def __init__(self, dimension=8):
+        self.dimension = dimension
+        self.appels = []
+
+    def embed_documents(self, textes):
+        self.appels.append(list(textes))
+        return [[float(len(texte) + i) for i in range(self.dimension)] for texte in textes]
+
+
+@pytest.fixture
+def backend():
+    return CountingBackend()
+
+
+def test_cache_hits_skip_backend(backend, tmp_path):
+    cache = CachedEmbeddings(backend, 'modele', cache_path=tmp_path / 'cache.db')
+    premiers = cache.embed_documents(['a', 'bb', 'a'])
+
+    assert backend.appels == [['a', 'bb']]  # Doublons vectorisés une seule fois
+    assert cache.embed_documents(['bb', 'a']) == [premiers[1], premiers[0]]
+    assert len(backend.appels) == 1
+    assert cache.statistiques()['hits'] == 2 and cache.statistiques()['misses'] == 2
+
+
+def test_close_releases_connection(backend, tmp_path):
+    cache = CachedEmbeddings(backend, 'modele', cache_path=tmp_path / 'cache.db')
+    cache.embed_query('texte')
+    cache.close()
+
+    with pytest.raises(Exception):
+        cache.embed_query('texte')
+
+
+def test_cache_is_persistent_and_keyed_by_model(backend, tmp_path):
+    CachedEmbeddings(backend, 'modele', cache_path=tmp_path / 'cache.db').embed_documents(['texte'])
+
+    reouvert = CachedEmbeddings(backend, 'modele', cache_path=tmp_path / 'cache.db')
+    reouvert.embed_query('texte')
+    autre_modele = CachedEmbeddings(backend, 'autre', cache_path=tmp_path / 'cache.db')
+    autre_modele.embed_query('texte')
+
+    assert reouvert.statistiques()['taux_succes'] == 1.0
+    assert autre_modele.statistiques()['taux_succes'] == 0.0
+    assert reouvert.taille_octets == 8 * 4  # float32
+
+
+def test_cache_evicts_least_recently_used(backend, tmp_path):
+    # 10 vecteurs de 32 octets au plus
+    cache = CachedEmbeddings(backend, 'modele', cache_path=tmp_path / 'cache.db', max_mb=320 / 1024 / 1024)
+    cache.embed_documents([f"t{i}" for i in range(10)])
+    cache.embed_query('t0')  # t0 redevient le plus récent
+
+    cache.embed_documents(['nouveau'])
+
+    assert cache.taille_octets <= 320
+    cache.reset_statistiques()
+    cache.embed_query('t0')
+    cache.embed_query('t1')
+    assert cache.statistiques()['hits'] == 1
+
+
+def test_hashing_embeddings_are_stable_and_normalized():
+    backend = HashingEmbeddings(dimension=256, workers=1)
+    textes = ["Apprentissage profond pour la vision", "apprentissage profond et vision", "Droit des contrats", ""]
+
+    matrice = backend.embed_matrix(textes)
+
+    assert matrice.shape == (4, 256) and matrice.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrice[:3], axis=1), 1.0)
+    assert not matrice[3].any()
+    assert matrice[0] @ matrice[1] > matrice[0] @ matrice[2]
+    assert backend.embed_query(textes[0]) == pytest.approx(matrice[0].tolist())
+
+
+def test_hashing_embeddings_pool_matches_single_process():
+    textes = [f"document {i} sur le sujet {i % 7}" for i in range(50)]
+    parallele = HashingEmbeddings(dimension=64, workers=3, lot_min=10)
+    try:
+        assert np.array_equal(parallele.embed_matrix(textes), HashingEmbeddings(dimension=64, workers=1).embed_matrix(textes))
+    finally:
+        parallele.close()
+
+
+def test_backend_factory():
+    assert isinstance(creer_embeddings('hashing'), HashingEmbeddings)
+    with pytest.raises(ValueError):
+        creer_embeddings('inconnu')
+
+
+def test_backend_must_implement_embed_documents():
+    class Incomplet(EmbeddingBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplet()
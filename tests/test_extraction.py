@@ -0,0 +1,80 @@
+"""
+Tests de l'extraction parallèle du texte des PDFs
+"""
+
+import os
+import time
+import multiprocessing
+import pytest
+from fake_hal import make_pdf
+from src.rag import extraction
+from src.rag.extraction import PageTextStore, iter_pages, iter_pages_cache
+
+
+def test_iter_pages_extracts_all_files_and_skips_corrupt_ones(tmp_path):
+    chemins = []
+    for i in range(6):
+        chemin = tmp_path / f"{i}.pdf"
+        chemin.write_bytes(make_pdf([f"Document {i} page {p}" for p in range(3)]))
+        chemins.append(str(chemin))
+    corrompu = tmp_path / 'corrompu.pdf'
+    corrompu.write_bytes(b'%PDF-1.4 pas vraiment un PDF')
+    chemins.insert(2, str(corrompu))
+
+    pages = list(iter_pages(chemins, max_workers=2))
+
+    assert len(pages) == 18
+    assert {metadata['source'] for _, metadata in pages} == set(chemins) - {str(corrompu)}
+    texte, metadata = next(p for p in pages if p[1] == {'source': chemins[0], 'page': 1})
+    assert 'Document 0 page 1' in texte
+
+
+def test_iter_pages_is_lazy(tmp_path):
+    chemin = tmp_path / 'a.pdf'
+    chemin.write_bytes(make_pdf(['Une page']))
+
+    pages = iter_pages([str(chemin)] * 50, max_workers=2)
+
+    assert next(pages)[0].strip() == 'Une page'
+    pages.close()
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="le bouchon doit être hérité")
+def test_iter_pages_survives_crashed_and_hung_workers(tmp_path, monkeypatch):
+    extraire = extraction.extraire_pages
+
+    def bouchon(chemin):
+        if 'plante' in chemin:
+            os._exit(1)
+        if 'bloque' in chemin:
+            time.sleep(60)
+        return extraire(chemin)
+
+    monkeypatch.setattr(extraction, 'extraire_pages', bouchon)
+    chemins = []
+    for nom in ('a', 'plante', 'b', 'bloque', 'c'):
+        chemin = tmp_path / f"{nom}.pdf"
+        chemin.write_bytes(make_pdf([f"Document {nom}"]))
+        chemins.append(str(chemin))
+
+    debut = time.monotonic()
+    pages = list(iter_pages(chemins, max_workers=2, timeout=1))
+
+    assert sorted(texte.strip() for texte, _ in pages) == ['Document a', 'Document b', 'Document c']
+    assert time.monotonic() - debut < 10
+
+
+def test_iter_pages_cache_reads_store_and_saves_new_texts(tmp_path):
+    store = PageTextStore(tmp_path / 'textes')
+    connu, nouveau = tmp_path / 'connu.pdf', tmp_path / 'nouveau.pdf'
+    connu.write_bytes(make_pdf(['Texte du PDF']))
+    nouveau.write_bytes(make_pdf(['Page 0', 'Page 1']))
+    store.ecrire('aa11', ['Texte du magasin'])
+
+    pages = list(iter_pages_cache({str(connu): 'aa11', str(nouveau): 'bb22'}, store, max_workers=1))
+
+    assert pages[0] == ('Texte du magasin', {'source': str(connu), 'page': 0})
+    assert [texte.strip() for texte, _ in pages[1:]] == ['Page 0', 'Page 1']
+    assert [texte.strip() for texte in store.lire('bb22')] == ['Page 0', 'Page 1']
+    assert (tmp_path / 'textes' / 'bb' / 'bb22.json.gz').exists()
+    assert store.lire('cc33') is None
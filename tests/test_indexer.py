@@ -0,0 +1,143 @@
+"""
+Tests de l'indexation incrémentale
+"""
+
+import os
+import pytest
+from fake_hal import make_pdf
+from src.rag.extraction import PageTextStore
+from src.rag.indexer import IncrementalIndexer
+from src.utils.fichiers import hash_fichier
+
+
+class MemoryStore:
+    """Magasin de vecteurs minimal : l'API add_texts/delete des VectorStore LangChain"""
+
+    def __init__(self):
+        self.chunks = {}
+
+    def add_texts(self, textes, metadatas=None, ids=None):
+        self.chunks.update(zip(ids, zip(textes, metadatas)))
+
+    def delete(self, ids=None):
+        for chunk_id in ids:
+            del self.chunks[chunk_id]
+
+
+def decouper(pages):
+    """Un chunk par ligne de texte"""
+    return [(ligne, metadata) for texte, metadata in pages for ligne in texte.splitlines() if ligne]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    dossier = tmp_path / 'downloads'
+    dossier.mkdir()
+    for nom in ('a', 'b', 'c'):
+        (dossier / f"{nom}.pdf").write_bytes(make_pdf([f"{nom} page {p}" for p in range(2)]))
+    return dossier
+
+
+def chemins(dossier):
+    return sorted(str(p) for p in dossier.glob('*.pdf'))
+
+
+def test_first_run_indexes_everything(corpus, tmp_path):
+    indexer = IncrementalIndexer(tmp_path / 'index' / 'manifest.json')
+    store = MemoryStore()
+
+    plan = indexer.planifier(chemins(corpus))
+    stats = indexer.appliquer(plan, store, decouper)
+
+    assert len(plan['nouveaux']) == 3 and stats['chunks_ajoutes'] == 6
+    assert len(store.chunks) == 6
+    assert (tmp_path / 'index' / 'manifest.json').exists()
+
+
+def test_only_delta_is_reindexed(corpus, tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    store = MemoryStore()
+    indexer = IncrementalIndexer(manifest)
+    indexer.appliquer(indexer.planifier(chemins(corpus)), store, decouper)
+    ids_a = set(indexer.manifest[str(corpus / 'a.pdf')]['ids'])
+
+    (corpus / 'b.pdf').write_bytes(make_pdf(['b modifié']))
+    os.remove(corpus / 'c.pdf')
+    (corpus / 'd.pdf').write_bytes(make_pdf(['d page 0']))
+    os.utime(corpus / 'a.pdf', ns=(1, 1))  # Touché mais contenu identique
+
+    indexer = IncrementalIndexer(manifest)
+    plan = indexer.planifier(chemins(corpus))
+
+    assert IncrementalIndexer.resumer(plan) == "1 nouveaux, 1 modifiés, 1 supprimés, 1 inchangés"
+
+    stats = indexer.appliquer(plan, store, decouper)
+
+    assert stats == {'chunks_ajoutes': 2, 'chunks_supprimes': 4, 'echecs': 0}
+    assert sorted(texte for texte, _ in store.chunks.values()) == [
+        'a page 0', 'a page 1', 'b modifié', 'd page 0'
+    ]
+    assert ids_a <= set(store.chunks)
+    assert IncrementalIndexer.resumer(IncrementalIndexer(manifest).planifier(chemins(corpus))) == (
+        "0 nouveaux, 0 modifiés, 0 supprimés, 3 inchangés"
+    )
+
+
+def test_dry_run_plan_changes_nothing(corpus, tmp_path):
+    indexer = IncrementalIndexer(tmp_path / 'manifest.json')
+
+    plan = indexer.planifier(chemins(corpus))
+
+    assert len(plan['nouveaux']) == 3
+    assert indexer.manifest == {}
+    assert not (tmp_path / 'manifest.json').exists()
+
+
+def test_page_store_avoids_reparsing(corpus, tmp_path):
+    store = PageTextStore(tmp_path / 'textes')
+    hash_a = hash_fichier(str(corpus / 'a.pdf'))
+    store.ecrire(hash_a, ['a depuis le magasin'])
+    indexer = IncrementalIndexer(tmp_path / 'manifest.json', store)
+    vecteurs = MemoryStore()
+
+    indexer.appliquer(indexer.planifier(chemins(corpus)), vecteurs, decouper)
+
+    textes = sorted(texte.strip() for texte, _ in vecteurs.chunks.values())
+    assert textes == ['a depuis le magasin', 'b page 0', 'b page 1', 'c page 0', 'c page 1']
+    assert hash_fichier(str(corpus / 'b.pdf')) in store
+
+    # Un PDF supprimé emporte ses textes
+    os.remove(corpus / 'a.pdf')
+    indexer.appliquer(indexer.planifier(chemins(corpus)), vecteurs, decouper)
+    assert hash_a not in store
+
+
+def test_failed_extraction_is_retried(corpus, tmp_path):
+    (corpus / 'd.pdf').write_bytes(b'%PDF-1.4 illisible')
+    indexer = IncrementalIndexer(tmp_path / 'manifest.json')
+    store = MemoryStore()
+
+    stats = indexer.appliquer(indexer.planifier(chemins(corpus)), store, decouper)
+
+    assert stats['echecs'] == 1 and str(corpus / 'd.pdf') not in indexer.manifest
+    plan = IncrementalIndexer(tmp_path / 'manifest.json').planifier(chemins(corpus))
+    assert list(plan['nouveaux']) == [str(corpus / 'd.pdf')] and len(plan['inchanges']) == 3
+
+
+def test_missing_blob_is_skipped(corpus, tmp_path):
+    from src.database.blob_store import BlobStore
+    blobs = BlobStore(tmp_path / 'magasin')
+    for fichier in chemins(corpus):
+        blobs.ajouter(os.path.basename(fichier)[:-4], fichier, hash_fichier(fichier), os.path.getsize(fichier))
+    indexer = IncrementalIndexer(tmp_path / 'manifest.json')
+    store = MemoryStore()
+    fichiers = blobs.fichiers()
+    indexer.appliquer(indexer.planifier(list(fichiers), hashes=fichiers), store, decouper)
+
+    perdu = blobs.chemin(blobs.documents()['b'])
+    os.remove(perdu)
+    plan = indexer.planifier(list(fichiers), hashes=fichiers)
+    stats = indexer.appliquer(plan, store, decouper)
+
+    assert list(plan['supprimes']) == [perdu] and len(plan['inchanges']) == 2
+    assert stats['chunks_supprimes'] == 2 and len(store.chunks) == 4
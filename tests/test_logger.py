@@ -0,0 +1,61 @@
+"""
+Tests de la configuration du logging
+"""
+
+import sys
+import json
+import logging
+import queue
+from src.utils.logger import JsonFormatter, NonBlockingQueueHandler, RateLimitFilter, setup_logging
+
+
+def make_record(message, niveau=logging.INFO, ligne=10, args=None, exc_info=None):
+    return logging.LogRecord('test', niveau, 'module.py', ligne, message, args, exc_info)
+
+
+def test_setup_is_idempotent():
+    setup_logging()
+    handlers = list(logging.getLogger().handlers)
+    for _ in range(5):
+        logger = setup_logging('src.hal.downloader')
+    assert logging.getLogger().handlers == handlers and logger.name == 'src.hal.downloader'
+    assert sum(isinstance(handler, NonBlockingQueueHandler) for handler in handlers) == 1
+
+
+def test_rate_limit_per_call_site():
+    filtre = RateLimitFilter(par_seconde=3)
+    passes = [filtre.filter(make_record(f"document {i}")) for i in range(10)]
+    assert passes == [True] * 3 + [False] * 7
+
+    # Autre ligne de code, avertissements et erreurs : non limités
+    assert filtre.filter(make_record("autre", ligne=20))
+    assert all(filtre.filter(make_record("erreur", logging.ERROR)) for _ in range(10))
+
+    # Le prochain message qui passe signale ceux qui ont été écartés
+    filtre._seaux[('module.py', 10)][0] = 1
+    record = make_record("document 10")
+    assert filtre.filter(record) and record.ignores == 7
+
+
+def test_queue_handler_never_blocks_and_formats_json():
+    file = queue.Queue(maxsize=2)
+    handler = NonBlockingQueueHandler(file)
+    try:
+        raise ValueError("PDF invalide")
+    except ValueError:
+        handler.handle(make_record("échec de %s", logging.ERROR, args=('42.pdf',), exc_info=sys.exc_info()))
+    for i in range(3):
+        handler.handle(make_record(f"message {i}"))
+
+    assert file.qsize() == 2 and handler.abandonnes == 2
+    entree = json.loads(JsonFormatter().format(file.get_nowait()))
+    assert entree['niveau'] == 'ERROR' and entree['message'] == 'échec de 42.pdf'
+    assert 'ValueError: PDF invalide' in entree['exception']
+
+
+def test_logs_written_to_configured_directory(logs_temporaires):
+    setup_logging(repertoire=logs_temporaires / 'ignore')  # Déjà configuré : sans effet
+
+    fichiers = sorted(chemin.name for chemin in logs_temporaires.iterdir())
+    assert fichiers[0] == 'erreurs_hal.log' and fichiers[1].startswith('hal_manager_')
+    assert len(fichiers) == 2
@@ -0,0 +1,59 @@
+"""
+Tests des métriques du pipeline
+"""
+
+import pytest
+from src.database.manager import DatabaseManager
+from src.utils.metrics import MetricsRegistry, CHRONO_INACTIF, metrics
+
+
+def test_counters_and_histograms():
+    registre = MetricsRegistry(actif=True)
+    octets = registre.compteur('octets_total', "Octets")
+    duree = registre.histogramme('duree_secondes', "Durée", bornes=(0.1, 1, 10))
+    assert registre.compteur('octets_total') is octets
+    with pytest.raises(ValueError):
+        registre.histogramme('octets_total')
+
+    octets.incrementer(100)
+    octets.incrementer()
+    for valeur in [0.05] * 50 + [0.5] * 49 + [5]:
+        duree.observer(valeur)
+    with duree.mesurer():
+        pass
+
+    assert octets.valeur == 101
+    assert (duree.nombre, duree.comptes) == (101, [51, 49, 1, 0])
+    assert 0.09 < duree.quantile(0.5) < 0.2 and 1 < duree.quantile(0.999) <= 10
+
+    json = registre.en_json()
+    assert json['octets_total'] == {'type': 'counter', 'aide': "Octets", 'valeur': 101}
+    assert json['duree_secondes']['intervalles'] == {'0.1': 51, '1': 49, '10': 1, '+Inf': 0}
+    prometheus = registre.en_prometheus().splitlines()
+    assert '# TYPE duree_secondes histogram' in prometheus
+    assert 'duree_secondes_bucket{le="1.0"} 100' in prometheus and 'duree_secondes_count 101' in prometheus
+    assert 'octets_total 101' in prometheus
+    assert [ligne.split(' :')[0] for ligne in registre.resume()] == ["Durée", "Octets"]
+
+
+def test_disabled_registry_records_nothing():
+    registre = MetricsRegistry(actif=False)
+    compteur, histogramme = registre.compteur('a_total'), registre.histogramme('b_secondes')
+    compteur.incrementer(5)
+    histogramme.observer(1)
+    assert histogramme.mesurer() is CHRONO_INACTIF
+    with histogramme.mesurer():
+        pass
+    assert compteur.valeur == 0 and histogramme.nombre == 0 and registre.resume() == []
+
+
+def test_pipeline_stages_are_instrumented(tmp_path):
+    ecrits = metrics.compteur('sqlite_documents_ecrits_total').valeur
+    recherches = metrics.histogramme('sqlite_recherche_secondes').nombre
+    db = DatabaseManager(tmp_path / 'hal.db')
+    db.ajouter_documents([{'doc_id': str(i), 'titre': f"Titre {i}"} for i in range(3)])
+    db.rechercher_documents({'titre': 'Titre'})
+    db.close()
+
+    assert metrics.compteur('sqlite_documents_ecrits_total').valeur == ecrits + 3
+    assert metrics.histogramme('sqlite_recherche_secondes').nombre == recherches + 1
@@ -0,0 +1,85 @@
+"""
+Tests de la quantification des vecteurs
+"""
+
+import numpy as np
+import pytest
+from src.rag import vector_store
+from src.rag.ann import recherche_exacte, top_k
+from src.rag.quantization import Quantizer, ScalarQuantizer, ProductQuantizer, creer_quantizer
+
+
+def make_vectors(nombre, dimension=64, graine=0):
+    aleatoire = np.random.default_rng(graine)
+    centres = aleatoire.normal(size=(30, dimension))
+    vecteurs = centres[aleatoire.integers(30, size=nombre)] + 0.5 * aleatoire.normal(size=(nombre, dimension))
+    return (vecteurs / np.linalg.norm(vecteurs, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def matrice():
+    return make_vectors(3000)
+
+
+@pytest.mark.parametrize('classe, compression, rappel_min', [(ScalarQuantizer, 4, 0.95), (ProductQuantizer, 32, 0.6)])
+def test_quantized_scores_find_exact_neighbours(classe, compression, rappel_min, matrice, tmp_path):
+    quantizer = classe(tmp_path)
+    quantizer.entrainer(matrice)
+    codes = quantizer.codes()
+
+    assert codes.shape == (3000, 64 * 4 // compression) and codes.dtype == np.uint8
+    trouves = 0
+    for requete in make_vectors(30, graine=1):
+        exacts, _ = recherche_exacte(matrice, requete, 10)
+        approches, _ = top_k(quantizer.scores(codes, requete), 40)  # Présélection de k × 4
+        trouves += len(set(exacts) & set(approches))
+    assert trouves / 300 >= rappel_min
+
+
+def test_quantizer_persists_and_encodes_new_rows(matrice, tmp_path):
+    ScalarQuantizer(tmp_path).entrainer(matrice[:2000])
+
+    reouvert = ScalarQuantizer(tmp_path)
+    reouvert.synchroniser(matrice)
+
+    assert len(reouvert.codes()) == 3000
+    assert np.array_equal(reouvert.codes()[2500], reouvert._encoder(matrice[2500:2501])[0])
+    with pytest.raises(ValueError):
+        creer_quantizer('inconnue', tmp_path)
+
+
+def test_store_reranks_quantized_candidates(monkeypatch, matrice, tmp_path):
+    monkeypatch.setattr(vector_store, 'QUANTIZATION_MIN_VECTORS', 1000)
+
+    class Embeddings:
+        def embed_documents(self, texts):
+            return matrice[[int(texte) for texte in texts]]
+
+    store = vector_store.NumpyVectorStore(tmp_path, Embeddings(), quantization="pq")
+    textes = [str(i) for i in range(3000)]
+    store.add_texts(textes, ids=textes)
+    store.delete(ids=['42'])
+    store.compacter()
+
+    assert store.quantizer.entraine and len(store.quantizer.codes()) == 2999
+    resultats = store.similarity_search_by_vector_with_score(matrice[1234], k=5)
+    assert resultats[0][0] == '1234' and resultats[0][2] == pytest.approx(1.0)
+    assert all(texte != '42' for texte, _, _ in store.similarity_search_by_vector_with_score(matrice[42], k=5))
+
+
+def test_incomplete_quantizer_cannot_be_instantiated(tmp_path):
+    class SansScore(Quantizer):
+        nom = 'incomplet'
+        taille_code = 4
+
+        def _apprendre(self, echantillon):
+            return {}
+
+        def _encoder(self, vecteurs):
+            return np.zeros((len(vecteurs), 4), dtype=np.uint8)
+
+        def _preparer(self, requete):
+            return requete
+
+    with pytest.raises(TypeError, match='_scorer'):
+        SansScore(tmp_path)
@@ -0,0 +1,105 @@
+"""
+Tests du service HTTP de questions-réponses
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import pytest
+import requests
+from src.rag.context import ContextPacker, estimer_tokens
+from src.rag.embeddings import HashingEmbeddings
+from src.rag.service import QueryService, ServiceSature
+from src.rag.vector_store import NumpyVectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    embeddings = HashingEmbeddings(dimension=128, workers=1)
+    store = NumpyVectorStore(tmp_path, embeddings)
+    textes = [f"Le document {i} traite du sujet {i % 10}" for i in range(100)]
+    store.add_texts(textes, metadatas=[{'source': f"{i}.pdf"} for i in range(100)])
+    return store
+
+
+def generer_bouchon(question, chunks):
+    time.sleep(0.01)
+    return f"Réponse à {question} avec {len(chunks)} extraits"
+
+
+def make_service(store, generer=generer_bouchon, **options):
+    return QueryService(store, store.embedding, generer, **options)
+
+
+def test_concurrent_questions_are_micro_batched(store):
+    service = make_service(store, fenetre_ms=50)
+    questions = [f"sujet {i}" for i in range(20)]
+    try:
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            reponses = list(pool.map(service.repondre, questions))
+    finally:
+        service.close()
+
+    assert service.batcher.questions == 20 and service.batcher.lots < 20
+    for question, reponse in zip(questions, reponses):
+        attendu = store.rechercher_lot([store.embedding.embed_query(question)], k=5, fetch_k=20, lambda_mult=0.7)[0]
+        assert reponse == {'réponse': f"Réponse à {question} avec 5 extraits",
+                           'sources': [metadata for _, metadata in attendu]}
+
+
+def test_context_is_packed_before_generation(store):
+    recus = []
+    service = make_service(store, lambda question, chunks: recus.append(chunks) or 'ok',
+                           contexte=ContextPacker(budget=20, compter=estimer_tokens))
+    try:
+        reponse = service.repondre("sujet 4")
+    finally:
+        service.close()
+
+    # Budget de 20 tokens : 2 extraits de 8 tokens (plus le séparateur) sur 5
+    assert len(recus[0]) == 2 and reponse['sources'] == [metadata for _, metadata in recus[0]]
+    assert reponse['contexte']['tokens_economises'] > 0
+    assert service.statistiques()['contexte']['requetes'] == 1
+
+
+def test_backpressure_and_timeout(store):
+    libere = threading.Event()
+    service = make_service(store, lambda question, chunks: libere.wait(5) and 'ok',
+                           max_en_attente=1, timeout=0.2)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            premiere = pool.submit(service.repondre, "sujet 1")
+            while not service.en_cours:
+                time.sleep(0.01)
+            with pytest.raises(ServiceSature):
+                service.repondre("sujet 2")
+            with pytest.raises(TimeoutError):
+                premiere.result()
+        assert service.en_cours == 0
+    finally:
+        libere.set()
+        service.close()
+
+
+def test_http_endpoints(store):
+    service = make_service(store)
+    httpd = service.serveur(port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        reponse = requests.post(f"{url}/query", json={'question': 'sujet 3'}, timeout=5)
+        assert reponse.status_code == 200 and reponse.json()['réponse'].startswith('Réponse à sujet 3')
+        assert requests.post(f"{url}/query", data=b'pas du json', timeout=5).status_code == 400
+
+        # Même question : servie par le cache des réponses
+        requests.post(f"{url}/query", data=json.dumps({'question': 'sujet 3'}), timeout=5)
+        sante = requests.get(f"{url}/health", timeout=5).json()
+        assert sante['statut'] == 'ok' and sante['cache']['hits_exacts'] == 1
+
+        prometheus = requests.get(f"{url}/metrics", timeout=5).text
+        assert '# TYPE rag_llm_secondes histogram' in prometheus and 'rag_llm_secondes_count ' in prometheus
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        service.close()
@@ -0,0 +1,225 @@
+"""
+Tests de RAGSystem : démarrage à chaud et réponses en flux, sans LLM ni réseau
+"""
+
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+from src.rag.embeddings import HashingEmbeddings
+from src.rag.system import RAGSystem
+from src.rag.vector_store import NumpyVectorStore
+
+RACINE = Path(__file__).parent.parent
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = (
+        "import sys, src.rag.system; "
+        "print([m for m in ('torch', 'transformers', 'langchain', 'chromadb', 'langchain_openai') if m in sys.modules])"
+    )
+    sortie = subprocess.run([sys.executable, '-c', code], cwd=RACINE, capture_output=True, text=True, check=True)
+    assert sortie.stdout.strip() == '[]'
+
+
+def test_dry_run_leaves_flat_folder_untouched(tmp_path, capsys):
+    (tmp_path / '1.pdf').write_bytes(b'%PDF-1.4')
+    rag = RAGSystem(pdf_directory=tmp_path, persist_directory=tmp_path / 'index', embedding_backend='hashing')
+
+    plan = rag.process_documents(dry_run=True)
+
+    assert not any(plan.values()) and (tmp_path / '1.pdf').exists()
+    assert 'synchronisation' in capsys.readouterr().out
+
+
+def test_existing_chroma_index_is_kept(tmp_path):
+    (tmp_path / 'index').mkdir()
+    (tmp_path / 'index' / 'manifest.json').write_text(json.dumps({'a.pdf': {}}))
+
+    rag = RAGSystem(pdf_directory=tmp_path, persist_directory=tmp_path / 'index', vector_store='numpy')
+
+    assert rag.vector_store == 'chroma' and rag.has_index()
+    assert RAGSystem(pdf_directory=tmp_path, persist_directory=tmp_path / 'vide').vector_store == 'numpy'
+
+
+def test_warm_start_opens_persisted_index(tmp_path):
+    rag = RAGSystem(pdf_directory=tmp_path, persist_directory=tmp_path / 'index', embedding_backend='hashing')
+    assert not rag.has_index()
+
+    store = NumpyVectorStore(rag.store_directory, HashingEmbeddings(workers=1))
+    store.add_texts(["Réseaux de neurones pour la vision", "Droit européen des contrats"],
+                    metadatas=[{'source': 'a.pdf'}, {'source': 'b.pdf'}])
+    store.close()
+    (Path(rag.store_directory) / 'manifest.json').write_text(json.dumps({'a.pdf': {}, 'b.pdf': {}}))
+
+    rag = RAGSystem(pdf_directory=tmp_path, persist_directory=tmp_path / 'index', embedding_backend='hashing')
+    rag.warm_start()
+
+    assert rag.has_index() and len(rag.db) == 2
+    vecteur = rag.embeddings.embed_query("vision par réseaux de neurones")
+    assert rag.db.rechercher_lot([vecteur], k=1, search_type="similarity")[0][0][1] == {'source': 'a.pdf'}
+    assert rag._llm is None  # Le LLM n'est créé qu'à la première question
+    assert rag.index_version == 1  # Version persistée par le magasin, pas remise à zéro
+
+    # Un second démarrage ferme le magasin et les embeddings précédents
+    ancien = rag.db
+    rag.warm_start()
+    assert rag.db is not ancien
+    with pytest.raises(Exception):
+        ancien._conn.execute('SELECT 1')
+    assert len(rag.db) == 2
+
+    rag.close()
+    assert rag.db is None and rag.embeddings is None
+
+
+class Morceau:
+    def __init__(self, content):
+        self.content = content
+
+
+class LLMBouchon:
+    """Remplace ChatOpenAI : répond des tokens numérotés, en pause entre chacun"""
+
+    def __init__(self, tokens=5, pause=0.01):
+        self.tokens = tokens
+        self.pause = pause
+        self.prompts = []
+
+    def stream(self, prompt):
+        self.prompts.append(prompt)
+        for i in range(self.tokens):
+            time.sleep(self.pause)
+            yield Morceau(f"mot{i} ")
+
+    async def astream(self, prompt):
+        self.prompts.append(prompt)
+        for i in range(self.tokens):
+            await asyncio.sleep(self.pause)
+            yield Morceau(f"mot{i} ")
+
+
+class RetrieverBouchon:
+    """Renvoie toujours les mêmes documents"""
+
+    def __init__(self, documents, pause=0.01):
+        self.documents = documents
+        self.pause = pause
+
+    def get_relevant_documents(self, question):
+        return self.documents
+
+    async def aget_relevant_documents(self, question):
+        await asyncio.sleep(self.pause)
+        return self.documents
+
+
+def make_rag(tmp_path, tokens=5):
+    """RAGSystem branché sur un LLM et un retriever bouchons"""
+    rag = RAGSystem(pdf_directory=tmp_path, persist_directory=tmp_path / 'index', embedding_backend='hashing')
+    rag.retriever = RetrieverBouchon([
+        SimpleNamespace(page_content="Les réseaux de neurones apprennent des représentations.",
+                        metadata={'source': 'a.pdf', 'doc_id': 'hal-1', 'page': 0}),
+        SimpleNamespace(page_content="Le droit européen des contrats harmonise les règles.",
+                        metadata={'source': 'b.pdf', 'doc_id': 'hal-2', 'page': 3}),
+    ])
+    prompt = SimpleNamespace(format=lambda question, context: f"{context}\n\nQuestion : {question}")
+    rag.qa_chain = SimpleNamespace(combine_documents_chain=SimpleNamespace(
+        document_variable_name='context', llm_chain=SimpleNamespace(prompt=prompt)))
+    rag._llm = LLMBouchon(tokens)
+    return rag
+
+
+def test_stream_query_yields_sources_then_tokens_and_caches(tmp_path):
+    rag = make_rag(tmp_path)
+
+    evenements = list(rag.stream_query("Que sont les réseaux de neurones ?"))
+
+    assert [type_ for type_, _ in evenements] == ['sources', 'contexte'] + ['token'] * 5
+    assert [contenu for type_, contenu in evenements if type_ == 'token'] == [f"mot{i} " for i in range(5)]
+    sources = evenements[0][1]
+    assert {source['doc_id'] for source in sources} == {'hal-1', 'hal-2'}
+    assert "Question : Que sont les réseaux de neurones ?" in rag.llm.prompts[0]
+
+    # Réponse complète en cache : la même question ne rappelle pas le LLM
+    en_cache = rag.answer_cache.obtenir("Que sont les réseaux de neurones ?", rag.index_version)
+    assert en_cache['réponse'] == "mot0 mot1 mot2 mot3 mot4 " and en_cache['sources'] == sources
+    assert list(rag.stream_query("Que sont les réseaux de neurones ?")) == [
+        ('sources', sources), evenements[1], ('token', "mot0 mot1 mot2 mot3 mot4 ")
+    ]
+    assert len(rag.llm.prompts) == 1
+
+
+def test_astream_query_matches_stream_query(tmp_path):
+    async def collecter(rag, question):
+        return [evenement async for evenement in rag.astream_query(question)]
+
+    rag = make_rag(tmp_path)
+    evenements = asyncio.run(collecter(rag, "Droit des contrats ?"))
+
+    assert evenements == list(make_rag(tmp_path / 'sync').stream_query("Droit des contrats ?"))
+    assert rag.answer_cache.obtenir("Droit des contrats ?", rag.index_version)['réponse'] == \
+        "mot0 mot1 mot2 mot3 mot4 "
+    assert asyncio.run(collecter(rag, "Droit des contrats ?"))[1:] == [evenements[1], ('token', "mot0 mot1 mot2 mot3 mot4 ")]
+    assert len(rag.llm.prompts) == 1
+
+
+def test_query_result_has_same_keys_on_cache_hit(tmp_path):
+    rag = make_rag(tmp_path)
+
+    absente = rag.query("Que sont les réseaux de neurones ?")
+    en_cache = rag.query("Que sont les réseaux de neurones ?")
+
+    assert len(rag.llm.prompts) == 1
+    assert set(en_cache) == set(absente) == {'réponse', 'sources', 'contexte'}
+    assert en_cache == absente
+
+
+def test_aquery_does_not_block_event_loop(tmp_path):
+    rag = make_rag(tmp_path, tokens=10)
+    rag.llm.pause = 0.03
+
+    async def scenario():
+        battements = []
+
+        async def horloge():
+            while True:
+                battements.append(time.perf_counter())
+                await asyncio.sleep(0.002)
+
+        tache = asyncio.create_task(horloge())
+        await asyncio.sleep(0)
+        debut = time.perf_counter()
+        reponses = await asyncio.gather(rag.aquery("Question un ?"), rag.aquery("Question deux ?"))
+        duree = time.perf_counter() - debut
+        tache.cancel()
+        return reponses, duree, [b for b in battements if b >= debut]
+
+    reponses, duree, battements = asyncio.run(scenario())
+
+    assert [reponse['réponse'] for reponse in reponses] == ["".join(f"mot{i} " for i in range(10))] * 2
+    assert {source['doc_id'] for source in reponses[0]['sources']} == {'hal-1', 'hal-2'}
+    # L'horloge continue de battre pendant la génération, et les deux questions se recouvrent
+    assert len(battements) >= 10
+    assert duree < 2 * 10 * rag.llm.pause
+
+
+def test_question_is_embedded_once_per_query(tmp_path):
+    class Comptage:
+        appels = 0
+
+        def embed_query(self, texte):
+            Comptage.appels += 1
+            return [1.0, 0.0] if texte.startswith("Première") else [0.0, 1.0]
+
+    rag = make_rag(tmp_path)
+    rag.embeddings = Comptage()
+
+    rag.query("Première question ?")  # Cache vide : vectorisée pour la mise en cache seulement
+    rag.query("Seconde question, assez différente ?")  # Recherche sémantique puis mise en cache
+
+    assert Comptage.appels == 2 and len(rag.llm.prompts) == 2
@@ -0,0 +1,121 @@
+"""
+Tests du magasin de vecteurs en mémoire mappée
+"""
+
+import numpy as np
+import pytest
+from src.rag.embeddings import HashingEmbeddings
+from src.rag.vector_store import NumpyVectorStore
+
+
+class TableEmbeddings:
+    """Embeddings fixés à l'avance : le texte est la clé d'un vecteur"""
+
+    def __init__(self, vecteurs):
+        self.vecteurs = vecteurs
+
+    def embed_documents(self, texts):
+        return [self.vecteurs[texte] for texte in texts]
+
+    def embed_query(self, text):
+        return self.vecteurs[text]
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    return {f"chunk {i}": rng.normal(size=16).tolist() for i in range(200)}
+
+
+@pytest.fixture
+def store(corpus, tmp_path):
+    store = NumpyVectorStore(tmp_path / 'store', TableEmbeddings(corpus))
+    textes = list(corpus)
+    store.add_texts(textes, metadatas=[{'source': texte} for texte in textes], ids=textes)
+    return store
+
+
+def exact(corpus, requete, k, exclus=()):
+    textes = [texte for texte in corpus if texte not in exclus]
+    matrice = np.array([corpus[texte] for texte in textes])
+    matrice /= np.linalg.norm(matrice, axis=1, keepdims=True)
+    scores = matrice @ (np.array(requete) / np.linalg.norm(requete))
+    return [textes[i] for i in np.argsort(-scores)[:k]]
+
+
+def test_top_k_matches_exact_search(store, corpus):
+    resultats = store.similarity_search_by_vector_with_score(corpus['chunk 7'], k=5)
+
+    assert [texte for texte, _, _ in resultats] == exact(corpus, corpus['chunk 7'], 5)
+    assert resultats[0][1] == {'source': 'chunk 7'}
+    assert resultats[0][2] == pytest.approx(1.0)
+
+
+def test_store_persists_deletions_and_replacements(store, corpus, tmp_path):
+    store.delete(ids=['chunk 7', 'chunk 8'])
+    store.add_texts(['chunk 9'], metadatas=[{'version': 2}], ids=['chunk 9'])
+    version = store.version
+    store.close()
+
+    reouvert = NumpyVectorStore(tmp_path / 'store', TableEmbeddings(corpus))
+    resultats = reouvert.similarity_search_by_vector_with_score(corpus['chunk 7'], k=5)
+
+    assert len(reouvert) == 198 and reouvert.version == version
+    assert [texte for texte, _, _ in resultats] == exact(corpus, corpus['chunk 7'], 5, exclus={'chunk 7', 'chunk 8'})
+    assert reouvert.similarity_search_by_vector_with_score(corpus['chunk 9'], k=1)[0][1] == {'version': 2}
+
+
+def test_compaction_keeps_results(store, corpus):
+    store.delete(ids=[f"chunk {i}" for i in range(0, 200, 3)])
+    avant = store.similarity_search_by_vector_with_score(corpus['chunk 10'], k=10)
+
+    assert store.compacter() == 67
+    assert len(store) == 133 and not store._supprimes.any()
+    assert store.similarity_search_by_vector_with_score(corpus['chunk 10'], k=10) == avant
+
+
+def test_mmr_matches_reference_implementation(store, corpus):
+    requete = store._normaliser(corpus['chunk 3'])[0]
+    rangs, _ = store._mmr(requete, k=5, fetch_k=20, lambda_mult=0.7)
+
+    candidats, pertinence = store._top_k(requete, 20)
+    vecteurs = np.asarray(store._vecteurs()[candidats])
+    choisis = [0]
+    while len(choisis) < 5:
+        meilleur = max(
+            (i for i in range(20) if i not in choisis),
+            key=lambda i: 0.7 * pertinence[i] - 0.3 * max(vecteurs[i] @ vecteurs[j] for j in choisis)
+        )
+        choisis.append(meilleur)
+
+    assert list(rangs) == list(candidats[choisis])
+
+
+def test_empty_store_and_large_k(corpus, tmp_path):
+    store = NumpyVectorStore(tmp_path / 'vide', TableEmbeddings(corpus))
+    assert store.similarity_search_by_vector_with_score(corpus['chunk 1'], k=3) == []
+
+    store.add_texts(['chunk 1', 'chunk 2'], ids=['a', 'b'])
+    assert len(store.similarity_search_by_vector_with_score(corpus['chunk 1'], k=10)) == 2
+
+
+def test_batched_search_matches_single_queries(store, corpus):
+    requetes = [corpus['chunk 3'], corpus['chunk 50'], corpus['chunk 120']]
+
+    lots = store.rechercher_lot(requetes, k=4, fetch_k=20, lambda_mult=0.7)
+    similaires = store.rechercher_lot(requetes, k=3, search_type="similarity")
+
+    for requete, lot, similaire in zip(requetes, lots, similaires):
+        rangs, _ = store._mmr(store._normaliser(requete)[0], 4, 20, 0.7)
+        assert lot == store._chunks(rangs)
+        assert [texte for texte, _ in similaire] == exact(corpus, requete, 3)
+
+
+def test_store_refuses_other_embedding_model(tmp_path):
+    store = NumpyVectorStore(tmp_path / 'store', HashingEmbeddings(dimension=32, workers=1))
+    store.add_texts(['Réseaux de neurones'])
+    store.close()
+
+    assert NumpyVectorStore(tmp_path / 'store', HashingEmbeddings(dimension=32, workers=1)).modele == 'hashing-32'
+    with pytest.raises(ValueError, match='hashing-32'):
+        NumpyVectorStore(tmp_path / 'store', HashingEmbeddings(dimension=64, workers=1))